@@ -4,26 +4,264 @@ Advanced Liveness Detection Module
 - Random Head Movement (Left/Right/Up/Down)
 - Multi-Challenge System
 - Texture Analysis
+- LivenessSession: thử thách dạng state machine, feed(frame, ts) từng frame
+  (không chiếm camera, phát lại được từ clip)
 """
 import cv2
 import numpy as np
 import time
 import random
+import sys
+import threading
+import importlib.util
+from collections import namedtuple
 
-try:
-    import mediapipe as mp
-    MEDIAPIPE_AVAILABLE = True
-except ImportError:
-    MEDIAPIPE_AVAILABLE = False
+from instrumentation import timed
+
+# Chỉ kiểm tra đã cài hay chưa; import mediapipe (vài giây) hoãn tới lúc tạo detector
+MEDIAPIPE_AVAILABLE = importlib.util.find_spec("mediapipe") is not None
+if not MEDIAPIPE_AVAILABLE:
     print("⚠️ MediaPipe không có. Cài: pip install mediapipe")
 
 
+# Kết quả 1 lần chạy FaceMesh trên 1 frame
+FrameAnalysis = namedtuple('FrameAnalysis', [
+    'face_found',  # Có khuôn mặt hay không
+    'left_ear', 'right_ear', 'avg_ear',
+    'blink',       # Mắt nhắm ở frame này (avg_ear < EAR_THRESHOLD), chưa phải 1 lần nháy
+    'position',    # Như get_face_position()
+    'face_box',    # (x, y, w, h) pixel bao các landmark - ROI cho texture
+])
+
+NO_FACE = FrameAnalysis(False, 0, 0, 0, False, None, None)
+
+
+# Landmark FaceMesh cần dùng, theo thứ tự hàng trong LandmarkBuffer
+LEFT_EYE = [362, 385, 387, 263, 373, 380]
+RIGHT_EYE = [33, 160, 158, 133, 153, 144]
+NOSE_TIP, FOREHEAD, CHIN, LEFT_CHEEK, RIGHT_CHEEK = 1, 10, 152, 234, 454
+# EAR = (|p1-p5| + |p2-p4|) / (2 |p0-p3|): mỗi mắt lưu theo thứ tự [p1, p2, p0, p5, p4, p3]
+# -> 3 điểm đầu trừ 3 điểm sau (2 view liên tục, không copy) là đủ 3 cặp
+EAR_ORDER = [1, 2, 0, 5, 4, 3]
+LANDMARK_INDICES = ([LEFT_EYE[i] for i in EAR_ORDER] + [RIGHT_EYE[i] for i in EAR_ORDER]
+                    + [NOSE_TIP, FOREHEAD, CHIN, LEFT_CHEEK, RIGHT_CHEEK])
+EYE_ROWS = 12  # 6 điểm mắt trái + 6 điểm mắt phải
+ROW_NOSE, ROW_FOREHEAD, ROW_CHIN, ROW_LEFT_CHEEK, ROW_RIGHT_CHEEK = range(12, 17)
+
+# Nháy mắt theo thời gian: mở -> nhắm (vài frame) -> mở lại trong BLINK_WINDOW frame
+EAR_THRESHOLD = 0.22  # Dưới ngưỡng: mắt nhắm
+EAR_OPEN_THRESHOLD = 0.25  # Trên ngưỡng: mắt mở (khoảng giữa = đang chuyển, bỏ qua)
+BLINK_WINDOW = 16  # Số EAR gần nhất giữ trong ring buffer
+BLINK_MIN_CLOSED = 2  # 1 frame nhắm đơn lẻ là nhiễu, không tính là nháy mắt
+BLINK_MAX_CLOSED = 10  # Nhắm lâu hơn = nhắm mắt, không phải nháy
+
+
+class LandmarkBuffer:
+    """
+    Chép các landmark cần dùng vào 1 mảng float32 cấp phát sẵn (17 x 2, toạ độ chuẩn hoá)
+    rồi tính EAR 2 mắt bằng vài phép toán mảng ghi vào buffer có sẵn;
+    tư thế đầu và box khuôn mặt đọc từ cùng mảng đó
+    """
+
+    def __init__(self, indices=LANDMARK_INDICES):
+        self.indices = list(indices)
+        self.points = np.zeros((len(self.indices), 2), dtype=np.float32)
+        self._flat = self.points.reshape(-1)
+        eyes = self.points[:EYE_ROWS].reshape(2, 6, 2)  # View: [trái, phải]
+        self._ear_a, self._ear_b = eyes[:, :3], eyes[:, 3:]
+        self._diff = np.zeros((2, 3, 2), dtype=np.float32)
+        self._dist = np.zeros((2, 3), dtype=np.float32)
+        self._scale = np.ones(2, dtype=np.float32)
+        self._rows = None
+
+    def fill(self, face_landmarks):
+        landmark = face_landmarks.landmark
+        points = [landmark[i] for i in self.indices]
+        self._flat[0::2] = [p.x for p in points]
+        self._flat[1::2] = [p.y for p in points]
+        self._rows = None
+        return self
+
+    def ears(self, w, h):
+        """Returns: (left_ear, right_ear) - cả 2 mắt, 3 cặp điểm trong cùng 1 phép toán"""
+        self._scale[0], self._scale[1] = w, h
+        diff, dist = self._diff, self._dist
+        np.subtract(self._ear_a, self._ear_b, out=diff)
+        np.multiply(diff, self._scale, out=diff)  # Toạ độ pixel
+        np.multiply(diff, diff, out=diff)
+        np.add(diff[..., 0], diff[..., 1], out=dist)
+        np.sqrt(dist, out=dist)
+        (l1, l2, l0), (r1, r2, r0) = dist.tolist()
+        return (l1 + l2) / (2.0 * max(l0, 1e-6)), (r1 + r2) / (2.0 * max(r0, 1e-6))
+
+    def _points(self):
+        """Các điểm không thuộc mắt dạng list Python (đọc 1 lần mỗi frame)"""
+        if self._rows is None:
+            self._rows = self.points[EYE_ROWS:].tolist()
+        return self._rows
+
+    def position(self):
+        """Vị trí khuôn mặt (toạ độ chuẩn hoá), cùng dạng dict như trước"""
+        nose, forehead, chin, left_cheek, right_cheek = self._points()
+        return {
+            'nose': tuple(nose),
+            'forehead': tuple(forehead),
+            'chin': tuple(chin),
+            'left_cheek': tuple(left_cheek),
+            'right_cheek': tuple(right_cheek),
+            # Normalize bằng kích thước khuôn mặt
+            'face_width': abs(right_cheek[0] - left_cheek[0]),
+            'face_height': abs(chin[1] - forehead[1]),
+        }
+
+    def face_box(self, w, h):
+        """Box pixel (x, y, w, h) bao khuôn mặt: má trái/phải, trán, cằm"""
+        _, forehead, chin, left_cheek, right_cheek = self._points()
+        x0, x1 = sorted((left_cheek[0], right_cheek[0]))
+
+        left = int(min(max(x0 * w, 0), w - 1))
+        top = int(min(max(forehead[1] * h, 0), h - 1))
+        right = int(min(max(x1 * w, left + 1), w))
+        bottom = int(min(max(chin[1] * h, top + 1), h))
+        return left, top, right - left, bottom - top
+
+
+class BlinkDetector:
+    """
+    Ring buffer BLINK_WINDOW giá trị EAR gần nhất; update() trả True đúng 1 lần
+    cho mỗi lần nháy thật: mở -> nhắm BLINK_MIN_CLOSED..BLINK_MAX_CLOSED frame -> mở lại
+    (frame có EAR giữa 2 ngưỡng bị bỏ qua)
+    """
+
+    def __init__(self, window=BLINK_WINDOW, closed_threshold=EAR_THRESHOLD,
+                 open_threshold=EAR_OPEN_THRESHOLD, min_closed=BLINK_MIN_CLOSED,
+                 max_closed=BLINK_MAX_CLOSED):
+        self.values = np.zeros(window, dtype=np.float32)
+        self.window = window
+        self.closed_threshold = closed_threshold
+        self.open_threshold = open_threshold
+        self.min_closed = min_closed
+        self.max_closed = max_closed
+        self.count = 0  # Số giá trị đã ghi (vị trí tiếp theo = count % window)
+        self.blinks = 0
+
+    def reset(self):
+        """Mất khuôn mặt: chuỗi EAR bị đứt"""
+        self.count = 0
+
+    def recent(self):
+        """Các EAR trong buffer theo thứ tự thời gian (cũ -> mới)"""
+        n = min(self.count, self.window)
+        start = self.count % self.window
+        if n < self.window:
+            return self.values[:n]
+        return np.concatenate((self.values[start:], self.values[:start]))
+
+    def update(self, ear):
+        self.values[self.count % self.window] = ear
+        self.count += 1
+        if ear <= self.open_threshold:
+            return False  # Chỉ có thể kết thúc 1 lần nháy ở frame mở mắt
+        if self.count < 2 or self.values[(self.count - 2) % self.window] > self.open_threshold:
+            return False  # Frame trước cũng mở (đa số frame): không cần xét cả cửa sổ
+
+        values = self.recent()
+        # +1 mở, -1 nhắm, bỏ các frame đang chuyển
+        states = np.where(values < self.closed_threshold, -1,
+                          np.where(values > self.open_threshold, 1, 0))
+        states = states[states != 0]
+        opened = np.flatnonzero(states[:-1] == 1)
+        if len(opened) == 0:
+            return False  # Chưa thấy mắt mở trước khi nhắm
+        closed = len(states) - 2 - opened[-1]
+        if self.min_closed <= closed <= self.max_closed:
+            self.blinks += 1
+            return True
+        return False
+
+
+# Texture: vùng mặt thu nhỏ về TEXTURE_SIZE x TEXTURE_SIZE trước khi phân tích
+TEXTURE_SIZE = 128
+TEXTURE_EVERY_N = 3  # Chấm texture mỗi N frame của challenge
+TEXTURE_VARIANCE_MIN = 100
+TEXTURE_HIGH_FREQ_MIN = 1e6  # Theo thang của frame 640x480 như trước
+TEXTURE_REFERENCE_PIXELS = 640 * 480
+
+
+class TextureAnalyzer:
+    """Laplacian variance + năng lượng phổ trên vùng mặt (không cần MediaPipe)"""
+    
+    def __init__(self, size=TEXTURE_SIZE, variance_min=TEXTURE_VARIANCE_MIN,
+                 high_freq_min=TEXTURE_HIGH_FREQ_MIN,
+                 reference_pixels=TEXTURE_REFERENCE_PIXELS):
+        self.size = size
+        self.variance_min = variance_min
+        self.high_freq_min = high_freq_min
+        
+        # Buffer cố định, không cấp phát lại mỗi frame
+        self._bgr = np.empty((size, size, 3), dtype=np.uint8)
+        self._gray = np.empty((size, size), dtype=np.uint8)
+        self._float = np.empty((size, size), dtype=np.float32)
+        self._laplacian = np.empty((size, size), dtype=np.float32)
+        self._magnitude = np.empty((size, size // 2 + 1), dtype=np.float32)
+        
+        # Vùng giữa của phổ fftshift (1/4..3/4 mỗi chiều) trong layout rfft2:
+        # hàng [0, q) và [size - q, size), cột [0, q]; cột 1..q-1 đại diện
+        # cho cả tần số âm (đối xứng Hermite) nên nhân 2
+        q = size // 4
+        weights = np.zeros((size, size // 2 + 1), dtype=np.float32)
+        weights[:q, :q + 1] = 1
+        weights[size - q:, :q + 1] = 1
+        weights[:, 1:q] *= 2
+        # Trung bình trên khối (2q x 2q), quy đổi về thang frame tham chiếu
+        scale = reference_pixels / float(size * size)
+        self._weights = weights * (scale / (4 * q * q))
+    
+    @timed("liveness.texture")
+    def check(self, frame, face_box=None):
+        """
+        face_box: (x, y, w, h) vùng mặt; None -> dùng cả frame
+        Returns: (texture_ok, laplacian_variance, high_freq)
+        """
+        if face_box is not None:
+            x, y, w, h = face_box
+            frame = frame[y:y + h, x:x + w]
+        
+        # Thu nhỏ trước rồi mới đổi sang gray, tất cả vào buffer có sẵn
+        size = self.size
+        cv2.resize(frame, (size, size), dst=self._bgr,
+                   interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self._bgr, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        
+        # Laplacian variance
+        cv2.Laplacian(self._gray, cv2.CV_32F, dst=self._laplacian)
+        _, std = cv2.meanStdDev(self._laplacian)
+        variance = float(std[0, 0]) ** 2
+        
+        # High frequency analysis (FFT cho input thực, chỉ nửa phổ)
+        np.copyto(self._float, self._gray)
+        spectrum = np.fft.rfft2(self._float)
+        np.abs(spectrum, out=self._magnitude)
+        high_freq = float(np.einsum('ij,ij->', self._magnitude,
+                                    self._weights))
+        
+        # Kiểm tra threshold
+        texture_score = 0
+        if variance > self.variance_min:
+            texture_score += 0.5
+        if high_freq > self.high_freq_min:
+            texture_score += 0.5
+        
+        return texture_score >= 0.5, variance, high_freq
+
+
 class AdvancedLivenessDetector:
     """Phát hiện liveness với nhiều phương pháp kết hợp"""
     
     def __init__(self):
         if not MEDIAPIPE_AVAILABLE:
             raise ImportError("MediaPipe không được cài đặt")
+        import mediapipe as mp
         
         self.mp_face_mesh = mp.solutions.face_mesh
         self.face_mesh = self.mp_face_mesh.FaceMesh(
@@ -34,20 +272,26 @@ class AdvancedLivenessDetector:
         )
         
         # Landmark indices
-        self.LEFT_EYE = [362, 385, 387, 263, 373, 380]
-        self.RIGHT_EYE = [33, 160, 158, 133, 153, 144]
-        self.NOSE_TIP = 1
-        self.FOREHEAD = 10
-        self.CHIN = 152
-        self.LEFT_CHEEK = 234
-        self.RIGHT_CHEEK = 454
+        self.LEFT_EYE = LEFT_EYE
+        self.RIGHT_EYE = RIGHT_EYE
+        self.NOSE_TIP = NOSE_TIP
+        self.FOREHEAD = FOREHEAD
+        self.CHIN = CHIN
+        self.LEFT_CHEEK = LEFT_CHEEK
+        self.RIGHT_CHEEK = RIGHT_CHEEK
+        self.landmarks = LandmarkBuffer()  # Cấp phát 1 lần, mỗi frame ghi đè
         
         # Thresholds
-        self.EAR_THRESHOLD = 0.22
+        self.EAR_THRESHOLD = EAR_THRESHOLD
         self.MOVEMENT_THRESHOLD = 0.15  # Tỷ lệ di chuyển so với kích thước khuôn mặt
         
+        # Texture: chỉ phân tích vùng mặt đã thu nhỏ
+        self.texture = TextureAnalyzer()
+        self.TEXTURE_EVERY_N = TEXTURE_EVERY_N
+        
         # State tracking
         self.initial_face_position = None
+        self.blink_detector = BlinkDetector()  # Cho detect_blink()
         
     def calculate_ear(self, eye_landmarks):
         """Tính Eye Aspect Ratio"""
@@ -56,65 +300,55 @@ class AdvancedLivenessDetector:
         h = np.linalg.norm(eye_landmarks[0] - eye_landmarks[3])
         return (v1 + v2) / (2.0 * h)
     
-    def detect_blink(self, frame):
-        """Phát hiện nhấp nháy mắt"""
+    def _process(self, frame):
+        """Chạy FaceMesh 1 lần, trả về landmarks của khuôn mặt đầu tiên hoặc None"""
         rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         results = self.face_mesh.process(rgb_frame)
         
         if not results.multi_face_landmarks:
-            return False, 0, 0
+            return None
+        return results.multi_face_landmarks[0]
+    
+    @timed("liveness.facemesh")
+    def analyze_frame(self, frame):
+        """
+        1 lần FaceMesh cho mỗi frame: EAR, tư thế đầu và ROI texture cùng lúc
+        Returns: FrameAnalysis
+        """
+        face_landmarks = self._process(frame)
+        if face_landmarks is None:
+            return NO_FACE
         
-        face_landmarks = results.multi_face_landmarks[0]
         h, w = frame.shape[:2]
-        
-        # Lấy EAR
-        left_eye = np.array([
-            [face_landmarks.landmark[i].x * w, face_landmarks.landmark[i].y * h]
-            for i in self.LEFT_EYE
-        ])
-        left_ear = self.calculate_ear(left_eye)
-        
-        right_eye = np.array([
-            [face_landmarks.landmark[i].x * w, face_landmarks.landmark[i].y * h]
-            for i in self.RIGHT_EYE
-        ])
-        right_ear = self.calculate_ear(right_eye)
-        
+        landmarks = self.landmarks.fill(face_landmarks)
+        left_ear, right_ear = landmarks.ears(w, h)
         avg_ear = (left_ear + right_ear) / 2.0
-        blink_detected = avg_ear < self.EAR_THRESHOLD
         
-        return blink_detected, left_ear, right_ear
+        return FrameAnalysis(
+            face_found=True,
+            left_ear=left_ear,
+            right_ear=right_ear,
+            avg_ear=avg_ear,
+            blink=avg_ear < self.EAR_THRESHOLD,
+            position=landmarks.position(),
+            face_box=landmarks.face_box(w, h)
+        )
+    
+    def detect_blink(self, frame):
+        """
+        Phát hiện nhấp nháy mắt: True ở frame mắt mở lại sau 1 lần nhắm thật
+        (theo chuỗi EAR của các lần gọi trước, xem BlinkDetector)
+        """
+        analysis = self.analyze_frame(frame)
+        if not analysis.face_found:
+            self.blink_detector.reset()
+            return False, analysis.left_ear, analysis.right_ear
+        blink = self.blink_detector.update(analysis.avg_ear)
+        return blink, analysis.left_ear, analysis.right_ear
     
     def get_face_position(self, frame):
         """Lấy vị trí khuôn mặt (nose tip)"""
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = self.face_mesh.process(rgb_frame)
-        
-        if not results.multi_face_landmarks:
-            return None
-        
-        face_landmarks = results.multi_face_landmarks[0]
-        h, w = frame.shape[:2]
-        
-        nose = face_landmarks.landmark[self.NOSE_TIP]
-        forehead = face_landmarks.landmark[self.FOREHEAD]
-        chin = face_landmarks.landmark[self.CHIN]
-        left_cheek = face_landmarks.landmark[self.LEFT_CHEEK]
-        right_cheek = face_landmarks.landmark[self.RIGHT_CHEEK]
-        
-        # Normalize bằng kích thước khuôn mặt
-        face_width = abs(right_cheek.x - left_cheek.x)
-        face_height = abs(chin.y - forehead.y)
-        
-        return {
-            'nose': (nose.x, nose.y),
-            'forehead': (forehead.x, forehead.y),
-            'chin': (chin.x, chin.y),
-            'left_cheek': (left_cheek.x, left_cheek.y),
-            'right_cheek': (right_cheek.x, right_cheek.y),
-            'face_width': face_width,
-            'face_height': face_height
-        }
+        return self.analyze_frame(frame).position
     
     def check_head_movement(self, current_pos, initial_pos, direction):
         """
@@ -150,29 +384,12 @@ class AdvancedLivenessDetector:
         
         return False, 0
     
-    def detect_texture_quality(self, frame):
-        """Phát hiện texture không tự nhiên (video/ảnh in)"""
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        
-        # Laplacian variance
-        laplacian = cv2.Laplacian(gray, cv2.CV_64F)
-        variance = laplacian.var()
-        
-        # High frequency analysis
-        f = np.fft.fft2(gray)
-        fshift = np.fft.fftshift(f)
-        magnitude = np.abs(fshift)
-        high_freq = np.mean(magnitude[magnitude.shape[0]//4:3*magnitude.shape[0]//4,
-                                     magnitude.shape[1]//4:3*magnitude.shape[1]//4])
-        
-        # Kiểm tra threshold
-        texture_score = 0
-        if variance > 100:
-            texture_score += 0.5
-        if high_freq > 1e6:
-            texture_score += 0.5
-        
-        return texture_score >= 0.5, variance, high_freq
+    def detect_texture_quality(self, frame, face_box=None):
+        """
+        Phát hiện texture không tự nhiên (video/ảnh in)
+        face_box: (x, y, w, h) từ analyze_frame; None -> dùng cả frame
+        """
+        return self.texture.check(frame, face_box)
     
     def close(self):
         """Đóng face mesh"""
@@ -180,155 +397,278 @@ class AdvancedLivenessDetector:
             self.face_mesh.close()
 
 
-def perform_advanced_liveness_challenge(video_capture):
+_shared_detector = None
+_shared_lock = threading.Lock()
+
+
+def get_liveness_detector():
+    """Detector dùng chung giữa các lần challenge (FaceMesh chỉ tạo 1 lần)"""
+    global _shared_detector
+    with _shared_lock:
+        if _shared_detector is None:
+            _shared_detector = AdvancedLivenessDetector()
+        return _shared_detector
+
+
+def close_liveness_detector():
+    """Đóng detector dùng chung (gọi khi thoát chương trình)"""
+    global _shared_detector
+    with _shared_lock:
+        if _shared_detector is not None:
+            _shared_detector.close()
+            _shared_detector = None
+
+
+# Thử thách chủ động (LivenessSession)
+PREPARE_MIN, PREPARE_MAX = 2.0, 4.0  # Giây chờ ngẫu nhiên trước khi ra yêu cầu
+CHALLENGE_TIMEOUT = 5.0  # Giây để hoàn thành yêu cầu
+REQUIRED_FRAMES = 3  # Số frame đạt liên tiếp
+TEXTURE_PASS_RATIO = 0.5  # Tỷ lệ lần chấm texture đạt tối thiểu
+CHALLENGE_TYPES = ['blink', 'head_movement']
+DIRECTIONS = ['left', 'right', 'up', 'down']
+DIRECTION_TEXT = {'left': 'TRAI', 'right': 'PHAI', 'up': 'LEN', 'down': 'XUONG'}
+
+# Trạng thái của LivenessSession
+PREPARING, CHALLENGING, DONE = "preparing", "challenging", "done"
+
+# Kết quả thử thách (tuple 2 phần tử như trước: success, message)
+LivenessResult = namedtuple('LivenessResult', ['passed', 'message'])
+
+
+class LivenessSession:
+    """
+    1 lần thử thách liveness dạng state machine: feed(frame, ts) cho từng frame,
+    trả về None khi chưa xong, LivenessResult khi có kết quả.
+    Không đọc camera, không hiển thị, không chờ: thời gian chỉ lấy từ ts (giây)
+    -> nhiều phiên chạy xen kẽ trong 1 vòng lặp, phát lại được từ clip đã ghi.
+    rng: random.Random(seed) để chọn thử thách tất định (test/benchmark)
+    """
+
+    def __init__(self, detector, challenge_type=None, direction=None, prepare_time=None,
+                 timeout=CHALLENGE_TIMEOUT, required_frames=REQUIRED_FRAMES, rng=random):
+        self.detector = detector
+        self.challenge_type = challenge_type or rng.choice(CHALLENGE_TYPES)
+        self.direction = None
+        if self.challenge_type == 'head_movement':
+            self.direction = direction or rng.choice(DIRECTIONS)
+        self.prepare_time = (rng.uniform(PREPARE_MIN, PREPARE_MAX)
+                             if prepare_time is None else prepare_time)
+        self.timeout = timeout
+        self.required_frames = required_frames
+
+        self.blink = BlinkDetector()  # Chuỗi EAR riêng của phiên
+        self.state = PREPARING
+        self.result = None
+        self.started_at = None
+        self.challenge_started_at = None
+        self.last_ts = None
+        self.frames = 0
+        self.initial_position = None
+        self.success_frames = 0
+        self.debug_value = 0
+        self.texture_passes = 0
+        self.texture_checks = 0
+        self.variance = 0
+        self.face_box = None  # Box FaceMesh gần nhất của người làm thử thách
+        self._challenge_index = 0
+
+    @property
+    def prompt(self):
+        """Yêu cầu hiển thị cho người dùng (ASCII cho cv2.putText)"""
+        if self.challenge_type == 'blink':
+            return "NHAP NHAY MAT!"
+        return f"XOAY DAU {DIRECTION_TEXT[self.direction]}!"
+
+    @property
+    def frames_needed(self):
+        """Nháy mắt: 1 lần nháy thật là đủ (đã gồm nhiều frame); xoay đầu: N frame liên tiếp"""
+        return 1 if self.challenge_type == 'blink' else self.required_frames
+
+    @property
+    def texture_ratio(self):
+        return self.texture_passes / self.texture_checks if self.texture_checks else 0
+
+    def feed(self, frame, ts, analysis=None):
+        """
+        frame: BGR; ts: thời điểm chụp frame (giây, đơn điệu tăng)
+        analysis: FrameAnalysis đã có của frame này (None -> chạy analyze_frame)
+        Returns: None hoặc LivenessResult
+        """
+        if self.state == DONE:
+            return self.result
+        if self.started_at is None:
+            self.started_at = ts
+        self.last_ts = ts
+        self.frames += 1
+
+        if self.state == PREPARING:
+            if ts - self.started_at < self.prepare_time:
+                # Lấy vị trí ban đầu cho head movement
+                if self.challenge_type == 'head_movement' and self.initial_position is None:
+                    analysis = analysis or self.detector.analyze_frame(frame)
+                    self.initial_position = analysis.position
+                return None
+            self.state = CHALLENGING
+            self.challenge_started_at = ts
+
+        if ts - self.challenge_started_at >= self.timeout:
+            return self._finish(False, f"Timeout - {self.challenge_type} challenge failed")
+
+        # 1 lần FaceMesh cho cả blink, tư thế đầu và ROI texture
+        analysis = analysis or self.detector.analyze_frame(frame)
+        if analysis.face_found:
+            self.face_box = analysis.face_box
+
+        # Texture analysis (vùng mặt, mỗi TEXTURE_EVERY_N frame)
+        if self._challenge_index % self.detector.TEXTURE_EVERY_N == 0:
+            texture_ok, self.variance, _ = self.detector.detect_texture_quality(
+                frame, analysis.face_box
+            )
+            self.texture_checks += 1
+            if texture_ok:
+                self.texture_passes += 1
+        self._challenge_index += 1
+
+        # Challenge check
+        challenge_passed = False
+        self.debug_value = 0
+        if self.challenge_type == 'blink':
+            if analysis.face_found:
+                challenge_passed = self.blink.update(analysis.avg_ear)
+            else:
+                self.blink.reset()
+            self.debug_value = analysis.avg_ear
+        elif analysis.position and self.initial_position:
+            challenge_passed, self.debug_value = self.detector.check_head_movement(
+                analysis.position, self.initial_position, self.direction
+            )
+        self.success_frames = self.success_frames + 1 if challenge_passed else 0
+
+        if self.success_frames >= self.frames_needed:
+            if self.texture_ratio < TEXTURE_PASS_RATIO:
+                return self._finish(False, "Texture không tự nhiên")
+            return self._finish(True, f"{self.challenge_type} challenge passed")
+        return None
+
+    def cancel(self, message="Người dùng hủy"):
+        return self._finish(False, message)
+
+    def _finish(self, passed, message):
+        self.state = DONE
+        self.result = LivenessResult(passed, message)
+        return self.result
+
+    def draw(self, frame):
+        """Vẽ trạng thái phiên lên frame hiển thị (gọi sau feed)"""
+        if self.state == PREPARING:
+            cv2.putText(frame, "Chuyen bi...", (50, 100),
+                       cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 255, 255), 3)
+            return
+        if self.success_frames:
+            color = (0, 255, 0)
+            text = f"THANH CONG! ({self.success_frames}/{self.frames_needed})"
+        else:
+            color = (0, 165, 255)
+            text = self.prompt
+        elapsed = (self.last_ts or 0) - (self.challenge_started_at or 0)
+        remaining = max(0, int(self.timeout - elapsed))
+        cv2.putText(frame, text, (50, 100),
+                   cv2.FONT_HERSHEY_SIMPLEX, 1.2, color, 3)
+        cv2.putText(frame, f"Con: {remaining}s", (50, 150),
+                   cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+        cv2.putText(frame, f"Value: {self.debug_value:.3f}", (50, 190),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+        cv2.putText(frame, f"Texture: {self.variance:.0f}", (50, 220),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+
+
+def print_challenge_prompt(session):
+    print("\n" + "="*60)
+    if session.challenge_type == 'blink':
+        print("👁️  YÊU CẦU: NHẤP NHÁY MẮT NGAY BÂY GIỜ!")
+    else:
+        print(f"🔄 YÊU CẦU: XOAY ĐẦU SANG {DIRECTION_TEXT[session.direction]} NGAY!")
+    print("="*60)
+
+
+def print_challenge_result(session):
+    passed, message = session.result
+    if passed:
+        print(f"\n✅ THÀNH CÔNG: Đã hoàn thành thử thách {session.challenge_type}!")
+    elif message == "Texture không tự nhiên":
+        print("\n❌ THẤT BẠI: Texture không tự nhiên (có thể là video/ảnh in)!")
+        print(f"   Texture pass rate: {session.texture_ratio*100:.1f}%")
+    elif message.startswith("Timeout"):
+        print("\n❌ THẤT BẠI: Không hoàn thành thử thách trong thời gian quy định!")
+
+
+def replay_liveness(session, frames):
+    """
+    Phát lại [(frame, ts)] qua 1 phiên (clip đã ghi, test, benchmark)
+    Returns: LivenessResult (hết frame mà chưa xong -> thất bại)
     """
-    Thực hiện thử thách liveness nâng cao
+    for frame, ts in frames:
+        result = session.feed(frame, ts)
+        if result is not None:
+            return result
+    return session.cancel("Hết frame trước khi có kết quả")
+
+
+def perform_advanced_liveness_challenge(video_capture, detector=None):
+    """
+    Thực hiện thử thách liveness nâng cao (chặn tới khi có kết quả)
     - Random challenge: Blink hoặc Head Movement
     - Texture analysis
+    Chạy LivenessSession trên frame đọc từ video_capture, tự hiển thị.
+    Vòng lặp không muốn bị chặn thì tạo LivenessSession và tự gọi feed().
+    detector: mặc định dùng detector chung (không tạo FaceMesh mới mỗi lần)
     Returns: (success, message)
     """
     if not MEDIAPIPE_AVAILABLE:
         return False, "MediaPipe không có"
     
-    try:
-        detector = AdvancedLivenessDetector()
-    except Exception as e:
-        return False, f"Không thể khởi tạo detector: {e}"
+    if detector is None:
+        try:
+            detector = get_liveness_detector()
+        except Exception as e:
+            return False, f"Không thể khởi tạo detector: {e}"
     
     print("\n" + "="*60)
     print("🔐 THÔNG BÁO: Đang chuẩn bị thử thách liveness nâng cao...")
     print("="*60)
     
-    # Random chọn loại challenge
-    challenge_type = random.choice(['blink', 'head_movement'])
-    if challenge_type == 'head_movement':
-        direction = random.choice(['left', 'right', 'up', 'down'])
-    
-    # Chờ ngẫu nhiên 2-4 giây
-    wait_time = random.uniform(2, 4)
-    start_wait = time.time()
-    
-    # Lấy vị trí ban đầu
-    initial_position = None
-    
-    while time.time() - start_wait < wait_time:
+    session = LivenessSession(detector)
+    while True:
         ret, frame = video_capture.read()
         if not ret:
-            detector.close()
             return False, "Không đọc được frame"
         
-        # Lấy vị trí ban đầu cho head movement
-        if challenge_type == 'head_movement' and initial_position is None:
-            initial_position = detector.get_face_position(frame)
+        state = session.state
+        result = session.feed(frame, time.monotonic())
+        if state == PREPARING and session.state != PREPARING:
+            print_challenge_prompt(session)
+        if result is not None:
+            print_challenge_result(session)
+            return result
         
-        cv2.putText(frame, "Chuyen bi...", (50, 100),
-                   cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 255, 255), 3)
+        session.draw(frame)
         cv2.imshow('Face Recognition', frame)
-        
         if cv2.waitKey(1) & 0xFF == ord('q'):
-            detector.close()
-            return False, "Người dùng hủy"
-    
-    # Hiển thị yêu cầu
-    if challenge_type == 'blink':
-        challenge_text = "NHAP NHAY MAT!"
-        print("\n" + "="*60)
-        print("👁️  YÊU CẦU: NHẤP NHÁY MẮT NGAY BÂY GIỜ!")
-        print("="*60)
-    else:
-        direction_text = {
-            'left': 'TRAI',
-            'right': 'PHAI',
-            'up': 'LEN',
-            'down': 'XUONG'
-        }
-        challenge_text = f"XOAY DAU {direction_text[direction]}!"
-        print("\n" + "="*60)
-        print(f"🔄 YÊU CẦU: XOAY ĐẦU SANG {direction_text[direction]} NGAY!")
-        print("="*60)
-    
-    start_challenge = time.time()
-    timeout = 5
-    success_frames = 0
-    required_frames = 3  # Cần 3 frame liên tiếp
-    
-    # Texture check
-    texture_passes = 0
-    texture_checks = 0
-    
-    while time.time() - start_challenge < timeout:
-        ret, frame = video_capture.read()
+            return session.cancel()
+
+
+def read_clip(path, max_frames=None):
+    """[(frame, ts)] với ts lấy từ vị trí trong clip (phát lại tất định)"""
+    capture = cv2.VideoCapture(path)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    frames = []
+    while max_frames is None or len(frames) < max_frames:
+        ret, frame = capture.read()
         if not ret:
-            detector.close()
-            return False, "Không đọc được frame"
-        
-        # Texture analysis
-        texture_ok, variance, high_freq = detector.detect_texture_quality(frame)
-        texture_checks += 1
-        if texture_ok:
-            texture_passes += 1
-        
-        # Challenge check
-        challenge_passed = False
-        debug_value = 0
-        
-        if challenge_type == 'blink':
-            blink_detected, left_ear, right_ear = detector.detect_blink(frame)
-            challenge_passed = blink_detected
-            debug_value = (left_ear + right_ear) / 2
-        else:
-            current_position = detector.get_face_position(frame)
-            if current_position and initial_position:
-                movement_ok, movement_value = detector.check_head_movement(
-                    current_position, initial_position, direction
-                )
-                challenge_passed = movement_ok
-                debug_value = movement_value
-        
-        if challenge_passed:
-            success_frames += 1
-            color = (0, 255, 0)
-            text = f"THANH CONG! ({success_frames}/{required_frames})"
-        else:
-            success_frames = 0
-            color = (0, 165, 255)
-            text = challenge_text
-        
-        # Hiển thị
-        remaining = int(timeout - (time.time() - start_challenge))
-        cv2.putText(frame, text, (50, 100),
-                   cv2.FONT_HERSHEY_SIMPLEX, 1.2, color, 3)
-        cv2.putText(frame, f"Con: {remaining}s", (50, 150),
-                   cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-        cv2.putText(frame, f"Value: {debug_value:.3f}", (50, 190),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-        cv2.putText(frame, f"Texture: {variance:.0f}", (50, 220),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-        
-        cv2.imshow('Face Recognition', frame)
-        
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            detector.close()
-            return False, "Người dùng hủy"
-        
-        # Kiểm tra thành công
-        if success_frames >= required_frames:
-            # Kiểm tra texture
-            texture_ratio = texture_passes / texture_checks if texture_checks > 0 else 0
-            if texture_ratio < 0.5:
-                detector.close()
-                print("\n❌ THẤT BẠI: Texture không tự nhiên (có thể là video/ảnh in)!")
-                print(f"   Texture pass rate: {texture_ratio*100:.1f}%")
-                return False, "Texture không tự nhiên"
-            
-            detector.close()
-            print(f"\n✅ THÀNH CÔNG: Đã hoàn thành thử thách {challenge_type}!")
-            return True, f"{challenge_type} challenge passed"
-    
-    # Timeout
-    detector.close()
-    print(f"\n❌ THẤT BẠI: Không hoàn thành thử thách trong thời gian quy định!")
-    return False, f"Timeout - {challenge_type} challenge failed"
+            break
+        frames.append((frame, len(frames) / fps))
+    capture.release()
+    return frames
 
 
 # Test độc lập
@@ -338,6 +678,25 @@ if __name__ == "__main__":
         print("Chạy: pip install mediapipe")
         exit(1)
     
+    # Phát lại clip đã ghi: python advanced_liveness_module.py clip.mp4 [blink|left|right|up|down] [seed]
+    if len(sys.argv) > 1:
+        challenge = sys.argv[2] if len(sys.argv) > 2 else None
+        rng = random.Random(int(sys.argv[3]) if len(sys.argv) > 3 else 0)
+        detector = AdvancedLivenessDetector()
+        session = LivenessSession(
+            detector,
+            challenge_type=None if challenge is None else
+            ('blink' if challenge == 'blink' else 'head_movement'),
+            direction=None if challenge in (None, 'blink') else challenge,
+            rng=rng
+        )
+        result = replay_liveness(session, read_clip(sys.argv[1]))
+        detector.close()
+        print(f"{'✅ PASS' if result.passed else '❌ FAIL'}: {result.message} "
+              f"({session.prompt}, {session.frames} frame, "
+              f"texture {session.texture_ratio:.0%})")
+        sys.exit(0 if result.passed else 1)
+    
     print("🎯 Test Advanced Liveness Detection")
     print("Nhấn 'q' để thoát\n")
     
@@ -348,5 +707,6 @@ if __name__ == "__main__":
         print(f"\nKết quả: {'✅ PASS' if success else '❌ FAIL'}")
         print(f"Message: {message}")
     finally:
+        close_liveness_detector()
         video.release()
         cv2.destroyAllWindows()
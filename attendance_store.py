@@ -0,0 +1,556 @@
+"""
+Attendance Store - Kiểm tra trùng điểm danh O(1), không quét lại attendance.csv
+- CSV (mặc định): set (name, date) trong RAM, lúc mở chỉ đọc ngược phần cuối
+  file tới hết các dòng của hôm nay
+- AttendanceWriter: hàng đợi có giới hạn + group commit (mỗi N sự kiện hoặc
+  T ms), ghi write-ahead file + fsync trước rồi mới nối vào CSV -> không mất
+  dữ liệu khi crash, nhiều thread nhận diện ghi cùng lúc không bị xen dòng
+- SQLite (tùy chọn): unique index (name, date), INSERT OR IGNORE
+- So khớp đúng cả tên (không còn "An" khớp nhầm "Anh")
+- Nhiều process ghi chung 1 CSV (nhiều kiosk, server nhiều camera + API): mỗi
+  process 1 WAL riêng (mặc định tên chương trình, WAL đang bị process khác khóa
+  -> thêm hậu tố .1, .2...), lúc nối vào CSV kiểm tra trùng (name, date) dưới
+  khóa file. Windows không có fcntl -> dùng backend sqlite
+
+Dùng từ dòng lệnh:
+    python attendance_store.py today   [attendance.csv]
+    python attendance_store.py import  [attendance.csv] [attendance.db]
+"""
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+try:
+    import fcntl  # Khóa file khi nhiều kiosk ghi chung 1 CSV (không có trên Windows)
+except ImportError:
+    fcntl = None
+
+
+ATTENDANCE_FILE = "attendance.csv"
+ATTENDANCE_DB = "attendance.db"
+TAIL_CHUNK = 64 * 1024  # Đọc ngược file theo khối 64KB
+GROUP_COMMIT_EVENTS = 64  # Commit sau N sự kiện...
+GROUP_COMMIT_MS = 50  # ...hoặc sau T ms kể từ sự kiện đầu tiên của batch
+WRITER_QUEUE_SIZE = 10000  # Hàng đợi đầy -> submit() chờ (backpressure)
+WAL_COMMIT_MARKER = "#commit"
+MAX_WRITER_SUFFIX = 64  # Số WAL tối đa thử khi writer_id tự chọn (nhiều process cùng chương trình)
+
+
+def default_writer_id():
+    """Tên chương trình đang chạy: cố định qua các lần chạy để khôi phục đúng WAL
+    (process thứ 2 của cùng chương trình nhận hậu tố, xem AttendanceWriter)"""
+    name = os.path.splitext(os.path.basename(sys.argv[0] or ""))[0]
+    return name if name and name != "-c" else "main"
+
+
+def parse_line(line):
+    """'name,date,time' -> (name, date, time) hoặc None (tên có thể chứa dấu phẩy)"""
+    parts = line.strip().rsplit(',', 2)
+    if len(parts) != 3 or not parts[0]:
+        return None
+    return parts[0], parts[1], parts[2]
+
+
+def read_tail_lines(path, stop_date, chunk_size=TAIL_CHUNK):
+    """
+    Đọc ngược từ cuối file, trả về các dòng có date >= stop_date.
+    File ghi theo thứ tự thời gian nên dừng ở dòng đầu tiên cũ hơn stop_date.
+    """
+    if not os.path.exists(path):
+        return []
+
+    lines = []
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = b''
+        while position > 0:
+            step = min(chunk_size, position)
+            position -= step
+            f.seek(position)
+            chunk = f.read(step) + remainder
+            parts = chunk.split(b'\n')
+            # Dòng đầu khối có thể bị cắt dở -> ghép với khối trước
+            remainder = parts[0] if position > 0 else b''
+            complete = parts[1:] if position > 0 else parts
+            for raw in reversed(complete):
+                row = parse_line(raw.decode('utf-8', errors='replace'))
+                if row is None:
+                    continue
+                if row[1] < stop_date:
+                    return lines[::-1]
+                lines.append(row)
+    return lines[::-1]
+
+
+class _Waiter:
+    """Event + kết quả ghi cho submit(wait=True) / flush()"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.ok = False
+
+    def set(self, ok):
+        self.ok = ok
+        self._event.set()
+
+    def wait(self, timeout=None):
+        return self._event.wait(timeout) and self.ok
+
+
+class AttendanceWriter:
+    """
+    Ghi điểm danh theo group commit, an toàn khi crash:
+    1. Batch được ghi vào <csv>.<writer_id>.wal kèm dòng '#commit N', fsync
+    2. Nối batch vào CSV bằng 1 lần write (có khóa file nếu hệ điều hành hỗ trợ), fsync
+    3. Xóa nội dung WAL
+    Nối CSV lỗi -> WAL được giữ lại, lần commit sau (hoặc lần mở sau) ghi bù.
+    Lúc mở, batch đã commit trong WAL mà chưa có trong CSV được ghi lại.
+    writer_id=None: default_writer_id(), WAL đang bị process khác khóa -> thử
+    <id>.1, <id>.2... (tên ổn định -> lần chạy sau khôi phục được WAL của process
+    đã crash). writer_id chỉ định rõ mà đang bị khóa -> RuntimeError.
+    unique_per_day: bỏ dòng có (name, date) đã nằm trong CSV, kiểm tra dưới khóa
+    file ngay trước khi nối -> 2 process cùng ghi 1 người vẫn chỉ còn 1 dòng.
+    """
+
+    def __init__(self, path=ATTENDANCE_FILE, writer_id=None,
+                 batch_size=GROUP_COMMIT_EVENTS, interval_ms=GROUP_COMMIT_MS,
+                 max_queue=WRITER_QUEUE_SIZE, fsync=True, unique_per_day=False):
+        self.path = path
+        self.batch_size = batch_size
+        self.interval = interval_ms / 1000.0
+        self.fsync = fsync
+        self.unique_per_day = unique_per_day
+        self.duplicates = 0
+
+        self.committed = 0
+        self.batches = 0
+        self.failed = 0
+        self._unflushed = []  # Dòng đã vào WAL nhưng chưa chắc đã vào CSV
+        self._csv_dirty = False  # Lần nối CSV trước bị lỗi (có thể ghi dở)
+        if writer_id is not None:
+            if not self._open_wal(writer_id):
+                raise RuntimeError(f"{self.wal_path} đang được process khác dùng, "
+                                   f"chọn writer_id khác")
+        else:
+            base = default_writer_id()
+            candidates = [base] + [f"{base}.{i}" for i in range(1, MAX_WRITER_SUFFIX)]
+            if not any(self._open_wal(candidate) for candidate in candidates):
+                raise RuntimeError(f"Đã có {MAX_WRITER_SUFFIX} process ghi {path}")
+        self.recovered = self._recover()
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="attendance-writer",
+                                        daemon=True)
+        self._thread.start()
+
+    def _open_wal(self, writer_id):
+        """Mở + khóa độc quyền <csv>.<writer_id>.wal. Returns: False nếu process khác giữ"""
+        self.writer_id = writer_id
+        self.wal_path = f"{self.path}.{writer_id}.wal"
+        self._wal = open(self.wal_path, 'ab')
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._wal.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self._wal.close()
+                return False
+        return True
+
+    # ---------- Producer ----------
+    def submit(self, line, wait=False, timeout=None):
+        """
+        Đưa 1 dòng CSV (đã có ký tự xuống dòng) vào hàng đợi.
+        wait=True: chờ tới khi dòng đã được fsync vào CSV (bền vững qua crash).
+        Returns: True nếu đã vào hàng đợi (và đã ghi thành công khi wait=True)
+        """
+        if self._closed:
+            raise RuntimeError("AttendanceWriter đã đóng")
+        done = _Waiter() if wait else None
+        try:
+            self._queue.put((line, done), timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout) if done is not None else True
+
+    def flush(self, timeout=None):
+        """Chờ mọi dòng đã submit được commit. Returns: False nếu batch cuối ghi lỗi"""
+        done = _Waiter()
+        self._queue.put((None, done), timeout=timeout)
+        return done.wait(timeout)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self._wal.close()
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    # ---------- Writer thread ----------
+    def _run(self):
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            lines = [line for line, _ in batch if line is not None]
+            ok = True
+            if lines or self._unflushed:
+                try:
+                    self._commit(lines)
+                except Exception as e:
+                    # Bắt mọi lỗi: thread writer chết -> flush()/close() chờ mãi
+                    ok = False
+                    self.failed += len(lines)
+                    print(f"❌ Lỗi khi ghi điểm danh: {type(e).__name__}: {e}")
+            for _, done in batch:
+                if done is not None:
+                    done.set(ok)
+
+        if self._unflushed:
+            try:
+                self._commit([])
+            except Exception as e:
+                # Vẫn còn trong WAL -> lần mở sau ghi bù
+                print(f"❌ Lỗi khi ghi điểm danh: {type(e).__name__}: {e}")
+
+    def _commit(self, lines):
+        if lines:
+            # 1. Write-ahead: batch + marker, fsync
+            data = ''.join(lines).encode('utf-8')
+            wal_size = self._wal.tell()
+            try:
+                self._wal.write(data + f"{WAL_COMMIT_MARKER} {len(lines)}\n".encode('utf-8'))
+                self._sync(self._wal)
+            except Exception:
+                # Bỏ batch ghi dở, không để marker của batch sau "nhận" nó
+                self._wal.seek(wal_size)
+                self._wal.truncate()
+                raise
+            self._unflushed.extend(lines)
+
+        # 2. CSV: 1 lần write cho các dòng chưa nối (cả batch lỗi lần trước)
+        try:
+            if self._csv_dirty:
+                self._append_missing(self._unflushed)
+            else:
+                self._append_csv(''.join(self._unflushed).encode('utf-8'))
+        except Exception:
+            self._csv_dirty = True  # Giữ WAL, lần sau ghi bù
+            raise
+        self._csv_dirty = False
+
+        # 3. Mọi dòng trong WAL đã nằm trong CSV -> WAL không cần nữa
+        self._wal.seek(0)
+        self._wal.truncate()
+        self.committed += len(self._unflushed)
+        self.batches += 1
+        self._unflushed = []
+
+    def _sync(self, f):
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+    def _drop_duplicates(self, data):
+        """Gọi khi giữ khóa CSV: bỏ (name, date) đã có trong file hoặc lặp trong batch"""
+        lines = data.decode('utf-8').splitlines(keepends=True)
+        rows = [parse_line(line) for line in lines]
+        dates = [row[1] for row in rows if row is not None]
+        if not dates:
+            return data
+        seen = {(name, date) for name, date, _ in read_tail_lines(self.path, min(dates))}
+        kept = []
+        for line, row in zip(lines, rows):
+            if row is not None:
+                if (row[0], row[1]) in seen:
+                    self.duplicates += 1
+                    continue
+                seen.add((row[0], row[1]))
+            kept.append(line)
+        return ''.join(kept).encode('utf-8')
+
+    def _append_csv(self, data):
+        with open(self.path, 'ab+') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                if self.unique_per_day:
+                    data = self._drop_duplicates(data)
+                    if not data:
+                        return
+                # Dòng cuối bị sửa tay/cắt dở -> xuống dòng trước khi nối tiếp
+                f.seek(0, os.SEEK_END)
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        data = b'\n' + data
+                f.write(data)
+                self._sync(f)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    # ---------- Recovery ----------
+    def _read_wal(self):
+        """Các dòng của những batch đã có marker commit (batch dở dang bị bỏ)"""
+        if not os.path.exists(self.wal_path):
+            return []
+        with open(self.wal_path, 'r', encoding='utf-8', errors='replace') as f:
+            content = f.read()
+        committed, batch = [], []
+        for line in content.splitlines(keepends=True):
+            if line.startswith(WAL_COMMIT_MARKER) and line.endswith('\n'):
+                committed.extend(batch)
+                batch = []
+            elif line.endswith('\n'):
+                batch.append(line)
+        return committed
+
+    def _repair_torn_tail(self):
+        """Crash giữa lúc nối vào CSV -> cắt dòng cuối dở dang (nó vẫn còn trong WAL)"""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        with open(self.path, 'rb+') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) == b'\n':
+                    return
+                size = f.tell()
+                start = max(0, size - TAIL_CHUNK)
+                f.seek(start)
+                tail = f.read()
+                cut = tail.rfind(b'\n')
+                f.truncate(start + cut + 1 if cut >= 0 else start)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _append_missing(self, lines):
+        """Nối các dòng chưa có trong CSV (sau crash / lần nối lỗi). Returns: số dòng nối"""
+        self._repair_torn_tail()
+        rows = [row for row in map(parse_line, lines) if row is not None]
+        oldest = min(date for _, date, _ in rows) if rows else ""
+        existing = set(read_tail_lines(self.path, oldest))
+        missing = [line for line, row in zip(lines, map(parse_line, lines))
+                   if row is not None and row not in existing]
+        if missing:
+            self._append_csv(''.join(missing).encode('utf-8'))
+        return len(missing)
+
+    def _recover(self):
+        lines = self._read_wal()
+        if lines:
+            missing = self._append_missing(lines)
+            if missing:
+                print(f"🔄 Đã khôi phục {missing} dòng điểm danh từ {self.wal_path}")
+        # Mở 'ab' -> vị trí đang ở cuối file cũ; không seek thì lần ghi sau chèn NUL
+        self._wal.seek(0)
+        self._wal.truncate()
+        return len(lines)
+
+
+class CsvAttendanceStore:
+    """
+    attendance.csv giữ nguyên định dạng 'name,date,time', thêm set hôm nay trong RAM.
+    Khi chưa có tên trong set: đọc phần CSV được nối thêm từ lần đọc trước (khóa
+    chia sẻ) để thấy lượt do process khác ghi; writer kiểm tra lại lần nữa dưới
+    khóa ghi ngay trước khi nối
+    """
+
+    def __init__(self, path=ATTENDANCE_FILE, writer_id=None, **writer_options):
+        self.path = path
+        self.date = None
+        self.checked_in = set()
+        self._offset = 0  # Byte của CSV đã đọc vào checked_in
+        self._lock = threading.Lock()
+        # Khôi phục WAL trước khi dựng set hôm nay
+        self.writer = AttendanceWriter(path, writer_id, unique_per_day=True,
+                                       **writer_options)
+        self._load_today(datetime.now().strftime("%Y-%m-%d"))
+
+    def _load_today(self, date_str):
+        self.date = date_str
+        self.checked_in = set()
+        self._offset = 0
+        self._refresh()
+
+    def _refresh(self):
+        """Đọc phần CSV mới (từ _offset) dưới khóa chia sẻ, thêm các tên của hôm nay"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_SH)
+            try:
+                size = f.seek(0, os.SEEK_END)
+                if self._offset == 0 or size < self._offset:
+                    # Lần đầu / file bị thay: chỉ đọc ngược tới hết các dòng hôm nay
+                    self.checked_in |= {name for name, date, _
+                                        in read_tail_lines(self.path, self.date)
+                                        if date == self.date}
+                    self._offset = size
+                    return
+                f.seek(self._offset)
+                chunk = f.read(size - self._offset)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        end = chunk.rfind(b'\n') + 1  # Bỏ dòng cuối chưa trọn
+        self._offset += end
+        for raw in chunk[:end].split(b'\n'):
+            row = parse_line(raw.decode('utf-8', errors='replace'))
+            if row is not None and row[1] == self.date:
+                self.checked_in.add(row[0])
+
+    def has_checked_in(self, name, date_str=None):
+        with self._lock:
+            if date_str is None or date_str == self.date:
+                if name not in self.checked_in:
+                    self._refresh()
+                return name in self.checked_in
+        return any(n == name and d == date_str
+                   for n, d, _ in read_tail_lines(self.path, date_str))
+
+    def check_in(self, name, now=None):
+        """Ghi điểm danh nếu hôm nay chưa có. Returns: True nếu là lần đầu trong ngày"""
+        now = now or datetime.now()
+        date_str = now.strftime("%Y-%m-%d")
+        with self._lock:
+            if date_str != self.date:
+                # Qua ngày mới: set của hôm trước không còn dùng
+                self._load_today(date_str)
+            if name in self.checked_in:
+                return False
+            # Process khác (kiosk/API ghi chung file) có thể đã ghi người này
+            self._refresh()
+            if name in self.checked_in:
+                return False
+            self.checked_in.add(name)
+        # Writer tự gom batch, không giữ khóa khi hàng đợi đầy
+        self.writer.submit(f"{name},{date_str},{now.strftime('%H:%M:%S')}\n")
+        return True
+
+    def flush(self):
+        return self.writer.flush()
+
+    def close(self):
+        self.writer.close()
+
+
+class SqliteAttendanceStore:
+    """Bảng attendance(name, date, time) với unique index (name, date)"""
+
+    def __init__(self, path=ATTENDANCE_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        # Gọi từ thread nhận diện -> khóa riêng thay cho check_same_thread
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS attendance (name TEXT NOT NULL, "
+            "date TEXT NOT NULL, time TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS attendance_name_date "
+            "ON attendance (name, date)"
+        )
+        self._conn.commit()
+
+    def has_checked_in(self, name, date_str=None):
+        date_str = date_str or datetime.now().strftime("%Y-%m-%d")
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM attendance WHERE name = ? AND date = ?", (name, date_str)
+            ).fetchone()
+        return row is not None
+
+    def check_in(self, name, now=None):
+        """Returns: True nếu là lần đầu trong ngày"""
+        now = now or datetime.now()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO attendance (name, date, time) VALUES (?, ?, ?)",
+                (name, now.strftime("%Y-%m-%d"), now.strftime("%H:%M:%S"))
+            )
+            self._conn.commit()
+        return cursor.rowcount == 1
+
+    def import_csv(self, csv_path=ATTENDANCE_FILE):
+        """Nạp lịch sử từ attendance.csv (bỏ qua dòng trùng). Returns: số dòng mới"""
+        with open(csv_path, 'r', encoding='utf-8', errors='replace') as f:
+            rows = [row for row in map(parse_line, f) if row is not None]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO attendance (name, date, time) VALUES (?, ?, ?)", rows
+            )
+            self._conn.commit()
+            return self._conn.total_changes - before
+
+    def flush(self):
+        pass  # Mỗi check_in đã commit
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_attendance_store(backend="csv", path=None, writer_id=None):
+    """
+    backend: 'csv' (attendance.csv) hoặc 'sqlite' (attendance.db)
+    writer_id: tên WAL của process này (chỉ csv), None = tự chọn
+    """
+    if backend == "sqlite":
+        return SqliteAttendanceStore(path or ATTENDANCE_DB)
+    if backend == "csv":
+        return CsvAttendanceStore(path or ATTENDANCE_FILE, writer_id)
+    raise ValueError(f"Backend điểm danh không hợp lệ: {backend}")
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "today"
+
+    if command == "today":
+        store = CsvAttendanceStore(sys.argv[2] if len(sys.argv) > 2 else ATTENDANCE_FILE)
+        print(f"📋 {store.date}: {len(store.checked_in)} người đã điểm danh")
+        for name in sorted(store.checked_in):
+            print(f"   - {name}")
+
+    elif command == "import":
+        csv_path = sys.argv[2] if len(sys.argv) > 2 else ATTENDANCE_FILE
+        store = SqliteAttendanceStore(sys.argv[3] if len(sys.argv) > 3 else ATTENDANCE_DB)
+        print(f"✅ Đã nhập {store.import_csv(csv_path)} dòng vào {store.path}")
+        store.close()
+
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,293 @@
+"""
+Batch Recognize - Nhận diện điểm danh từ video/ảnh đã ghi, không cần webcam/GUI
+- Đầu vào: file video, thư mục ảnh hoặc ảnh lẻ (nhiều đầu vào 1 lần)
+- Haar detection + embed crop + recognize_face như chế độ camera
+- Bỏ qua frame (--every N), theo dõi khuôn mặt bằng IoU tracker:
+  mỗi track chỉ ra 1 kết quả, track đã nhận diện thì không embed lại
+- Nhiều file chạy song song trên nhiều process (--workers)
+- Kết quả ghi ra JSONL hoặc CSV (theo đuôi file --output)
+
+Dùng từ dòng lệnh:
+    python batch_recognize.py lecture1.mp4 lecture2.mp4 -o results.jsonl
+    python batch_recognize.py recordings/ --every 10 --workers 2 -o results.csv
+    python batch_recognize.py photos/ --log-attendance
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+
+from face_crops import extract_face_crops
+from face_tracker import IoUTracker
+
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm', '.m4v')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+DEFAULT_EVERY = 5  # Xử lý 1 frame mỗi N frame video
+MAX_TRACK_ATTEMPTS = 10  # Số lần embed tối đa cho 1 track chưa nhận diện được
+OUTPUT_FIELDS = ['source', 'track', 'name', 'distance', 'first_frame', 'last_frame',
+                 'first_time_s', 'last_time_s', 'box']
+
+# Trạng thái của mỗi worker process (khởi tạo 1 lần bởi _init_worker)
+_worker = {}
+
+
+def expand_inputs(paths):
+    """
+    File video / ảnh giữ nguyên; thư mục -> các video bên trong (mỗi video 1 nguồn)
+    và chính thư mục đó nếu có ảnh (cả thư mục ảnh là 1 nguồn)
+    """
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            entries = sorted(os.listdir(path))
+            sources.extend(os.path.join(path, f) for f in entries
+                           if f.lower().endswith(VIDEO_EXTENSIONS))
+            if any(f.lower().endswith(IMAGE_EXTENSIONS) for f in entries):
+                sources.append(path)
+        elif os.path.exists(path):
+            sources.append(path)
+        else:
+            print(f"⚠️ Không tìm thấy: {path}")
+    return sources
+
+
+def iter_frames(source, every):
+    """
+    Yield (frame_index, time_s, frame, label, new_scene).
+    new_scene=True: khuôn mặt không liên quan frame trước (ảnh khác) -> không nối track
+    """
+    if os.path.isdir(source) or source.lower().endswith(IMAGE_EXTENSIONS):
+        if os.path.isdir(source):
+            images = [os.path.join(source, f) for f in sorted(os.listdir(source))
+                      if f.lower().endswith(IMAGE_EXTENSIONS)]
+        else:
+            images = [source]
+        for index, path in enumerate(images):
+            frame = cv2.imread(path)
+            if frame is None:
+                print(f"⚠️ Không đọc được ảnh: {path}")
+                continue
+            yield index, None, frame, path, True
+        return
+
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        print(f"⚠️ Không mở được video: {source}")
+        return
+    fps = capture.get(cv2.CAP_PROP_FPS) or 0
+    index = 0
+    try:
+        while True:
+            if index % every:
+                # grab() bỏ qua bước decode ra ảnh -> frame bị bỏ qua rẻ hơn
+                if not capture.grab():
+                    break
+            else:
+                ret, frame = capture.read()
+                if not ret:
+                    break
+                yield index, (index / fps if fps > 0 else None), frame, source, False
+            index += 1
+    finally:
+        capture.release()
+
+
+def _init_worker(gallery):
+    """Nạp model + Haar 1 lần cho mỗi process"""
+    from enrollment import load_embedding_model
+    from face_recognition_with_blink import HAAR_CASCADE_PATH
+
+    _worker['gallery'] = gallery
+    _worker['model'] = load_embedding_model()
+    _worker['face_cascade'] = cv2.CascadeClassifier(HAAR_CASCADE_PATH)
+
+
+def track_row(label, track, times):
+    distance = track.distance if track.distance != float('inf') else None
+    return {
+        'source': label,
+        'track': track.track_id,
+        'name': track.name,
+        'distance': round(distance, 4) if distance is not None else None,
+        'first_frame': track.first_frame,
+        'last_frame': track.last_frame,
+        'first_time_s': times.get(track.first_frame),
+        'last_time_s': times.get(track.last_frame),
+        'box': list(track.box),
+    }
+
+
+def process_source(source, every=DEFAULT_EVERY, include_unknown=False):
+    """Chạy nhận diện trên 1 nguồn. Returns: (rows, stats)"""
+    from face_recognition_with_blink import detect_faces, recognize_face
+
+    model = _worker['model']
+    gallery = _worker['gallery']
+    face_cascade = _worker['face_cascade']
+
+    tracker = IoUTracker()
+    rows = []
+    stats = {'source': source, 'frames': 0, 'faces': 0, 'embeds': 0, 'tracks': 0}
+    times = {}
+    label = source
+    start = time.perf_counter()
+
+    def emit(tracks):
+        for track in tracks:
+            stats['tracks'] += 1
+            if track.identified or include_unknown:
+                rows.append(track_row(label, track, times))
+
+    for index, time_s, frame, frame_label, new_scene in iter_frames(source, every):
+        if new_scene:
+            emit(tracker.finish_all())
+        label = frame_label
+        times[index] = round(time_s, 3) if time_s is not None else None
+        stats['frames'] += 1
+
+        boxes = detect_faces(face_cascade, frame)
+        stats['faces'] += len(boxes)
+        matched, finished = tracker.update(boxes, index)
+        emit(finished)
+
+        # Chỉ embed các track chưa nhận diện được, tất cả trong 1 batch
+        pending = [(track, box) for track, box in matched
+                   if not track.identified and track.embeds < MAX_TRACK_ATTEMPTS]
+        if pending:
+            crops = extract_face_crops(frame, [box for _, box in pending])
+            embeddings = model.embed(crops)
+            stats['embeds'] += len(pending)
+            for (track, _), embedding in zip(pending, embeddings):
+                track.update_identity(*recognize_face(embedding, gallery))
+
+    emit(tracker.finish_all())
+    stats['seconds'] = time.perf_counter() - start
+    return rows, stats
+
+
+class ResultWriter:
+    """Ghi kết quả dạng JSONL (mặc định) hoặc CSV theo đuôi file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.is_csv = path.lower().endswith('.csv')
+        self._file = open(path, 'w', encoding='utf-8', newline='' if self.is_csv else None)
+        if self.is_csv:
+            self._csv = csv.DictWriter(self._file, fieldnames=OUTPUT_FIELDS)
+            self._csv.writeheader()
+
+    def write(self, rows):
+        for row in rows:
+            if self.is_csv:
+                self._csv.writerow({**row, 'box': ' '.join(map(str, row['box']))})
+            else:
+                self._file.write(json.dumps(row, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def format_stats(stats):
+    fps = stats['frames'] / stats['seconds'] if stats['seconds'] > 0 else 0
+    return (f"{stats['frames']} frame xử lý ({fps:.1f} fps), {stats['faces']} khuôn mặt, "
+            f"{stats['tracks']} track, {stats['embeds']} lần embed")
+
+
+def run(inputs, output, every=DEFAULT_EVERY, workers=1, include_unknown=False,
+        log_attendance=False):
+    from face_recognition_with_blink import (
+        load_known_faces, build_face_index, INDEX_BACKEND, INDEX_FILE, IVF_N_PROBE,
+        MODEL_KEY
+    )
+
+    sources = expand_inputs(inputs)
+    if not sources:
+        print("❌ Không có video/ảnh nào để xử lý")
+        return 1
+
+    known_embeddings = load_known_faces()
+    if not known_embeddings:
+        print("❌ Không có khuôn mặt nào đã biết")
+        return 1
+    gallery = build_face_index(known_embeddings, backend=INDEX_BACKEND,
+                               index_file=INDEX_FILE, n_probe=IVF_N_PROBE,
+                               model_key=MODEL_KEY)
+
+    writer = ResultWriter(output)
+    names = set()
+    start = time.perf_counter()
+    total_frames = 0
+
+    def handle(source, rows, stats):
+        nonlocal total_frames
+        writer.write(rows)
+        total_frames += stats['frames']
+        found = {row['name'] for row in rows if row['name'] != "Unknown"}
+        names.update(found)
+        print(f"✅ {source}: {format_stats(stats)}, {len(found)} người")
+
+    try:
+        print(f"\n🎬 Xử lý {len(sources)} nguồn (mỗi {every} frame, {workers} process)")
+        if workers <= 1:
+            _init_worker(gallery)
+            for source in sources:
+                handle(source, *process_source(source, every, include_unknown))
+        else:
+            # spawn: fork không an toàn khi process cha đã có thread TF/OpenCV
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(gallery,),
+                                     mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = {pool.submit(process_source, source, every, include_unknown): source
+                           for source in sources}
+                for future in as_completed(futures):
+                    try:
+                        handle(futures[future], *future.result())
+                    except Exception as e:
+                        print(f"❌ Lỗi khi xử lý {futures[future]}: {e}")
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"\n📊 {total_frames} frame trong {elapsed:.1f}s, {len(names)} người: "
+          f"{', '.join(sorted(names))}")
+    print(f"💾 Kết quả: {output}")
+
+    if log_attendance and names:
+        from face_recognition_with_blink import log_attendance as log, close_attendance_store
+        for name in sorted(names):
+            log(name)
+        close_attendance_store()
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Nhận diện điểm danh từ video/ảnh đã ghi (không cần webcam)"
+    )
+    parser.add_argument('inputs', nargs='+', help="File video, ảnh hoặc thư mục")
+    parser.add_argument('-o', '--output', default="batch_results.jsonl",
+                        help="File kết quả .jsonl hoặc .csv")
+    parser.add_argument('--every', type=int, default=DEFAULT_EVERY,
+                        help="Xử lý 1 frame mỗi N frame video")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Số process chạy song song (mỗi process nạp 1 model)")
+    parser.add_argument('--include-unknown', action='store_true',
+                        help="Ghi cả các track không nhận diện được")
+    parser.add_argument('--log-attendance', action='store_true',
+                        help="Ghi điểm danh (hôm nay) cho những người nhận diện được")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    sys.exit(run(args.inputs, args.output, every=max(1, args.every),
+                 workers=args.workers, include_unknown=args.include_unknown,
+                 log_attendance=args.log_attendance))
@@ -0,0 +1,4 @@
+"""
+Benchmarks cho hệ thống điểm danh.
+Chạy từ thư mục gốc: python -m benchmarks.<tên_module>
+"""
@@ -0,0 +1,104 @@
+"""
+Load test cho recognition_api.py (client asyncio, kết nối keep-alive)
+Chạy server trước: python recognition_api.py
+Rồi:  python -m benchmarks.bench_api [ảnh.jpg] [--url http://127.0.0.1:8765]
+- Không có ảnh -> gửi crop giả tới /recognize/crop (đo đường embed + batch)
+- Có ảnh -> gửi cả frame tới /recognize (thêm giải mã + Haar)
+- Báo cáo req/s, p50/p99 theo số client đồng thời và kích thước batch của server
+"""
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+import cv2
+import numpy as np
+
+from benchmarks.common import summarize
+
+
+CONCURRENCY = [1, 4, 16, 64]
+
+
+async def http_request(reader, writer, method, host, path, body=b''):
+    writer.write((f"{method} {path} HTTP/1.1\r\nHost: {host}\r\n"
+                  f"Content-Type: image/jpeg\r\nContent-Length: {len(body)}\r\n\r\n"
+                  ).encode('latin-1') + body)
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    length = 0
+    for line in head.decode('latin-1').split('\r\n')[1:]:
+        if line.lower().startswith('content-length:'):
+            length = int(line.split(':', 1)[1])
+    payload = await reader.readexactly(length)
+    return status, json.loads(payload)
+
+
+async def client(host, port, path, body, n_requests, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(n_requests):
+            start = time.perf_counter()
+            status, _ = await http_request(reader, writer, 'POST', host, path, body)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def get_json(host, port, path):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        return (await http_request(reader, writer, 'GET', host, path))[1]
+    finally:
+        writer.close()
+
+
+async def run(url, body, path, requests_per_level):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    health = await get_json(host, port, '/health')
+    print(f"🌐 {url}{path} | gallery {health['gallery_size']} | body {len(body)} bytes")
+    print(f"{'client':>6} | {'req/s':>8} | {'p50':>9} | {'p99':>9} | {'batch TB':>8} | {'lỗi':>4}")
+    print("-" * 58)
+    for concurrency in CONCURRENCY:
+        before = await get_json(host, port, '/metrics')
+        latencies, errors = [], []
+        per_client = max(1, requests_per_level // concurrency)
+        start = time.perf_counter()
+        await asyncio.gather(*[client(host, port, path, body, per_client, latencies, errors)
+                               for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+        after = await get_json(host, port, '/metrics')
+
+        batches = after['batches'] - before['batches']
+        mean_batch = len(latencies) / batches if batches else 0
+        stats = summarize(latencies)
+        print(f"{concurrency:>6} | {len(latencies) / elapsed:>8.1f} | {stats['p50']:>7.1f}ms | "
+              f"{stats['p99']:>7.1f}ms | {mean_batch:>8.1f} | {len(errors):>4}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test recognition API")
+    parser.add_argument('image', nargs='?', help="Ảnh frame (mặc định: crop giả)")
+    parser.add_argument('--url', default="http://127.0.0.1:8765")
+    parser.add_argument('--requests', type=int, default=256, help="Số request mỗi mức")
+    args = parser.parse_args()
+
+    if args.image:
+        with open(args.image, 'rb') as f:
+            body = f.read()
+        path = '/recognize'
+    else:
+        rng = np.random.default_rng(0)
+        crop = rng.integers(0, 255, (160, 160, 3), dtype=np.uint8)
+        body = cv2.imencode('.jpg', crop)[1].tobytes()
+        path = '/recognize/crop'
+    asyncio.run(run(args.url, body, path, args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Chi phí 1 lần điểm danh theo độ dài lịch sử attendance.csv
+Chạy: python -m benchmarks.bench_attendance
+- Cũ: đọc lại cả file, so khớp chuỗi con cho mỗi lần điểm danh
+- CSV store: set (name, date) trong RAM + ghi nối thêm qua buffer
+- SQLite store: unique index (name, date)
+"""
+import os
+import tempfile
+from datetime import datetime
+
+from attendance_store import CsvAttendanceStore, SqliteAttendanceStore
+from benchmarks.common import time_call, summarize, synthetic_attendance_history
+
+
+HISTORY_SIZES = [10_000, 100_000, 500_000]
+
+
+def legacy_log_attendance(path, name):
+    """log_attendance trước đây (không in ra màn hình)"""
+    now = datetime.now()
+    date_str = now.strftime("%Y-%m-%d")
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if name in line and date_str in line:
+                    return False
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(f"{name},{date_str},{now.strftime('%H:%M:%S')}\n")
+    return True
+
+
+def run(repeat=200):
+    print(f"{'lịch sử':>9} | {'cũ':>9} | {'mở CSV':>9} | {'CSV':>9} | {'SQLite':>9}")
+    print("-" * 58)
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_rows in HISTORY_SIZES:
+            csv_path = os.path.join(tmp, f"attendance_{n_rows}.csv")
+            synthetic_attendance_history(csv_path, n_rows)
+
+            # Mỗi lần gọi là 1 người mới -> luôn đi hết đường kiểm tra + ghi
+            counter = iter(range(10**9))
+            legacy = summarize(time_call(
+                lambda: legacy_log_attendance(csv_path, f"new{next(counter)}"),
+                repeat=min(repeat, 30), warmup=1
+            ))
+
+            opened = summarize(time_call(lambda: CsvAttendanceStore(csv_path).close(),
+                                         repeat=5, warmup=1))
+            store = CsvAttendanceStore(csv_path)
+            csv_stats = summarize(time_call(
+                lambda: store.check_in(f"new{next(counter)}"), repeat=repeat
+            ))
+            store.close()
+
+            db = SqliteAttendanceStore(os.path.join(tmp, f"attendance_{n_rows}.db"))
+            db.import_csv(csv_path)
+            sqlite_stats = summarize(time_call(
+                lambda: db.check_in(f"new{next(counter)}"), repeat=repeat
+            ))
+            db.close()
+
+            print(f"{n_rows:>9,} | {legacy['p50']:>7.2f}ms | {opened['p50']:>7.2f}ms | "
+                  f"{csv_stats['p50']:>7.3f}ms | {sqlite_stats['p50']:>7.3f}ms")
+
+
+if __name__ == "__main__":
+    run()
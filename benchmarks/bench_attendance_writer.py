@@ -0,0 +1,83 @@
+"""
+Throughput và latency enqueue của AttendanceWriter (group commit + WAL + fsync)
+Chạy: python -m benchmarks.bench_attendance_writer [số_sự_kiện]
+- Cũ: mỗi sự kiện mở CSV, ghi 1 dòng, đóng (không fsync)
+- Writer: nhiều thread producer submit() vào hàng đợi, 1 thread commit theo batch
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from attendance_store import AttendanceWriter
+
+
+PRODUCERS = [1, 4, 8]
+BATCH_SIZES = [1, 16, 64, 256]
+
+
+def legacy_append(path, line):
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(line)
+
+
+def run_producers(n_producers, n_events, submit):
+    """Chạy n_producers thread, trả về (giây, latency enqueue ms của mọi sự kiện)"""
+    per_thread = n_events // n_producers
+    latencies = [[] for _ in range(n_producers)]
+
+    def produce(k):
+        record = latencies[k].append
+        for i in range(per_thread):
+            line = f"p{k}_{i},2024-01-01,08:00:00\n"
+            start = time.perf_counter()
+            submit(line)
+            record((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=produce, args=(k,)) for k in range(n_producers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start, np.concatenate([np.asarray(l) for l in latencies])
+
+
+def report(label, n_events, elapsed, latencies):
+    print(f"{label:<28} | {n_events / elapsed:>10,.0f} | "
+          f"{np.percentile(latencies, 50):>8.3f}ms | {np.percentile(latencies, 99):>8.3f}ms")
+
+
+def run(n_events=20000):
+    print(f"{'cấu hình':<28} | {'sự kiện/s':>10} | {'p50 enqueue':>10} | {'p99 enqueue':>10}")
+    print("-" * 70)
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_producers in PRODUCERS:
+            path = os.path.join(tmp, f"legacy_{n_producers}.csv")
+            lock = threading.Lock()  # Không khóa thì các dòng có thể xen nhau
+
+            def submit_legacy(line):
+                with lock:
+                    legacy_append(path, line)
+
+            elapsed, latencies = run_producers(n_producers, n_events, submit_legacy)
+            report(f"cũ, {n_producers} producer", n_events, elapsed, latencies)
+
+            for batch_size in BATCH_SIZES:
+                path = os.path.join(tmp, f"writer_{n_producers}_{batch_size}.csv")
+                writer = AttendanceWriter(path, batch_size=batch_size)
+                start = time.perf_counter()
+                _, latencies = run_producers(n_producers, n_events, writer.submit)
+                writer.flush()  # Throughput tính tới lúc mọi sự kiện đã fsync
+                elapsed = time.perf_counter() - start
+                writer.close()
+                report(f"writer N={batch_size}, {n_producers} producer",
+                       n_events, elapsed, latencies)
+            print()
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,71 @@
+"""
+Latency nhận diện: DeepFace.represent trên cả frame so với embed crop Haar
+Chạy: python -m benchmarks.bench_crop_embedding [ảnh_hoặc_video]
+(mặc định đọc 1 frame từ webcam; cần DeepFace + TensorFlow)
+"""
+import sys
+
+import cv2
+
+from enrollment import get_deepface, load_embedding_model, MODEL_NAME
+from face_crops import extract_face_crops
+from benchmarks.common import time_call, summarize
+
+
+HAAR_CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+
+
+def read_frame(source):
+    if source is None:
+        capture = cv2.VideoCapture(0)
+        ret, frame = capture.read()
+        capture.release()
+    elif source.lower().endswith(('.jpg', '.jpeg', '.png')):
+        frame = cv2.imread(source)
+        ret = frame is not None
+    else:
+        capture = cv2.VideoCapture(source)
+        ret, frame = capture.read()
+        capture.release()
+    if not ret:
+        raise SystemExit(f"❌ Không đọc được frame từ {source or 'webcam'}")
+    return frame
+
+
+def run(source=None, repeat=20):
+    frame = read_frame(source)
+    DeepFace = get_deepface()
+    model = load_embedding_model()
+    face_cascade = cv2.CascadeClassifier(HAAR_CASCADE_PATH)
+
+    def full_frame():
+        DeepFace.represent(img_path=frame, model_name=MODEL_NAME, enforce_detection=False)
+
+    def detect():
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5,
+                                             minSize=(100, 100))
+
+    faces = detect()
+
+    def crop_path(align):
+        def run_once():
+            model.embed(extract_face_crops(frame, faces, align=align))
+        return run_once
+
+    print(f"🖼️  Frame {frame.shape[1]}x{frame.shape[0]}, {len(faces)} khuôn mặt (Haar)")
+    rows = [
+        ("represent(cả frame)", full_frame),
+        ("Haar detect", detect),
+        ("crop (không align)", crop_path(False)),
+        ("crop + align mắt", crop_path(True)),
+    ]
+    print(f"{'đường đi':<22} | {'p50':>9} | {'p99':>9}")
+    print("-" * 46)
+    for label, fn in rows:
+        stats = summarize(time_call(fn, repeat=repeat, warmup=3))
+        print(f"{label:<22} | {stats['p50']:>7.1f}ms | {stats['p99']:>7.1f}ms")
+
+
+if __name__ == "__main__":
+    run(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,123 @@
+"""
+Face detection: Haar full-res mỗi frame (cũ) so với các cấu hình của FaceDetector
+Chạy:
+  python -m benchmarks.bench_detection record <clip.mp4> [số_giây]
+  python -m benchmarks.bench_detection <clip.mp4> [số_frame]
+- record: ghi 1 clip từ webcam để dùng làm dữ liệu đo
+- Mỗi cấu hình: ms/frame (p50/p99/mean) và recall so với Haar full-res mỗi frame
+  (box tham chiếu được coi là tìm thấy nếu có box IoU >= RECALL_IOU)
+- Cấu hình DNN chỉ chạy khi có model trong models/ (xem face_detection.py)
+"""
+import sys
+import time
+
+import cv2
+
+from benchmarks.common import summarize, load_frames
+from face_detection import FaceDetector, dnn_available
+from face_tracker import iou
+
+
+MAX_FRAMES = 150  # Frame nạp sẵn vào RAM (clip 1080p ~6MB/frame)
+RECALL_IOU = 0.5
+RECORD_SECONDS = 10
+
+# (tên, backend, detect_width, every_n, roi)
+SETTINGS = [
+    ("haar full-res", "haar", None, 1, False),
+    ("haar 640", "haar", 640, 1, False),
+    ("haar 480", "haar", 480, 1, False),
+    ("haar 640 every3 hold", "haar", 640, 3, False),
+    ("haar 640 every3 roi", "haar", 640, 3, True),
+    ("haar 640 every5 roi", "haar", 640, 5, True),
+    ("haar full-res every3 roi", "haar", None, 3, True),
+    ("dnn", "dnn", None, 1, False),
+    ("dnn every3 roi", "dnn", None, 3, True),
+]
+
+
+def record_clip(path, seconds=RECORD_SECONDS):
+    capture = cv2.VideoCapture(0)
+    if not capture.isOpened():
+        raise SystemExit("❌ Không mở được webcam")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30
+    ret, frame = capture.read()
+    if not ret:
+        raise SystemExit("❌ Không đọc được frame từ webcam")
+    h, w = frame.shape[:2]
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
+    end = time.time() + seconds
+    frames = 0
+    while ret and time.time() < end:
+        writer.write(frame)
+        frames += 1
+        ret, frame = capture.read()
+    writer.release()
+    capture.release()
+    print(f"💾 Đã ghi {frames} frame ({w}x{h}) vào {path}")
+
+
+def run_setting(frames, backend, detect_width, every_n, roi):
+    """Returns: (timings_ms, boxes theo frame)"""
+    detector = FaceDetector(backend, detect_width=detect_width, every_n=every_n, roi=roi)
+    detector.detect(frames[0])  # warm-up (nạp cascade / net vào cache)
+    detector.reset()
+
+    timings, results = [], []
+    for frame in frames:
+        start = time.perf_counter()
+        boxes = detector.detect(frame)
+        timings.append((time.perf_counter() - start) * 1000)
+        results.append(boxes)
+    return timings, results
+
+
+def recall(reference, results, threshold=RECALL_IOU):
+    """Returns: (recall, số box thừa trung bình mỗi frame)"""
+    total = found = extra = 0
+    for ref_boxes, boxes in zip(reference, results):
+        total += len(ref_boxes)
+        found += sum(1 for ref in ref_boxes
+                     if any(iou(ref, box) >= threshold for box in boxes))
+        extra += sum(1 for box in boxes
+                     if all(iou(ref, box) < threshold for ref in ref_boxes))
+    return (found / total if total else 1.0), extra / max(1, len(reference))
+
+
+def main(path, max_frames=MAX_FRAMES):
+    frames = load_frames(path, max_frames)
+    if not frames:
+        raise SystemExit(f"❌ Không đọc được frame nào từ {path}")
+    h, w = frames[0].shape[:2]
+    print(f"\n⏱️ Face detection trên {len(frames)} frame {w}x{h} ({path})")
+
+    reference = None
+    print(f"   {'cấu hình':<26} {'p50 ms':>8} {'p99 ms':>8} {'mean ms':>8} "
+          f"{'recall':>7} {'thừa/frame':>11}")
+    for name, backend, detect_width, every_n, roi in SETTINGS:
+        if backend == "dnn" and not dnn_available():
+            print(f"   {name:<26} (bỏ qua: thiếu model DNN)")
+            continue
+        timings, results = run_setting(frames, backend, detect_width, every_n, roi)
+        if reference is None:
+            reference = results  # Cấu hình đầu tiên = Haar full-res mỗi frame
+            n_faces = sum(len(boxes) for boxes in reference)
+        stats = summarize(timings)
+        rec, extra = recall(reference, results)
+        print(f"   {name:<26} {stats['p50']:>8.2f} {stats['p99']:>8.2f} "
+              f"{stats['mean']:>8.2f} {rec:>7.1%} {extra:>11.2f}")
+
+    print(f"\n📊 Tham chiếu: {n_faces} khuôn mặt từ Haar full-res "
+          f"(recall tính theo IoU >= {RECALL_IOU})")
+    if n_faces == 0:
+        print("⚠️ Clip không có khuôn mặt nào -> recall không có ý nghĩa")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "record":
+        record_clip(sys.argv[2], float(sys.argv[3]) if len(sys.argv) > 3 else RECORD_SECONDS)
+    elif len(sys.argv) >= 2:
+        main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else MAX_FRAMES)
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,50 @@
+"""
+Benchmark throughput enrollment (ảnh/giây) theo batch size và số worker
+Chạy: python -m benchmarks.bench_enrollment [thư_mục_ảnh]
+(mặc định dùng known_faces/, cần DeepFace + TensorFlow)
+"""
+import os
+import sys
+import time
+
+from enrollment import EnrollmentJob, enroll_images, load_embedding_model
+
+
+BATCH_SIZES = [1, 8, 32, 64]
+WORKER_COUNTS = [1, 2, 4, 8]
+
+
+def collect_jobs(image_dir):
+    jobs = []
+    for filename in sorted(os.listdir(image_dir)):
+        if filename.lower().endswith(('.jpg', '.jpeg', '.png')):
+            filepath = os.path.join(image_dir, filename)
+            jobs.append(EnrollmentJob(filename, filepath, filename, os.path.getmtime(filepath)))
+    return jobs
+
+
+def run(image_dir, batch_sizes=BATCH_SIZES, worker_counts=WORKER_COUNTS, model=None):
+    jobs = collect_jobs(image_dir)
+    if not jobs:
+        print(f"❌ Không có ảnh trong {image_dir}")
+        return
+
+    model = model or load_embedding_model()
+    # Warm-up: build graph TensorFlow trước khi đo
+    enroll_images(jobs[:2], workers=1, batch_size=2, model=model, verbose=False)
+
+    print(f"📷 {len(jobs)} ảnh từ {image_dir}")
+    print(f"{'batch':>6} | {'workers':>7} | {'ảnh/s':>8} | {'tổng':>8}")
+    print("-" * 40)
+    for batch_size in batch_sizes:
+        for workers in worker_counts:
+            start = time.perf_counter()
+            enroll_images(jobs, workers=workers, batch_size=batch_size,
+                          model=model, verbose=False)
+            elapsed = time.perf_counter() - start
+            print(f"{batch_size:>6} | {workers:>7} | {len(jobs) / elapsed:>8.1f} | "
+                  f"{elapsed:>7.2f}s")
+
+
+if __name__ == "__main__":
+    run(sys.argv[1] if len(sys.argv) > 1 else "known_faces")
@@ -0,0 +1,80 @@
+"""
+Benchmark: FaceGallery (ma trận float32) so với vòng lặp recognize_face cũ
+Chạy: python -m benchmarks.bench_gallery
+"""
+import sys
+
+import numpy as np
+
+from face_gallery import FaceGallery
+from benchmarks.common import (
+    time_call, summarize, synthetic_known_embeddings, synthetic_probes
+)
+
+
+THRESHOLD = 8.0  # Giống face_recognition_with_blink.THRESHOLD
+SIZES = [100, 1_000, 10_000, 100_000]
+
+
+def legacy_recognize_face(face_embedding, known_embeddings):
+    """Bản sao vòng lặp recognize_face trước khi có FaceGallery (để so sánh)"""
+    best_match = None
+    min_distance = float('inf')
+
+    name_embeddings = {}
+    for filename, (name, embedding, _) in known_embeddings.items():
+        if name not in name_embeddings:
+            name_embeddings[name] = []
+        name_embeddings[name].append(embedding)
+
+    for name, embeddings_list in name_embeddings.items():
+        for ref_embedding in embeddings_list:
+            distance = np.linalg.norm(
+                np.array(face_embedding) - np.array(ref_embedding)
+            )
+            if distance < min_distance:
+                min_distance = distance
+                best_match = name
+
+    if min_distance < THRESHOLD:
+        return best_match, min_distance
+    else:
+        return "Unknown", min_distance
+
+
+def run(sizes=SIZES, n_probes=20):
+    print(f"{'refs':>8} | {'legacy p50':>11} | {'gallery p50':>11} | {'speedup':>8} | khớp")
+    print("-" * 60)
+    for n_refs in sizes:
+        known = synthetic_known_embeddings(n_refs)
+        probes = synthetic_probes(known, n_probes=n_probes)
+        gallery = FaceGallery.from_embeddings(known)
+
+        # Kiểm tra kết quả giống bit-for-bit
+        identical = all(
+            legacy_recognize_face(p, known) == gallery.match(p, THRESHOLD)
+            for p in probes
+        )
+
+        # Vòng lặp cũ rất chậm với gallery lớn -> giảm số lần lặp
+        repeat = max(2, min(20, 20_000 // n_refs))
+        state = {'i': 0}
+
+        def legacy_once():
+            state['i'] += 1
+            legacy_recognize_face(probes[state['i'] % n_probes], known)
+
+        def gallery_once():
+            state['i'] += 1
+            gallery.match(probes[state['i'] % n_probes], THRESHOLD)
+
+        legacy = summarize(time_call(legacy_once, repeat=repeat, warmup=1))
+        fast = summarize(time_call(gallery_once, repeat=max(repeat, 20)))
+        speedup = legacy['p50'] / fast['p50'] if fast['p50'] > 0 else float('inf')
+        print(f"{n_refs:>8} | {legacy['p50']:>9.3f}ms | {fast['p50']:>9.3f}ms | "
+              f"{speedup:>7.1f}x | {'✅' if identical else '❌'}")
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    run(sizes)
@@ -0,0 +1,74 @@
+"""
+Đánh giá IVFIndex: recall so với brute-force (FaceGallery) và latency theo n_probe
+Chạy: python -m benchmarks.bench_index [số_ảnh ...]
+"""
+import sys
+
+import numpy as np
+
+from face_gallery import FaceGallery
+from face_index import IVFIndex
+from benchmarks.common import (
+    time_call, summarize, synthetic_known_embeddings, synthetic_probes
+)
+
+
+THRESHOLD = 8.0
+SIZES = [10_000, 100_000]
+N_PROBES = [1, 2, 4, 8, 16, 32]
+
+
+def evaluate(index, gallery, probes, n_probe):
+    """
+    recall@1: tỷ lệ probe mà IVF (không fallback) trả về cùng người với brute-force.
+    decision: tỷ lệ quyết định cuối (có exact fallback) giống brute-force.
+    """
+    index.n_probe = n_probe
+    same_name = same_decision = 0
+    for probe in probes:
+        exact_name, exact_distance = gallery.match(probe, float('inf'))
+        row, _ = index.search(probe)
+        if row is not None and index._names[row] == exact_name:
+            same_name += 1
+        if index.match(probe, THRESHOLD)[0] == gallery.match(probe, THRESHOLD)[0]:
+            same_decision += 1
+
+    state = {'i': 0}
+
+    def search_once():
+        state['i'] += 1
+        index.search(probes[state['i'] % len(probes)])
+
+    latency = summarize(time_call(search_once, repeat=100))
+    return same_name / len(probes), same_decision / len(probes), latency
+
+
+def run(sizes=SIZES, n_probes=N_PROBES, n_queries=200):
+    for n_refs in sizes:
+        known = synthetic_known_embeddings(n_refs)
+        # Chỉ dùng probe genuine để đo recall
+        probes = synthetic_probes(known, n_probes=2 * n_queries)[::2]
+        gallery = FaceGallery.from_embeddings(known)
+        index = IVFIndex(min_size=0)
+        index.sync(known)
+
+        state = {'i': 0}
+
+        def exact_once():
+            state['i'] += 1
+            gallery.match(probes[state['i'] % len(probes)], THRESHOLD)
+
+        exact = summarize(time_call(exact_once, repeat=50))
+        print(f"\n📊 {n_refs} ảnh, {len(index.centroids)} danh sách IVF "
+              f"| brute-force p50 {exact['p50']:.3f}ms")
+        print(f"{'n_probe':>8} | {'recall@1':>8} | {'quyết định':>10} | {'p50':>9} | {'p99':>9}")
+        print("-" * 56)
+        for n_probe in n_probes:
+            recall, decision, latency = evaluate(index, gallery, probes, n_probe)
+            print(f"{n_probe:>8} | {recall:>8.3f} | {decision:>10.3f} | "
+                  f"{latency['p50']:>7.3f}ms | {latency['p99']:>7.3f}ms")
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    run(sizes)
@@ -0,0 +1,117 @@
+"""
+Throughput embedding theo số process: InferencePool 1/2/4/8 worker so với
+1 process nhiều thread dùng chung 1 model
+Chạy:
+  python -m benchmarks.bench_inference_pool                 # FakeFacenet tốn CPU, offline
+  python -m benchmarks.bench_inference_pool --cpu-ms 20     # forward giả 20 ms/crop
+  python -m benchmarks.bench_inference_pool --real          # Facenet thật (cần DeepFace)
+- Mỗi yêu cầu = 1 frame 640x480 + FACES_PER_FRAME box, giống 1 lô của 1 camera;
+  frame qua shared memory, worker tự crop rồi embed
+- Gửi bất đồng bộ từ 1 thread, số yêu cầu đang bay giới hạn bởi số slot
+- Chỉ tăng được khi máy đủ core: speedup tối đa ~ min(số worker, số core)
+"""
+import argparse
+import os
+import threading
+import time
+from functools import partial
+
+import numpy as np
+
+from benchmarks.common import FakeFacenet, synthetic_frame_sequence
+from inference_pool import InferencePool, default_model_factory
+
+
+WORKER_COUNTS = [1, 2, 4, 8]
+N_REQUESTS = 200
+FACES_PER_FRAME = 2
+CPU_MS = 10.0  # ms CPU mỗi crop của FakeFacenet (cỡ Facenet trên 1 core)
+
+
+def make_requests(n_requests, faces_per_frame=FACES_PER_FRAME):
+    sequence = synthetic_frame_sequence(min(n_requests, 30))
+    requests = []
+    for i in range(n_requests):
+        frame, (x, y, w, h) = sequence[i % len(sequence)]
+        requests.append((frame, [(x + 10 * k, y, w, h) for k in range(faces_per_frame)]))
+    return requests
+
+
+def run_pool(requests, workers, model_factory):
+    pool = InferencePool(workers=workers, model_factory=model_factory,
+                         liveness_factory=None)
+    with pool:
+        # Warm-up: mỗi worker ít nhất 1 lô
+        for future in [pool.embed(*requests[0]) for _ in range(workers * 2)]:
+            future.result()
+        start = time.perf_counter()
+        futures = [pool.embed(frame, boxes) for frame, boxes in requests]
+        embeddings = [future.result() for future in futures]
+        elapsed = time.perf_counter() - start
+        completed = list(pool.completed)
+    n_crops = sum(len(e) for e in embeddings)
+    return n_crops / elapsed, max(pool.startup_seconds), completed
+
+
+def run_threads(requests, threads, model):
+    """Cách cũ: nhiều thread (camera) gọi chung 1 model trong 1 process"""
+    from face_crops import extract_face_crops
+
+    chunks = [requests[i::threads] for i in range(threads)]
+    counts = [0] * threads
+
+    def work(index):
+        for frame, boxes in chunks[index]:
+            counts[index] += len(model.embed(extract_face_crops(frame, boxes)))
+
+    workers = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+
+def run(worker_counts=WORKER_COUNTS, n_requests=N_REQUESTS, cpu_ms=CPU_MS, real=False):
+    requests = make_requests(n_requests)
+    if real:
+        from enrollment import load_embedding_model
+        model_factory = default_model_factory
+        model = load_embedding_model()
+    else:
+        model_factory = partial(FakeFacenet, cpu_ms=cpu_ms)
+        model = FakeFacenet(cpu_ms=cpu_ms)
+    model.embed([np.zeros((160, 160, 3), np.uint8)])  # Warm-up
+
+    cores = os.cpu_count() or 1
+    print(f"🖥️ {cores} core; {n_requests} frame x {FACES_PER_FRAME} mặt; "
+          f"model: {'Facenet' if real else f'FakeFacenet {cpu_ms:g} ms CPU/crop'}")
+    if cores < max(worker_counts):
+        print(f"⚠️ Máy chỉ có {cores} core: nhiều worker hơn số core không tăng throughput")
+
+    print(f"\n{'process':>8} | {'crop/s':>8} | {'speedup':>7} | {'khởi động':>9} | lô/worker")
+    print("-" * 64)
+    base = None
+    for workers in worker_counts:
+        throughput, startup, completed = run_pool(requests, workers, model_factory)
+        base = base or throughput
+        print(f"{workers:>8} | {throughput:>8.1f} | {throughput / base:>6.2f}x | "
+              f"{startup:>8.2f}s | {completed}")
+
+    print(f"\n{'thread':>8} | {'crop/s':>8} | {'speedup':>7}   (1 process, chung 1 model)")
+    print("-" * 40)
+    for threads in worker_counts:
+        throughput = run_threads(requests, threads, model)
+        print(f"{threads:>8} | {throughput:>8.1f} | {throughput / base:>6.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput InferencePool theo số worker")
+    parser.add_argument('--workers', type=int, nargs='+', default=WORKER_COUNTS)
+    parser.add_argument('--requests', type=int, default=N_REQUESTS)
+    parser.add_argument('--cpu-ms', type=float, default=CPU_MS,
+                        help="ms CPU mỗi crop của FakeFacenet")
+    parser.add_argument('--real', action='store_true', help="Dùng Facenet thật (DeepFace)")
+    args = parser.parse_args()
+    run(args.workers, args.requests, args.cpu_ms, args.real)
@@ -0,0 +1,198 @@
+"""
+FPS vòng lặp liveness: 2 lần FaceMesh/frame (cũ) so với analyze_frame (1 lần)
+Chạy: python -m benchmarks.bench_liveness [video] [số_frame]
+(mặc định đọc từ webcam; cần MediaPipe)
+- Cũ: detect_blink + get_face_position, mỗi hàm tự chạy FaceMesh,
+  texture trên cả frame
+- Mới: analyze_frame trả EAR + tư thế đầu + ROI texture trong 1 lần,
+  texture trên vùng mặt thu nhỏ
+- Kèm chi phí tạo detector mới mỗi lần nhấn SPACE (trước đây)
+- Không cần MediaPipe: trích landmark (list comprehension + 3 lần norm mỗi mắt
+  so với LandmarkBuffer) trên landmark giả, và số lần "nháy mắt" sai của luật
+  1 frame so với BlinkDetector trên chuỗi EAR giả lập có nhiễu
+"""
+import sys
+import time
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+from advanced_liveness_module import (
+    AdvancedLivenessDetector, MEDIAPIPE_AVAILABLE, LandmarkBuffer, BlinkDetector,
+    LEFT_EYE, RIGHT_EYE, NOSE_TIP, FOREHEAD, CHIN, LEFT_CHEEK, RIGHT_CHEEK, EAR_THRESHOLD
+)
+from benchmarks.common import time_call, summarize
+from benchmarks.bench_texture import legacy_texture_quality
+
+
+def read_frames(source, count):
+    capture = cv2.VideoCapture(0 if source is None else source)
+    frames = []
+    while len(frames) < count:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        frames.append(frame)
+    capture.release()
+    if not frames:
+        raise SystemExit(f"❌ Không đọc được frame từ {source or 'webcam'}")
+    return frames
+
+
+def measure_fps(step, frames):
+    """Chạy step trên toàn bộ frame, trả về (fps, ms/frame)"""
+    start = time.perf_counter()
+    for frame in frames:
+        step(frame)
+    elapsed = time.perf_counter() - start
+    return len(frames) / elapsed, elapsed * 1000 / len(frames)
+
+
+N_MESH_POINTS = 478  # FaceMesh với refine_landmarks=True
+EAR_OPEN, EAR_CLOSED, EAR_NOISE = 0.30, 0.12, 0.02
+N_TRACE_FRAMES = 30 * 60 * 10  # 10 phút ở 30 FPS
+BLINKS_PER_MINUTE = 15
+GLITCHES_PER_MINUTE = 30  # Frame đơn lẻ EAR tụt (landmark rung, chớp sáng...)
+
+
+def fake_landmarks(seed=0):
+    """Giống NormalizedLandmarkList: .landmark[i].x / .y / .z"""
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(0.3, 0.7, size=(N_MESH_POINTS, 3))
+    return SimpleNamespace(landmark=[SimpleNamespace(x=float(x), y=float(y), z=float(z))
+                                     for x, y, z in points])
+
+
+def legacy_landmarks(face_landmarks, w, h):
+    """Cách cũ: mảng mỗi mắt bằng list comprehension, 3 lần np.linalg.norm mỗi mắt"""
+    def ear(eye):
+        v1 = np.linalg.norm(eye[1] - eye[5])
+        v2 = np.linalg.norm(eye[2] - eye[4])
+        return (v1 + v2) / (2.0 * np.linalg.norm(eye[0] - eye[3]))
+
+    lm = face_landmarks.landmark
+    left_eye = np.array([[lm[i].x * w, lm[i].y * h] for i in LEFT_EYE])
+    right_eye = np.array([[lm[i].x * w, lm[i].y * h] for i in RIGHT_EYE])
+    nose, forehead, chin = lm[NOSE_TIP], lm[FOREHEAD], lm[CHIN]
+    left_cheek, right_cheek = lm[LEFT_CHEEK], lm[RIGHT_CHEEK]
+    position = {
+        'nose': (nose.x, nose.y), 'forehead': (forehead.x, forehead.y),
+        'chin': (chin.x, chin.y), 'left_cheek': (left_cheek.x, left_cheek.y),
+        'right_cheek': (right_cheek.x, right_cheek.y),
+        'face_width': abs(right_cheek.x - left_cheek.x),
+        'face_height': abs(chin.y - forehead.y),
+    }
+    x0, x1 = sorted((left_cheek.x, right_cheek.x))
+    left, top = int(np.clip(x0 * w, 0, w - 1)), int(np.clip(forehead.y * h, 0, h - 1))
+    box = (left, top, int(np.clip(x1 * w, left + 1, w)) - left,
+           int(np.clip(chin.y * h, top + 1, h)) - top)
+    return ear(left_eye), ear(right_eye), position, box
+
+
+def synthetic_ear_trace(n_frames=N_TRACE_FRAMES, seed=0):
+    """Returns: (chuỗi EAR, số lần nháy thật) - mắt mở có nhiễu, nháy 3-6 frame, glitch 1 frame"""
+    rng = np.random.default_rng(seed)
+    ears = rng.normal(EAR_OPEN, EAR_NOISE, n_frames)
+    minutes = n_frames / (30 * 60)
+    n_blinks = int(BLINKS_PER_MINUTE * minutes)
+    starts = np.sort(rng.choice(np.arange(30, n_frames - 30, 40), n_blinks, replace=False))
+    for start in starts:
+        length = int(rng.integers(3, 7))
+        ears[start:start + length] = rng.normal(EAR_CLOSED, EAR_NOISE, length)
+    blink_frames = np.zeros(n_frames, dtype=bool)
+    for start in starts:
+        blink_frames[start - 5:start + 12] = True
+    glitches = rng.choice(np.flatnonzero(~blink_frames),
+                          int(GLITCHES_PER_MINUTE * minutes), replace=False)
+    ears[glitches] = rng.normal(EAR_CLOSED, EAR_NOISE, len(glitches))
+    return ears, n_blinks
+
+
+def count_blinks_single_frame(ears):
+    """Luật cũ (BlinkLivenessState): đã thấy mắt mở + 1 frame dưới ngưỡng = 1 lần nháy"""
+    blinks, open_seen = 0, False
+    for ear in ears:
+        if ear < EAR_THRESHOLD:
+            blinks += open_seen
+            open_seen = False
+        else:
+            open_seen = True
+    return blinks
+
+
+def run_without_facemesh():
+    face_landmarks = fake_landmarks()
+    buffer = LandmarkBuffer()
+
+    def vectorized():
+        buffer.fill(face_landmarks)
+        return buffer.ears(640, 480), buffer.position(), buffer.face_box(640, 480)
+
+    old = legacy_landmarks(face_landmarks, 640, 480)
+    new = vectorized()
+    assert np.allclose(old[:2], new[0], rtol=1e-4) and old[3] == new[2]
+
+    print(f"{'trích landmark':<28} | {'p50 µs':>8} | {'p99 µs':>8}")
+    print("-" * 52)
+    for label, step in [("list + 3x norm/mắt (cũ)", lambda: legacy_landmarks(face_landmarks, 640, 480)),
+                        ("LandmarkBuffer (mới)", vectorized)]:
+        stats = summarize(time_call(lambda: [step() for _ in range(100)], repeat=20))
+        print(f"{label:<28} | {stats['p50'] * 10:>8.1f} | {stats['p99'] * 10:>8.1f}")
+
+    ears, n_blinks = synthetic_ear_trace()
+    detector = BlinkDetector()
+    start = time.perf_counter()
+    detected = sum(detector.update(ear) for ear in ears)
+    us_per_frame = (time.perf_counter() - start) * 1e6 / len(ears)
+    single = count_blinks_single_frame(ears)
+    print(f"\n👁️  {len(ears)} frame EAR giả lập: {n_blinks} lần nháy thật, "
+          f"{GLITCHES_PER_MINUTE}/phút frame nhiễu đơn lẻ")
+    print(f"   luật 1 frame (cũ):  {single} lần nháy ({single - n_blinks:+d})")
+    print(f"   BlinkDetector:      {detected} lần nháy ({detected - n_blinks:+d}), "
+          f"{us_per_frame:.1f}µs/frame")
+
+
+def run(source=None, n_frames=200):
+    run_without_facemesh()
+    if not MEDIAPIPE_AVAILABLE:
+        print("\n⚠️ Bỏ qua phần FaceMesh (MediaPipe không được cài đặt)")
+        return
+    print()
+
+    frames = read_frames(source, n_frames)
+    detector = AdvancedLivenessDetector()
+
+    def two_passes(frame):
+        detector.detect_blink(frame)
+        detector.get_face_position(frame)
+        legacy_texture_quality(frame)
+
+    def single_pass(frame):
+        analysis = detector.analyze_frame(frame)
+        detector.detect_texture_quality(frame, analysis.face_box)
+
+    found = sum(detector.analyze_frame(frame).face_found for frame in frames)
+    print(f"🖼️  {len(frames)} frame {frames[0].shape[1]}x{frames[0].shape[0]}, "
+          f"có khuôn mặt: {found}")
+
+    print(f"{'đường đi':<28} | {'FPS':>7} | {'ms/frame':>9}")
+    print("-" * 52)
+    for label, step in [("2 lần FaceMesh (cũ)", two_passes),
+                        ("analyze_frame (mới)", single_pass)]:
+        measure_fps(step, frames[:10])  # Warm-up
+        fps, ms = measure_fps(step, frames)
+        print(f"{label:<28} | {fps:>7.1f} | {ms:>7.1f}ms")
+    detector.close()
+
+    def build_detector():
+        AdvancedLivenessDetector().close()
+
+    stats = summarize(time_call(build_detector, repeat=5, warmup=1))
+    print(f"\n⏱️  Tạo detector mới mỗi lần SPACE (cũ): p50 {stats['p50']:.1f}ms "
+          f"-> detector dùng chung: 0ms")
+
+
+if __name__ == "__main__":
+    run(sys.argv[1] if len(sys.argv) > 1 else None,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 200)
@@ -0,0 +1,169 @@
+"""
+Texture check: cả frame + fft2 (cũ) so với vùng mặt thu nhỏ + rfft2 (TextureAnalyzer)
+Chạy:
+  python -m benchmarks.bench_texture                       # microbenchmark
+  python -m benchmarks.bench_texture save <thư_mục> <nhãn> [số_frame]
+  python -m benchmarks.bench_texture check <thư_mục>
+- save: chụp frame từ webcam kèm face box của FaceMesh (cần MediaPipe),
+  nhãn 'genuine' (mặt thật) hoặc 'spoof' (ảnh in / màn hình)
+- check: chạy lại bộ frame đã lưu, so quyết định cũ/mới với nhãn;
+  exit code 1 nếu độ chính xác mới giảm quá REGRESSION_TOLERANCE
+"""
+import json
+import os
+import sys
+
+import cv2
+import numpy as np
+
+from advanced_liveness_module import TextureAnalyzer, TEXTURE_EVERY_N
+from benchmarks.common import time_call, summarize
+
+
+FRAME_SIZES = [(640, 480), (1280, 720), (1920, 1080)]
+LABELS = {'genuine': True, 'spoof': False}
+BOXES_FILE = "boxes.json"
+REGRESSION_TOLERANCE = 0.05
+
+
+def legacy_texture_quality(frame):
+    """detect_texture_quality trước đây: Laplacian + fft2/fftshift trên cả frame"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    laplacian = cv2.Laplacian(gray, cv2.CV_64F)
+    variance = laplacian.var()
+
+    f = np.fft.fft2(gray)
+    fshift = np.fft.fftshift(f)
+    magnitude = np.abs(fshift)
+    high_freq = np.mean(magnitude[magnitude.shape[0]//4:3*magnitude.shape[0]//4,
+                                 magnitude.shape[1]//4:3*magnitude.shape[1]//4])
+
+    texture_score = 0
+    if variance > 100:
+        texture_score += 0.5
+    if high_freq > 1e6:
+        texture_score += 0.5
+
+    return texture_score >= 0.5, variance, high_freq
+
+
+def synthetic_frame(width, height, seed=0):
+    """Nền mờ + 1 vùng 'mặt' có texture ở giữa frame. Returns: (frame, box)"""
+    rng = np.random.default_rng(seed)
+    frame = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8),
+                             (15, 15), 0)
+    w, h = width // 4, height // 2
+    x, y = (width - w) // 2, (height - h) // 2
+    frame[y:y + h, x:x + w] = rng.integers(60, 200, (h, w, 3), dtype=np.uint8)
+    return frame, (x, y, w, h)
+
+
+def run_microbenchmark(repeat=30):
+    analyzer = TextureAnalyzer()
+    print(f"{'frame':<11} | {'cũ (cả frame)':>14} | {'mới (ROI)':>10} | "
+          f"{'mới / {0} frame'.format(TEXTURE_EVERY_N):>14}")
+    print("-" * 60)
+    for width, height in FRAME_SIZES:
+        frame, box = synthetic_frame(width, height)
+        legacy = summarize(time_call(lambda: legacy_texture_quality(frame),
+                                     repeat=repeat, warmup=2))
+        roi = summarize(time_call(lambda: analyzer.check(frame, box),
+                                  repeat=repeat, warmup=2))
+        print(f"{f'{width}x{height}':<11} | {legacy['p50']:>12.2f}ms | {roi['p50']:>8.2f}ms | "
+              f"{roi['p50'] / TEXTURE_EVERY_N:>12.2f}ms")
+
+
+def save_frames(directory, label, count=50):
+    if label not in LABELS:
+        raise SystemExit(f"❌ Nhãn phải là một trong: {', '.join(LABELS)}")
+    from advanced_liveness_module import AdvancedLivenessDetector
+
+    detector = AdvancedLivenessDetector()
+    label_dir = os.path.join(directory, label)
+    os.makedirs(label_dir, exist_ok=True)
+    boxes_path = os.path.join(label_dir, BOXES_FILE)
+    boxes = {}
+    if os.path.exists(boxes_path):
+        with open(boxes_path, 'r', encoding='utf-8') as f:
+            boxes = json.load(f)
+
+    capture = cv2.VideoCapture(0)
+    saved = 0
+    try:
+        while saved < count:
+            ret, frame = capture.read()
+            if not ret:
+                break
+            analysis = detector.analyze_frame(frame)
+            if not analysis.face_found:
+                continue
+            filename = f"{len(boxes):04d}.png"
+            cv2.imwrite(os.path.join(label_dir, filename), frame)
+            boxes[filename] = list(analysis.face_box)
+            saved += 1
+    finally:
+        capture.release()
+        detector.close()
+
+    with open(boxes_path, 'w', encoding='utf-8') as f:
+        json.dump(boxes, f, indent=1)
+    print(f"💾 Đã lưu {saved} frame '{label}' vào {label_dir}")
+
+
+def load_regression_set(directory):
+    """[(label, frame, box)] từ các thư mục con genuine/ spoof/"""
+    samples = []
+    for label in LABELS:
+        boxes_path = os.path.join(directory, label, BOXES_FILE)
+        if not os.path.exists(boxes_path):
+            continue
+        with open(boxes_path, 'r', encoding='utf-8') as f:
+            boxes = json.load(f)
+        for filename, box in sorted(boxes.items()):
+            frame = cv2.imread(os.path.join(directory, label, filename))
+            if frame is not None:
+                samples.append((label, frame, tuple(box)))
+    return samples
+
+
+def check_regression(directory):
+    samples = load_regression_set(directory)
+    if not samples:
+        raise SystemExit(f"❌ Không có frame nào trong {directory} (chạy 'save' trước)")
+
+    analyzer = TextureAnalyzer()
+    legacy_correct = roi_correct = agree = 0
+    print(f"{'nhãn':<8} | {'n':>4} | {'cũ pass':>8} | {'mới pass':>8}")
+    print("-" * 38)
+    for label, expected in LABELS.items():
+        rows = [(frame, box) for lbl, frame, box in samples if lbl == label]
+        if not rows:
+            continue
+        legacy = [legacy_texture_quality(frame)[0] for frame, _ in rows]
+        roi = [analyzer.check(frame, box)[0] for frame, box in rows]
+        legacy_correct += sum(ok == expected for ok in legacy)
+        roi_correct += sum(ok == expected for ok in roi)
+        agree += sum(a == b for a, b in zip(legacy, roi))
+        print(f"{label:<8} | {len(rows):>4} | {np.mean(legacy)*100:>7.1f}% | "
+              f"{np.mean(roi)*100:>7.1f}%")
+
+    legacy_acc = legacy_correct / len(samples)
+    roi_acc = roi_correct / len(samples)
+    print(f"\n📊 Độ chính xác: cũ {legacy_acc*100:.1f}% | mới {roi_acc*100:.1f}% | "
+          f"cùng quyết định {agree / len(samples)*100:.1f}%")
+    if roi_acc < legacy_acc - REGRESSION_TOLERANCE:
+        print("❌ Texture check mới kém hơn đáng kể so với bản cũ")
+        return False
+    print("✅ Không có regression")
+    return True
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'save':
+        save_frames(sys.argv[2], sys.argv[3],
+                    int(sys.argv[4]) if len(sys.argv) > 4 else 50)
+    elif len(sys.argv) > 1 and sys.argv[1] == 'check':
+        sys.exit(0 if check_regression(sys.argv[2]) else 1)
+    else:
+        run_microbenchmark()
@@ -0,0 +1,252 @@
+"""
+Tiện ích dùng chung cho benchmarks: đo thời gian và dữ liệu giả lập
+"""
+import os
+import time
+
+import numpy as np
+
+
+EMBEDDING_DIM = 128  # Facenet
+
+
+def time_call(fn, repeat=20, warmup=2):
+    """Chạy fn nhiều lần, trả về danh sách thời gian (ms)"""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summarize(timings):
+    """p50/p99/mean của danh sách thời gian (ms)"""
+    arr = np.asarray(timings, dtype=np.float64)
+    return {
+        'p50': float(np.percentile(arr, 50)),
+        'p99': float(np.percentile(arr, 99)),
+        'mean': float(arr.mean()),
+    }
+
+
+def synthetic_known_embeddings(n_refs, photos_per_person=3, dim=EMBEDDING_DIM, seed=0):
+    """
+    Tạo dict giống load_known_faces: {filename: (name, embedding, mtime)}
+    Embedding là list float (giá trị float32 như output của Facenet),
+    các ảnh của cùng một người nằm quanh một tâm chung.
+    """
+    rng = np.random.default_rng(seed)
+    n_people = max(1, n_refs // photos_per_person)
+    centers = rng.normal(0.0, 1.0, size=(n_people, dim)).astype(np.float32)
+
+    known = {}
+    for i in range(n_refs):
+        person = i % n_people
+        shot = i // n_people
+        name = f"person{person:06d}"
+        filename = f"{name}.jpg" if shot == 0 else f"{name}_{shot}.jpg"
+        noise = rng.normal(0.0, 0.35, size=dim).astype(np.float32)
+        known[filename] = (name, (centers[person] + noise).tolist(), 0.0)
+    return known
+
+
+def synthetic_probes(known_embeddings, n_probes=50, seed=1):
+    """Probe gần một ảnh đã biết (genuine) xen kẽ probe ngẫu nhiên (impostor)"""
+    rng = np.random.default_rng(seed)
+    refs = [emb for _, emb, _ in known_embeddings.values()]
+    dim = len(refs[0])
+    probes = []
+    for i in range(n_probes):
+        if i % 2 == 0:
+            base = np.asarray(refs[rng.integers(len(refs))], dtype=np.float32)
+            probe = base + rng.normal(0.0, 0.3, size=dim).astype(np.float32)
+        else:
+            probe = rng.normal(0.0, 1.0, size=dim).astype(np.float32)
+        probes.append(probe.tolist())
+    return probes
+
+
+def synthetic_attendance_history(path, n_rows, n_people=500, end_date=None):
+    """
+    Ghi attendance.csv giả gồm n_rows dòng 'name,date,time' theo thứ tự ngày,
+    mỗi ngày n_people người, ngày cuối cùng là end_date (mặc định hôm qua)
+    """
+    from datetime import datetime, timedelta
+
+    end_date = end_date or (datetime.now() - timedelta(days=1))
+    n_days = max(1, -(-n_rows // n_people))
+    start = end_date - timedelta(days=n_days - 1)
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(n_rows):
+            date_str = (start + timedelta(days=i // n_people)).strftime("%Y-%m-%d")
+            f.write(f"person{i % n_people:04d},{date_str},08:{i % 60:02d}:00\n")
+
+
+# ===========================
+# MODEL GIẢ + FRAME
+# ===========================
+FAKE_FEATURE_SIDE = 16  # Crop thu nhỏ 16x16 gray -> 256 đặc trưng -> chiếu xuống 128 chiều
+
+
+class FakeFacenet:
+    """
+    Thay Facenet khi benchmark: chạy offline trên CPU, không cần TF/DeepFace.
+    Embedding tất định theo nội dung crop (cùng crop -> cùng vector, crop giống
+    nhau -> vector gần nhau), độ lớn tương đương synthetic_known_embeddings.
+    latency_ms / per_item_ms: giả lập thời gian forward (mặc định 0, dùng sleep).
+    cpu_ms: giả lập thêm phần forward tốn CPU và giữ GIL (mỗi crop, vòng lặp bận)
+    Cùng giao diện với EmbeddingModelService: input_shape, forward, embed.
+    """
+
+    def __init__(self, dim=EMBEDDING_DIM, input_shape=(160, 160), latency_ms=0.0,
+                 per_item_ms=0.0, cpu_ms=0.0, seed=0):
+        rng = np.random.default_rng(seed)
+        self.input_shape = tuple(input_shape)
+        self.latency_ms = latency_ms
+        self.per_item_ms = per_item_ms
+        self.cpu_ms = cpu_ms
+        self._projection = rng.normal(
+            0.0, 1.0, size=(FAKE_FEATURE_SIDE * FAKE_FEATURE_SIDE, dim)
+        ).astype(np.float32)
+
+    def forward(self, batch):
+        """batch (N, H, W, 3) float32 -> (N, D) float32"""
+        import cv2
+
+        side = (FAKE_FEATURE_SIDE, FAKE_FEATURE_SIDE)
+        features = np.stack([
+            cv2.resize(np.asarray(image, dtype=np.float32), side,
+                       interpolation=cv2.INTER_AREA).mean(axis=2).ravel()
+            for image in batch
+        ])
+        features -= features.mean(axis=1, keepdims=True)
+        norms = np.linalg.norm(features, axis=1, keepdims=True)
+        features /= np.maximum(norms, 1e-6)
+        delay = self.latency_ms + self.per_item_ms * len(batch)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if self.cpu_ms > 0:
+            busy_until = time.thread_time() + self.cpu_ms * len(batch) / 1000
+            while time.thread_time() < busy_until:
+                pass
+        return features @ self._projection
+
+    def embed(self, batch_of_crops):
+        """Crop BGR uint8 -> (N, D) float32, giống EmbeddingModelService.embed"""
+        from enrollment import resize_with_padding
+
+        if len(batch_of_crops) == 0:
+            return np.zeros((0, 0), dtype=np.float32)
+        return self.forward(np.stack([
+            resize_with_padding(crop.astype(np.float32) / 255.0, self.input_shape)
+            for crop in batch_of_crops
+        ]))
+
+
+def synthetic_frame_sequence(n_frames, width=640, height=480, seed=0):
+    """
+    Chuỗi frame giả: nền mờ cố định + 1 vùng 'mặt' có texture di chuyển chậm.
+    Returns: danh sách (frame, box) - box là vị trí thật của vùng mặt
+    """
+    import cv2
+
+    rng = np.random.default_rng(seed)
+    background = cv2.GaussianBlur(
+        rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (15, 15), 0
+    )
+    face_w, face_h = width // 4, height // 2
+    face = rng.integers(60, 200, (face_h, face_w, 3), dtype=np.uint8)
+    span_x = (width - face_w) // 4
+
+    sequence = []
+    for i in range(n_frames):
+        frame = background.copy()
+        x = (width - face_w) // 2 + int(span_x * np.sin(i / 15.0))
+        y = (height - face_h) // 2
+        frame[y:y + face_h, x:x + face_w] = face
+        sequence.append((frame, (x, y, face_w, face_h)))
+    return sequence
+
+
+def load_frames(source, max_frames):
+    """Đọc tối đa max_frames frame từ video / camera (dùng để phát lại khi benchmark)"""
+    import cv2
+
+    capture = cv2.VideoCapture(source)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        frames.append(frame)
+    capture.release()
+    return frames
+
+
+# ===========================
+# KẾT QUẢ JSON + SO SÁNH
+# ===========================
+REGRESSION_THRESHOLD = 0.15  # Chậm hơn 15% so với baseline -> coi là regression
+MIN_REGRESSION_MS = 0.05  # Bỏ qua chênh lệch tuyệt đối nhỏ hơn (nhiễu đo)
+
+
+def environment_info():
+    """Thông tin máy + commit để biết 2 file kết quả có so sánh được không"""
+    import platform
+    import subprocess
+
+    import cv2
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                capture_output=True, text=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        'commit': commit or None,
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def write_results(path, results, config=None):
+    """results: {tên: summarize(...) + trường phụ}"""
+    import json
+
+    payload = {'environment': environment_info(), 'config': config or {},
+               'results': results}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    return payload
+
+
+def load_results(path):
+    import json
+
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare_results(baseline, current, threshold=REGRESSION_THRESHOLD, metric='p50'):
+    """
+    So sánh 2 payload của write_results theo metric (ms, nhỏ hơn là tốt hơn).
+    Returns: [(tên, baseline, current, tỉ lệ thay đổi, regression?)]
+    """
+    rows = []
+    base_results = baseline['results']
+    for name, result in current['results'].items():
+        base = base_results.get(name)
+        if base is None or metric not in base or metric not in result:
+            continue
+        before, after = base[metric], result[metric]
+        change = (after - before) / before if before > 0 else 0.0
+        regressed = change > threshold and after - before > MIN_REGRESSION_MS
+        rows.append((name, before, after, change, regressed))
+    return rows
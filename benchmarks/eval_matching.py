@@ -0,0 +1,149 @@
+"""
+Đánh giá FAR/FRR: luật hiện tại (L2 + THRESHOLD chung) so với chế độ cosine
+Chạy:
+  python -m benchmarks.eval_matching                  # embeddings thật trong cache
+  python -m benchmarks.eval_matching --synthetic 300  # 300 người giả lập
+- Genuine: bỏ 1 ảnh khỏi gallery rồi dùng ảnh đó làm probe (leave-one-out);
+  FRR = bị từ chối hoặc nhận nhầm người khác
+- Impostor: bỏ toàn bộ ảnh của 1 người, dùng ảnh của họ làm probe;
+  FAR = được chấp nhận là một người nào đó
+- Kèm số phép so sánh vector mỗi lần khớp và thời gian khớp trung bình
+"""
+import argparse
+import time
+
+import numpy as np
+
+from face_gallery import FaceGallery, CentroidGallery, COSINE_THRESHOLD
+from benchmarks.common import EMBEDDING_DIM
+
+
+THRESHOLD = 8.0  # Giống face_recognition_with_blink.THRESHOLD
+MAX_TRIALS = 500  # Giới hạn số lần thử mỗi loại (mỗi lần thử build lại gallery)
+
+
+def synthetic_people(n_people, dim=EMBEDDING_DIM, seed=0):
+    """
+    Người giả lập khó hơn synthetic_known_embeddings: số ảnh 2-8 mỗi người,
+    độ phân tán trong lớp khác nhau giữa các người, các tâm nằm gần nhau hơn
+    """
+    rng = np.random.default_rng(seed)
+    known = {}
+    for person in range(n_people):
+        center = rng.normal(0.0, 0.45, size=dim)
+        spread = rng.uniform(0.2, 0.55)
+        for shot in range(int(rng.integers(2, 9))):
+            embedding = center + rng.normal(0.0, spread, size=dim)
+            known[f"person{person:05d}_{shot}.jpg"] = (
+                f"person{person:05d}", embedding.astype(np.float32).tolist(), 0.0
+            )
+    return known
+
+
+def load_cached_embeddings():
+    """Embeddings thật trong cache của app (không tính lại)"""
+    from embedding_store import open_store
+    from enrollment import MODEL_KEY
+    from face_recognition_with_blink import EMBEDDINGS_STORE, EMBEDDINGS_FILE, KNOWN_FACES_DIR
+
+    store = open_store(EMBEDDINGS_STORE, legacy_pickle=EMBEDDINGS_FILE,
+                       known_faces_dir=KNOWN_FACES_DIR)
+    try:
+        return {filename: (name, list(map(float, embedding)), mtime)
+                for filename, (name, embedding, mtime)
+                in store.known_embeddings(model=MODEL_KEY).items()}
+    finally:
+        store.close()
+
+
+METHODS = [
+    ("L2, THRESHOLD chung", lambda known: FaceGallery.from_embeddings(known),
+     lambda gallery, probe: gallery.match(probe, THRESHOLD)),
+    ("cosine, ngưỡng chung", lambda known: CentroidGallery.from_embeddings(known),
+     lambda gallery, probe: gallery.match(probe, COSINE_THRESHOLD)),
+    ("cosine, ngưỡng riêng", lambda known: CentroidGallery.from_embeddings(known),
+     lambda gallery, probe: gallery.match(probe)),
+]
+
+
+def make_trials(known, max_trials=MAX_TRIALS, seed=0):
+    """Returns: (genuine, impostor) - danh sách (tên người, [filename bị bỏ ra], filename probe)"""
+    rng = np.random.default_rng(seed)
+    by_person = {}
+    for filename, (name, _, _) in known.items():
+        by_person.setdefault(name, []).append(filename)
+
+    genuine = [(name, [f], f) for name, files in by_person.items() if len(files) >= 2
+               for f in files]
+    impostor = [(name, files, f) for name, files in by_person.items() for f in files]
+    if len(by_person) < 2:
+        impostor = []
+
+    def sample(trials):
+        if len(trials) <= max_trials:
+            return trials
+        return [trials[i] for i in rng.choice(len(trials), max_trials, replace=False)]
+    return sample(genuine), sample(impostor)
+
+
+def evaluate(known, build, match, genuine, impostor):
+    rejected = misidentified = accepted = 0
+    match_seconds = 0.0
+    for name, removed, probe_file in genuine:
+        gallery = build({f: v for f, v in known.items() if f not in removed})
+        start = time.perf_counter()
+        result, _ = match(gallery, known[probe_file][1])
+        match_seconds += time.perf_counter() - start
+        if result == "Unknown":
+            rejected += 1
+        elif result != name:
+            misidentified += 1
+
+    galleries = {}
+    for name, removed, probe_file in impostor:
+        if name not in galleries:
+            galleries = {name: build({f: v for f, v in known.items() if f not in removed})}
+        result, _ = match(galleries[name], known[probe_file][1])
+        accepted += result != "Unknown"
+
+    n_genuine, n_impostor = max(1, len(genuine)), max(1, len(impostor))
+    return {
+        'frr': (rejected + misidentified) / n_genuine,
+        'misid': misidentified / n_genuine,
+        'far': accepted / n_impostor,
+        'match_us': match_seconds * 1e6 / n_genuine,
+    }
+
+
+def run(known, max_trials=MAX_TRIALS):
+    names = {name for name, _, _ in known.values()}
+    genuine, impostor = make_trials(known, max_trials)
+    full = CentroidGallery.from_embeddings(known)
+    print(f"\n📊 {len(known)} ảnh, {len(names)} người; "
+          f"{len(genuine)} lần thử genuine, {len(impostor)} lần thử impostor")
+    print(f"   So sánh/lần khớp: L2 {len(known)} ảnh, "
+          f"cosine {full.comparisons_per_match():.0f} (tâm + top-{full.top_k} ảnh đại diện)")
+    print(f"   Ngưỡng riêng: {full.thresholds.min():.3f} - {full.thresholds.max():.3f} "
+          f"(trung vị {np.median(full.thresholds):.3f})")
+
+    print(f"\n   {'luật':<24} {'FAR':>8} {'FRR':>8} {'nhầm':>8} {'µs/khớp':>9}")
+    for label, build, match in METHODS:
+        r = evaluate(known, build, match, genuine, impostor)
+        print(f"   {label:<24} {r['far']:>8.2%} {r['frr']:>8.2%} "
+              f"{r['misid']:>8.2%} {r['match_us']:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FAR/FRR của các luật so khớp")
+    parser.add_argument('--synthetic', type=int, metavar='N_PEOPLE',
+                        help="Dùng N người giả lập thay cho cache embeddings")
+    parser.add_argument('--max-trials', type=int, default=MAX_TRIALS)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        known = synthetic_people(args.synthetic)
+    else:
+        known = load_cached_embeddings()
+        if not known:
+            raise SystemExit("❌ Cache không có embeddings (chạy app 1 lần hoặc dùng --synthetic)")
+    run(known, args.max_trials)
@@ -0,0 +1,255 @@
+"""
+Bộ benchmark tái lập được: chạy offline trên CPU, kết quả JSON so sánh giữa các commit
+Chạy:
+  python -m benchmarks.suite run [-o results.json] [--quick] [--frames clip.mp4]
+  python -m benchmarks.suite compare baseline.json results.json [--threshold 0.15]
+- Gallery 128 chiều và lịch sử điểm danh giả (seed cố định)
+- Facenet thay bằng FakeFacenet (embedding tất định, không cần TF/DeepFace)
+- Phát lại chuỗi frame (giả lập hoặc clip đã ghi) qua detection / texture /
+  liveness (FaceMesh, nếu có MediaPipe) / nhận diện cả frame
+- compare: exit code 1 nếu p50 của bất kỳ mục nào chậm hơn baseline quá threshold
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from functools import partial
+
+import cv2
+
+from benchmarks.common import (
+    time_call, summarize, synthetic_known_embeddings, synthetic_probes,
+    synthetic_attendance_history, synthetic_frame_sequence, load_frames,
+    FakeFacenet, write_results, load_results, compare_results, REGRESSION_THRESHOLD
+)
+
+
+GALLERY_SIZES = [1_000, 10_000]
+N_IMAGES = 200  # Số ảnh known_faces giả cho load_known_faces
+HISTORY_ROWS = 100_000
+N_FRAMES = 120
+FRAME_SIZE = (640, 480)
+REPLAY_PASSES = 3  # Số lượt phát lại chuỗi frame (sau 1 lượt warm-up)
+QUICK = {'gallery_sizes': [1_000], 'n_images': 40, 'history_rows': 10_000, 'n_frames': 30}
+
+
+@contextlib.contextmanager
+def quiet():
+    """Ẩn print của code được đo (log tiến độ, điểm danh...)"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def per_item(timings, n_items):
+    """time_call đo cả vòng lặp -> quy về ms mỗi phần tử"""
+    return summarize([t / n_items for t in timings])
+
+
+def bench_recognize_face(results, sizes):
+    import face_recognition_with_blink as app
+    from face_gallery import FaceGallery
+
+    for size in sizes:
+        known = synthetic_known_embeddings(size)
+        gallery = FaceGallery.from_embeddings(known)
+        probes = synthetic_probes(known, n_probes=50)
+        timings = time_call(lambda: [app.recognize_face(p, gallery) for p in probes])
+        results[f"recognize_face/{size}"] = {**per_item(timings, len(probes)), 'n': size}
+
+
+def bench_load_known_faces(results, n_images, work_dir):
+    """Lần đầu (tính embedding mọi ảnh bằng FakeFacenet) và lần sau (cache hit)"""
+    import numpy as np
+
+    import face_recognition_with_blink as app
+    from enrollment import enroll_images, read_image, resize_with_padding
+
+    faces_dir = os.path.join(work_dir, "known_faces")
+    os.makedirs(faces_dir)
+    rng = np.random.default_rng(0)
+    for i in range(n_images):
+        image = rng.integers(0, 255, (96, 96, 3), dtype=np.uint8)
+        cv2.imwrite(os.path.join(faces_dir, f"person{i // 2:04d}_{i % 2}.jpg"), image)
+
+    def fake_preprocess(filepath, target_size):
+        return resize_with_padding(read_image(filepath).astype(np.float32) / 255.0, target_size)
+
+    saved = (app.KNOWN_FACES_DIR, app.EMBEDDINGS_STORE, app.EMBEDDINGS_FILE, app.enroll_images)
+    app.KNOWN_FACES_DIR = faces_dir
+    app.EMBEDDINGS_STORE = os.path.join(work_dir, "face_embeddings")
+    app.EMBEDDINGS_FILE = os.path.join(work_dir, "face_embeddings.pkl")
+    app.enroll_images = partial(enroll_images, model=FakeFacenet(),
+                                preprocess=fake_preprocess, verbose=False)
+    try:
+        with quiet():
+            known = app.load_known_faces()
+            # force_reload: tính lại embedding mọi ảnh như lần chạy đầu tiên
+            cold = time_call(lambda: app.load_known_faces(force_reload=True),
+                             repeat=3, warmup=0)
+            warm = time_call(app.load_known_faces, repeat=5, warmup=1)
+    finally:
+        (app.KNOWN_FACES_DIR, app.EMBEDDINGS_STORE,
+         app.EMBEDDINGS_FILE, app.enroll_images) = saved
+
+    if len(known) != n_images:
+        print(f"⚠️ load_known_faces: {len(known)}/{n_images} ảnh")
+    results["load_known_faces/cold"] = {**summarize(cold), 'n': n_images}
+    results["load_known_faces/warm"] = {**summarize(warm), 'n': n_images}
+
+
+def bench_log_attendance(results, history_rows, work_dir):
+    """Mở store (đọc phần hôm nay từ cuối file) + log_attendance cho người mới"""
+    import face_recognition_with_blink as app
+
+    path = os.path.join(work_dir, "attendance.csv")
+    synthetic_attendance_history(path, history_rows)
+    saved = (app.ATTENDANCE_FILE, app.ATTENDANCE_BACKEND)
+    app.ATTENDANCE_FILE, app.ATTENDANCE_BACKEND = path, "csv"
+    names = iter(f"student{i:06d}" for i in range(10_000_000))
+    try:
+        with quiet():
+            opening = time_call(lambda: (app.get_attendance_store(),
+                                         app.close_attendance_store()), repeat=10)
+            app.get_attendance_store()
+            timings = time_call(lambda: app.log_attendance(next(names)), repeat=200)
+            app.close_attendance_store()
+    finally:
+        app.ATTENDANCE_FILE, app.ATTENDANCE_BACKEND = saved
+
+    results[f"attendance_open/{history_rows}"] = {**summarize(opening), 'n': history_rows}
+    results[f"log_attendance/{history_rows}"] = {**summarize(timings), 'n': history_rows}
+
+
+def bench_frames(results, sequence):
+    """Phát lại frame qua detection, texture, FaceMesh và nhận diện cả frame"""
+    from advanced_liveness_module import TextureAnalyzer, MEDIAPIPE_AVAILABLE
+    from face_crops import extract_face_crops
+    from face_detection import FaceDetector
+    from face_gallery import FaceGallery
+    from face_recognition_with_blink import recognize_face
+
+    frames = [frame for frame, _ in sequence]
+
+    def replay(step):
+        timings = []
+        for replay_pass in range(REPLAY_PASSES + 1):
+            for item in sequence:
+                start = time.perf_counter()
+                step(*item)
+                if replay_pass:  # Lượt đầu là warm-up
+                    timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    for name, options in (("detect/haar-full", {'detect_width': None, 'every_n': 1, 'roi': False}),
+                          ("detect/haar-640-every3-roi", {'detect_width': 640, 'every_n': 3, 'roi': True})):
+        detector = FaceDetector("haar", **options)
+        results[name] = {**summarize(replay(lambda frame, box: detector.detect(frame))),
+                         'n': len(frames)}
+
+    texture = TextureAnalyzer()
+    results["liveness/texture"] = {**summarize(replay(texture.check)), 'n': len(frames)}
+
+    if MEDIAPIPE_AVAILABLE:
+        from advanced_liveness_module import AdvancedLivenessDetector
+        detector = AdvancedLivenessDetector()
+        try:
+            results["liveness/analyze_frame"] = {
+                **summarize(replay(lambda frame, box: detector.analyze_frame(frame))),
+                'n': len(frames)
+            }
+        finally:
+            detector.close()
+    else:
+        print("⚠️ Bỏ qua liveness/analyze_frame (không có MediaPipe)")
+
+    model = FakeFacenet()
+    gallery = FaceGallery.from_embeddings(synthetic_known_embeddings(1_000))
+
+    def recognize(frame, box):
+        embeddings = model.embed(extract_face_crops(frame, [box]))
+        return [recognize_face(e, gallery) for e in embeddings]
+
+    results["recognize/frame"] = {**summarize(replay(recognize)), 'n': len(frames)}
+
+
+def run(output, quick=False, frames_path=None):
+    gallery_sizes = QUICK['gallery_sizes'] if quick else GALLERY_SIZES
+    n_images = QUICK['n_images'] if quick else N_IMAGES
+    history_rows = QUICK['history_rows'] if quick else HISTORY_ROWS
+    n_frames = QUICK['n_frames'] if quick else N_FRAMES
+
+    if frames_path:
+        # Clip đã ghi: chưa có box thật -> vùng giữa frame làm ROI cho texture/nhận diện
+        frames = load_frames(frames_path, n_frames)
+        if not frames:
+            raise SystemExit(f"❌ Không đọc được frame nào từ {frames_path}")
+        h, w = frames[0].shape[:2]
+        sequence = [(frame, (w // 4, h // 4, w // 2, h // 2)) for frame in frames]
+    else:
+        sequence = synthetic_frame_sequence(n_frames, *FRAME_SIZE)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        steps = [
+            ("recognize_face", lambda: bench_recognize_face(results, gallery_sizes)),
+            ("load_known_faces", lambda: bench_load_known_faces(
+                results, n_images, os.path.join(work_dir, "faces"))),
+            ("log_attendance", lambda: bench_log_attendance(results, history_rows, work_dir)),
+            ("frames", lambda: bench_frames(results, sequence)),
+        ]
+        for name, step in steps:
+            start = time.perf_counter()
+            step()
+            print(f"✅ {name}: {time.perf_counter() - start:.1f}s")
+
+    config = {'quick': quick, 'frames': frames_path or "synthetic",
+              'n_frames': len(sequence), 'gallery_sizes': gallery_sizes,
+              'n_images': n_images, 'history_rows': history_rows}
+    write_results(output, results, config)
+
+    print(f"\n   {'mục':<34} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+    for name, r in results.items():
+        print(f"   {name:<34} {r['p50']:>9.3f} {r['p99']:>9.3f} {r['mean']:>9.3f}")
+    print(f"\n💾 Kết quả: {output}")
+    return 0
+
+
+def compare(baseline_path, current_path, threshold=REGRESSION_THRESHOLD):
+    baseline, current = load_results(baseline_path), load_results(current_path)
+    if baseline.get('config') != current.get('config'):
+        print("⚠️ Cấu hình 2 lần chạy khác nhau, so sánh có thể không công bằng")
+    print(f"\n📊 {baseline['environment'].get('commit')} -> "
+          f"{current['environment'].get('commit')} (p50, ngưỡng {threshold:.0%})")
+
+    rows = compare_results(baseline, current, threshold)
+    regressions = 0
+    for name, before, after, change, regressed in rows:
+        mark = "❌" if regressed else ("📈" if change < -threshold else "  ")
+        print(f"{mark} {name:<34} {before:>9.3f} -> {after:>9.3f} ms ({change:+.1%})")
+        regressions += regressed
+    if regressions:
+        print(f"\n❌ {regressions} mục chậm hơn baseline quá {threshold:.0%}")
+        return 1
+    print("\n✅ Không có regression")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bộ benchmark tái lập được")
+    sub = parser.add_subparsers(dest='command', required=True)
+    run_parser = sub.add_parser('run', help="Chạy bộ benchmark, ghi JSON")
+    run_parser.add_argument('-o', '--output', default="bench_results.json")
+    run_parser.add_argument('--quick', action='store_true', help="Kích thước nhỏ (CI)")
+    run_parser.add_argument('--frames', help="Clip đã ghi thay cho frame giả lập")
+    compare_parser = sub.add_parser('compare', help="So sánh 2 file kết quả")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        sys.exit(run(args.output, args.quick, args.frames))
+    sys.exit(compare(args.baseline, args.current, args.threshold))
@@ -0,0 +1,383 @@
+"""
+Embedding Store - Lưu gallery dạng memory-mapped, ghi nối thêm (append-only)
+- Khối float32 thô (N x D) mở bằng np.memmap -> khởi động gần như tức thì, zero-copy
+- Manifest JSONL nhỏ: filename, name, mtime, content hash, model cho từng hàng
+- Cập nhật = nối thêm hàng / đánh dấu xóa (tombstone), không ghi lại toàn bộ
+- Tra cứu theo (content hash, model key): ảnh giống hệt (kể cả đổi tên/di chuyển)
+  dùng lại hàng đã có, không tính lại embedding
+- Migrate 1 lần từ face_embeddings.pkl, lệnh compact để dọn hàng đã xóa
+
+Dùng từ dòng lệnh:
+    python embedding_store.py stats    [prefix]
+    python embedding_store.py compact  [prefix]
+    python embedding_store.py migrate  [file.pkl] [prefix]
+"""
+import hashlib
+import json
+import os
+import pickle
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+
+STORE_VERSION = 1
+DEFAULT_PREFIX = "face_embeddings"
+KNOWN_FACES_DIR = "known_faces"
+# Model key của cache pickle cũ (DeepFace.represent mặc định: Facenet, opencv, align)
+LEGACY_MODEL_KEY = "Facenet-v1/opencv/align"
+# Store tạo trước khi có model key chỉ ghi tên model
+MODEL_KEY_ALIASES = {"Facenet": LEGACY_MODEL_KEY}
+
+# Thông tin của 1 hàng trong store
+StoreEntry = namedtuple(
+    'StoreEntry', ['row', 'filename', 'name', 'mtime', 'content_hash', 'model']
+)
+
+
+def file_hash(filepath, chunk_size=1 << 20):
+    """SHA-1 nội dung file (đọc theo từng khối)"""
+    digest = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class EmbeddingStore:
+    """Gallery trên đĩa: <prefix>.manifest.jsonl + <prefix>.<gen>.f32"""
+
+    def __init__(self, prefix=DEFAULT_PREFIX):
+        self.prefix = prefix
+        self.directory = os.path.dirname(os.path.abspath(prefix))
+        self.manifest_path = prefix + ".manifest.jsonl"
+
+        self.dim = None
+        self.generation = 0
+        self.block_name = None
+        self.entries = {}
+        self.total_rows = 0
+        # (content_hash, model) -> hàng (kể cả hàng của file đã xóa, tới khi compact)
+        self._by_key = {}
+
+        self._matrix = None
+        self._block_file = None
+        self._manifest_file = None
+
+    @classmethod
+    def open(cls, prefix=DEFAULT_PREFIX):
+        store = cls(prefix)
+        if os.path.exists(store.manifest_path):
+            store._load_manifest()
+        return store
+
+    @property
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    @property
+    def block_path(self):
+        return os.path.join(self.directory, self.block_name) if self.block_name else None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, filename):
+        return filename in self.entries
+
+    def get(self, filename):
+        return self.entries.get(filename)
+
+    @property
+    def dead_rows(self):
+        """Số hàng không còn file nào trỏ tới (nhiều file giống hệt dùng chung 1 hàng)"""
+        return self.total_rows - len({entry.row for entry in self.entries.values()})
+
+    def find(self, content_hash, model):
+        """Hàng có cùng nội dung ảnh và cùng model key, hoặc None"""
+        if content_hash is None:
+            return None
+        return self._by_key.get((content_hash, model))
+
+    def _index_entry(self, entry):
+        self.entries[entry.filename] = entry
+        if entry.content_hash is not None:
+            self._by_key[(entry.content_hash, entry.model)] = entry.row
+
+    # ---------------------------
+    # Đọc
+    # ---------------------------
+    def _load_manifest(self):
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+
+        header = json.loads(lines[0])
+        if header.get("version") != STORE_VERSION:
+            raise ValueError(f"Manifest version không hỗ trợ: {header.get('version')}")
+        self.dim = header["dim"]
+        self.generation = header["generation"]
+        self.block_name = header["block"]
+
+        # Chỉ tin các hàng đã ghi đủ vào khối (bỏ phần bị ghi dở khi crash)
+        row_bytes = self.dim * 4
+        block_size = os.path.getsize(self.block_path) if os.path.exists(self.block_path) else 0
+        self.total_rows = block_size // row_bytes
+
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Dòng cuối ghi dở
+            if record["op"] == "base":
+                # Bản chụp dạng cột do compact ghi (1 dòng, parse nhanh)
+                for entry in zip(record["rows"], record["filenames"], record["names"],
+                                 record["mtimes"], record["hashes"], record["models"]):
+                    if entry[0] < self.total_rows:
+                        self._index_entry(StoreEntry(*entry))
+            elif record["op"] == "add" and record["row"] < self.total_rows:
+                model = record.get("model")
+                self._index_entry(StoreEntry(
+                    record["row"], record["filename"], record["name"], record["mtime"],
+                    record.get("hash"), MODEL_KEY_ALIASES.get(model, model)
+                ))
+            elif record["op"] == "del":
+                self.entries.pop(record["filename"], None)
+
+    @property
+    def matrix(self):
+        """Ma trận (total_rows x dim) float32 memory-mapped, chỉ đọc"""
+        if self._matrix is None or len(self._matrix) != self.total_rows:
+            if self.total_rows == 0:
+                self._matrix = np.zeros((0, self.dim or 0), dtype=np.float32)
+            else:
+                if self._block_file is not None:
+                    self._block_file.flush()
+                # ndarray thường trên vùng map (cắt hàng rẻ hơn lớp np.memmap)
+                self._matrix = np.asarray(np.memmap(
+                    self.block_path, dtype=np.float32, mode='r',
+                    shape=(self.total_rows, self.dim)
+                ))
+        return self._matrix
+
+    def embedding(self, filename):
+        return self.matrix[self.entries[filename].row]
+
+    def known_embeddings(self, model=None):
+        """
+        Dict giống load_known_faces: {filename: (name, embedding, mtime)}
+        embedding là view của memmap (không copy).
+        model: chỉ lấy các hàng tính bằng model key này
+        """
+        matrix = self.matrix
+        return {
+            filename: (entry.name, matrix[entry.row], entry.mtime)
+            for filename, entry in self.entries.items()
+            if model is None or entry.model == model
+        }
+
+    # ---------------------------
+    # Ghi
+    # ---------------------------
+    def _write_header(self, path, block_name):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({
+                "version": STORE_VERSION,
+                "dim": self.dim,
+                "generation": self.generation,
+                "block": block_name,
+            }) + "\n")
+
+    def _open_for_append(self):
+        if self._block_file is not None:
+            return
+        if not self.exists:
+            self.block_name = f"{os.path.basename(self.prefix)}.{self.generation}.f32"
+            self._write_header(self.manifest_path, self.block_name)
+
+        # Cắt phần hàng ghi dở ở cuối khối trước khi nối thêm
+        block_path = self.block_path
+        if os.path.exists(block_path):
+            os.truncate(block_path, self.total_rows * self.dim * 4)
+        self._block_file = open(block_path, 'ab')
+
+        # Dòng cuối manifest ghi dở (crash) -> xuống dòng trước khi nối thêm
+        torn = False
+        with open(self.manifest_path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+        self._manifest_file = open(self.manifest_path, 'a', encoding='utf-8')
+        if torn:
+            self._manifest_file.write("\n")
+
+    def _append_record(self, record):
+        self._manifest_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def add(self, filename, name, embedding, mtime, content_hash=None, model=None):
+        """Nối thêm 1 hàng (hàng cũ cùng filename trở thành hàng chết)"""
+        vector = np.ascontiguousarray(embedding, dtype=np.float32).reshape(-1)
+        if self.dim is None:
+            self.dim = len(vector)
+        elif len(vector) != self.dim:
+            raise ValueError(f"Embedding {filename} có {len(vector)} chiều, store cần {self.dim}")
+        self._open_for_append()
+
+        # Hàng chỉ được tin khi cả dữ liệu và dòng manifest đã xuống đĩa:
+        # manifest trỏ tới hàng chưa ghi đủ sẽ bị bỏ qua khi load
+        row = self.total_rows
+        self._block_file.write(vector.tobytes())
+        self.total_rows += 1
+
+        self.link(filename, name, row, mtime, content_hash, model)
+
+    def link(self, filename, name, row, mtime, content_hash=None, model=None):
+        """Cho filename trỏ tới 1 hàng đã có (ảnh giống hệt / chỉ đổi mtime), không ghi dữ liệu"""
+        self._open_for_append()
+        self._append_record({
+            "op": "add", "row": row, "filename": filename, "name": name,
+            "mtime": mtime, "hash": content_hash, "model": model,
+        })
+        self._index_entry(StoreEntry(row, filename, name, mtime, content_hash, model))
+
+    def remove(self, filename):
+        """Đánh dấu xóa (tombstone)"""
+        if filename not in self.entries:
+            return False
+        self._open_for_append()
+        self._append_record({"op": "del", "filename": filename})
+        del self.entries[filename]
+        return True
+
+    def sync(self):
+        """Flush + fsync dữ liệu đã ghi xuống đĩa"""
+        for f in (self._block_file, self._manifest_file):
+            if f is not None:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def close(self):
+        for f in (self._block_file, self._manifest_file):
+            if f is not None:
+                f.close()
+        self._block_file = None
+        self._manifest_file = None
+        self._matrix = None
+
+    def compact(self):
+        """
+        Ghi lại store chỉ với các hàng còn sống sang khối thế hệ mới.
+        Manifest mới được thay thế nguyên tử, sau đó mới xóa khối cũ.
+        Returns: số hàng chết đã dọn
+        """
+        if not self.exists:
+            return 0
+        removed = self.dead_rows
+        old_block = self.block_path
+        live = sorted(self.entries.values(), key=lambda entry: entry.row)
+        old_rows = sorted({entry.row for entry in live})
+        new_row_of = {row: new_row for new_row, row in enumerate(old_rows)}
+        matrix = self.matrix
+
+        self.generation += 1
+        block_name = f"{os.path.basename(self.prefix)}.{self.generation}.f32"
+        block_path = os.path.join(self.directory, block_name)
+        rows = np.array(old_rows, dtype=np.intp)
+        with open(block_path, 'wb') as f:
+            for start in range(0, len(rows), 65536):
+                f.write(np.ascontiguousarray(matrix[rows[start:start + 65536]]).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        live = [entry._replace(row=new_row_of[entry.row]) for entry in live]
+        tmp_manifest = self.manifest_path + ".tmp"
+        self._write_header(tmp_manifest, block_name)
+        with open(tmp_manifest, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({
+                "op": "base",
+                "rows": [entry.row for entry in live],
+                "filenames": [entry.filename for entry in live],
+                "names": [entry.name for entry in live],
+                "mtimes": [entry.mtime for entry in live],
+                "hashes": [entry.content_hash for entry in live],
+                "models": [entry.model for entry in live],
+            }, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.close()
+        os.replace(tmp_manifest, self.manifest_path)
+        self.block_name = block_name
+        self.entries = {}
+        self._by_key = {}
+        for entry in live:
+            self._index_entry(entry)
+        self.total_rows = len(old_rows)
+
+        try:
+            os.remove(old_block)
+        except OSError as e:
+            # Windows: khối cũ còn được map bởi view đang dùng
+            print(f"⚠️ Chưa xóa được khối cũ {old_block}: {e}")
+        return removed
+
+
+def migrate_pickle(pickle_path, store, known_faces_dir=KNOWN_FACES_DIR,
+                   model=LEGACY_MODEL_KEY):
+    """
+    Migrate 1 lần từ cache pickle cũ {filename: (name, embedding, mtime)}.
+    File pickle được đổi tên thành .migrated sau khi xong.
+    Returns: số embedding đã migrate
+    """
+    with open(pickle_path, 'rb') as f:
+        embeddings = pickle.load(f)
+
+    for filename, (name, embedding, mtime) in embeddings.items():
+        filepath = os.path.join(known_faces_dir, filename)
+        content_hash = file_hash(filepath) if os.path.exists(filepath) else None
+        store.add(filename, name, embedding, mtime, content_hash=content_hash, model=model)
+
+    # Gom các dòng add thành 1 bản chụp dạng cột để lần mở sau nhanh hơn
+    store.compact()
+    os.replace(pickle_path, pickle_path + ".migrated")
+    return len(embeddings)
+
+
+def open_store(prefix=DEFAULT_PREFIX, legacy_pickle=None, known_faces_dir=KNOWN_FACES_DIR):
+    """Mở store; nếu chưa có store mà còn cache pickle cũ thì migrate"""
+    store = EmbeddingStore.open(prefix)
+    if not store.exists and legacy_pickle and os.path.exists(legacy_pickle):
+        print(f"🔄 Đang migrate {legacy_pickle} sang store memmap...")
+        count = migrate_pickle(legacy_pickle, store, known_faces_dir)
+        print(f"✅ Đã migrate {count} embeddings")
+    return store
+
+
+# Dòng lệnh
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+
+    if command == "migrate":
+        pickle_path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_PREFIX + ".pkl"
+        store = EmbeddingStore.open(sys.argv[3] if len(sys.argv) > 3 else DEFAULT_PREFIX)
+        if store.exists:
+            print(f"❌ Store {store.manifest_path} đã tồn tại")
+            sys.exit(1)
+        print(f"✅ Đã migrate {migrate_pickle(pickle_path, store)} embeddings")
+        store.close()
+
+    elif command in ("compact", "stats"):
+        store = EmbeddingStore.open(sys.argv[2] if len(sys.argv) > 2 else DEFAULT_PREFIX)
+        if not store.exists:
+            print(f"❌ Không tìm thấy {store.manifest_path}")
+            sys.exit(1)
+        print(f"📦 {len(store)} hàng sống, {store.dead_rows} hàng chết, dim={store.dim}")
+        if command == "compact":
+            removed = store.compact()
+            print(f"🧹 Đã dọn {removed} hàng chết -> {store.block_name}")
+        store.close()
+
+    else:
+        print(__doc__)
+        sys.exit(1)
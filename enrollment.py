@@ -0,0 +1,182 @@
+"""
+Enrollment Pipeline - Tính embeddings song song theo batch cho load_known_faces
+- Stage 1: pool đọc ảnh + detect/align khuôn mặt (nhiều worker)
+- Stage 2: gom các crop thành batch -> 1 lần forward Facenet
+- Hiển thị tiến độ; on_result báo từng ảnh xong ngay -> load_known_faces ghi
+  luôn vào embedding store, bị ngắt thì lần chạy sau chỉ tính các ảnh còn thiếu
+"""
+import os
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+
+MODEL_NAME = "Facenet"
+MODEL_VERSION = 1  # Tăng khi đổi weights/cách tiền xử lý -> tính lại toàn bộ
+DETECTOR_BACKEND = "opencv"  # Giống mặc định của DeepFace.represent
+ALIGN = True
+ENROLL_WORKERS = min(8, os.cpu_count() or 1)
+ENROLL_BATCH_SIZE = 32
+
+
+def embedding_model_key(model_name=MODEL_NAME, version=MODEL_VERSION,
+                        detector_backend=DETECTOR_BACKEND, align=ALIGN):
+    """Định danh cấu hình sinh embedding, ví dụ 'Facenet-v1/opencv/align'"""
+    return f"{model_name}-v{version}/{detector_backend}/{'align' if align else 'noalign'}"
+
+
+# Cache embedding chỉ dùng lại vector có cùng model key
+MODEL_KEY = embedding_model_key()
+
+
+# Một ảnh cần tính embedding
+EnrollmentJob = namedtuple('EnrollmentJob', ['filename', 'filepath', 'name', 'mtime'])
+
+
+def get_deepface():
+    """Lazy import DeepFace"""
+    from deepface import DeepFace
+    return DeepFace
+
+
+def load_embedding_model(model_name=MODEL_NAME):
+    """Model nhận diện dùng chung cả process (đã nạp sẵn và warm-up)"""
+    from model_service import get_model_service  # Lazy import tránh vòng import
+    return get_model_service(model_name)
+
+
+def read_image(filepath):
+    """Đọc ảnh BGR (hỗ trợ đường dẫn Unicode trên Windows)"""
+    data = np.fromfile(filepath, dtype=np.uint8)
+    image = cv2.imdecode(data, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"Không đọc được ảnh: {filepath}")
+    return image
+
+
+def resize_with_padding(image, target_size):
+    """
+    Resize giữ tỷ lệ rồi thêm viền đen cho đủ kích thước model
+    (giống deepface preprocessing.resize_image). target_size: (h, w)
+    """
+    factor = min(target_size[0] / image.shape[0], target_size[1] / image.shape[1])
+    dsize = (max(1, int(image.shape[1] * factor)), max(1, int(image.shape[0] * factor)))
+    image = cv2.resize(image, dsize)
+
+    diff_0 = target_size[0] - image.shape[0]
+    diff_1 = target_size[1] - image.shape[1]
+    image = np.pad(
+        image,
+        ((diff_0 // 2, diff_0 - diff_0 // 2), (diff_1 // 2, diff_1 - diff_1 // 2), (0, 0)),
+        "constant"
+    )
+    if image.shape[0:2] != tuple(target_size):
+        image = cv2.resize(image, (target_size[1], target_size[0]))
+    return np.asarray(image, dtype=np.float32)
+
+
+def preprocess_image(filepath, target_size, detector_backend=DETECTOR_BACKEND, align=ALIGN):
+    """
+    Đọc ảnh, detect + align khuôn mặt, trả về crop float32 [0, 1] (BGR)
+    đã resize về kích thước model - cùng cách DeepFace.represent chuẩn bị input
+    """
+    image = read_image(filepath)
+    faces = get_deepface().extract_faces(
+        img_path=image,
+        detector_backend=detector_backend,
+        enforce_detection=False,
+        align=align
+    )
+    face = faces[0]["face"][:, :, ::-1]  # extract_faces trả về RGB
+    return resize_with_padding(face, target_size)
+
+
+def embed_batch(model, crops):
+    """1 lần forward cho cả batch crop. Returns: mảng (N, D) float32"""
+    batch = np.stack(crops).astype(np.float32, copy=False)
+    embeddings = model.forward(batch)
+    return np.asarray(embeddings, dtype=np.float32).reshape(len(crops), -1)
+
+
+# ===========================
+# PIPELINE
+# ===========================
+def enroll_images(jobs, workers=ENROLL_WORKERS, batch_size=ENROLL_BATCH_SIZE,
+                  model=None, preprocess=preprocess_image,
+                  on_result=None, verbose=True):
+    """
+    Tính embedding cho danh sách EnrollmentJob.
+    on_result(filename, (name, embedding, mtime)) được gọi ngay khi mỗi ảnh xong
+    Returns: {filename: (name, embedding, mtime)} (ảnh lỗi bị bỏ qua)
+    """
+    jobs = list(jobs)
+    results = {}
+    if not jobs:
+        return results
+
+    if model is None:
+        model = load_embedding_model()
+    target_size = model.input_shape
+
+    total = len(jobs)
+    start = time.perf_counter()
+    batch_jobs, batch_crops = [], []
+
+    def flush():
+        if not batch_crops:
+            return
+        try:
+            embeddings = embed_batch(model, batch_crops)
+        except Exception as e:
+            for job in batch_jobs:
+                print(f"❌ Lỗi khi load {job.filename}: {e}")
+            embeddings = []
+        for job, embedding in zip(batch_jobs, embeddings):
+            results[job.filename] = (job.name, embedding.tolist(), job.mtime)
+            if on_result is not None:
+                on_result(job.filename, results[job.filename])
+            if verbose:
+                print(f"✅ Đã load: {job.filename} -> {job.name}")
+        batch_jobs.clear()
+        batch_crops.clear()
+
+        if verbose:
+            elapsed = time.perf_counter() - start
+            done = len(results)
+            rate = done / elapsed if elapsed > 0 else 0
+            print(f"⏳ {done}/{total} ảnh ({rate:.1f} ảnh/s)")
+
+    # Giới hạn số ảnh đang xử lý để không giữ quá nhiều crop trong RAM
+    max_in_flight = max(1, workers) * batch_size * 2
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        queue = deque()
+        job_iter = iter(jobs)
+
+        def submit_next():
+            job = next(job_iter, None)
+            if job is not None:
+                queue.append((job, pool.submit(preprocess, job.filepath, target_size)))
+
+        for _ in range(max_in_flight):
+            submit_next()
+
+        while queue:
+            job, future = queue.popleft()
+            submit_next()
+            try:
+                crop = future.result()
+            except Exception as e:
+                print(f"❌ Lỗi khi load {job.filename}: {e}")
+                continue
+
+            batch_jobs.append(job)
+            batch_crops.append(crop)
+            if len(batch_crops) >= batch_size:
+                flush()
+
+        flush()
+
+    return results
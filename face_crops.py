@@ -0,0 +1,77 @@
+"""
+Face Crops - Cắt khuôn mặt đã detect (Haar) để đưa thẳng vào model embedding
+- Không chạy lại detection bên trong DeepFace, không xử lý cả frame full-res
+- Tùy chọn căn chỉnh theo 2 mắt (giống detector opencv của DeepFace)
+- Mỗi khuôn mặt trong frame -> 1 crop, cả frame embed trong 1 batch
+  (EmbeddingModelService.embed)
+"""
+import cv2
+import numpy as np
+
+
+EYE_CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_eye.xml'
+ALIGN_CROPS = True
+ALIGN_CONTEXT = 0.2  # Lấy rộng thêm 20% quanh box khi xoay để không bị viền đen
+
+_eye_cascade = None
+
+
+def get_eye_cascade():
+    global _eye_cascade
+    if _eye_cascade is None:
+        _eye_cascade = cv2.CascadeClassifier(EYE_CASCADE_PATH)
+    return _eye_cascade
+
+
+def find_eyes(face_img):
+    """
+    Tìm 2 mắt trong ảnh khuôn mặt (BGR).
+    Returns: ((x, y), (x, y)) theo thứ tự trái -> phải trong ảnh, hoặc None
+    """
+    gray = cv2.cvtColor(face_img, cv2.COLOR_BGR2GRAY)
+    eyes = get_eye_cascade().detectMultiScale(gray, 1.1, 10)
+    if len(eyes) < 2:
+        return None
+
+    # 2 vùng lớn nhất là 2 mắt
+    eyes = sorted(eyes, key=lambda e: e[2] * e[3], reverse=True)[:2]
+    centers = sorted((x + w / 2, y + h / 2) for (x, y, w, h) in eyes)
+    return centers[0], centers[1]
+
+
+def align_face(frame, box, context=ALIGN_CONTEXT):
+    """
+    Xoay vùng quanh box sao cho 2 mắt nằm ngang rồi cắt lại đúng box.
+    Không tìm thấy mắt -> trả về crop thường.
+    """
+    x, y, w, h = box
+    frame_h, frame_w = frame.shape[:2]
+    pad_x, pad_y = int(w * context), int(h * context)
+    x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+    x1, y1 = min(frame_w, x + w + pad_x), min(frame_h, y + h + pad_y)
+    region = frame[y0:y1, x0:x1]
+
+    # Mắt được tìm trong box gốc (toạ độ đổi sang region)
+    eyes = find_eyes(frame[y:y + h, x:x + w])
+    if eyes is None:
+        return frame[y:y + h, x:x + w]
+
+    (lx, ly), (rx, ry) = eyes
+    angle = float(np.degrees(np.arctan2(ry - ly, rx - lx)))
+    center = (x - x0 + w / 2, y - y0 + h / 2)
+    matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
+    rotated = cv2.warpAffine(region, matrix, (region.shape[1], region.shape[0]))
+    return rotated[y - y0:y - y0 + h, x - x0:x - x0 + w]
+
+
+def extract_face_crops(frame, boxes, align=ALIGN_CROPS):
+    """Crop BGR uint8 cho từng box (x, y, w, h) của detector"""
+    crops = []
+    for (x, y, w, h) in boxes:
+        box = (int(x), int(y), int(w), int(h))
+        if align:
+            crops.append(align_face(frame, box))
+        else:
+            crops.append(frame[box[1]:box[1] + box[3], box[0]:box[0] + box[2]])
+    return crops
+
@@ -0,0 +1,172 @@
+"""
+Face Detection - Bước detect khuôn mặt có thể cấu hình, rẻ hơn Haar full-res mỗi frame
+- Detect trên frame thu nhỏ (chiều rộng tối đa DETECT_WIDTH) rồi map box về
+- Quét cả frame mỗi N frame; các frame giữa chỉ quét ROI quanh box trước đó
+- Backend: Haar cascade (mặc định) hoặc DNN SSD ResNet-10 của OpenCV
+  (cần 2 file trong models/, thiếu file -> quay về Haar)
+"""
+import os
+
+import cv2
+import numpy as np
+
+from face_tracker import iou
+
+
+HAAR_CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+HAAR_SCALE_FACTOR = 1.1
+HAAR_MIN_NEIGHBORS = 5
+MIN_FACE_SIZE = 100  # Pixel trên frame gốc
+
+DNN_PROTOTXT = os.path.join("models", "deploy.prototxt")
+DNN_MODEL = os.path.join("models", "res10_300x300_ssd_iter_140000.caffemodel")
+DNN_DOWNLOAD = {
+    DNN_PROTOTXT: "https://raw.githubusercontent.com/opencv/opencv/master/"
+                  "samples/dnn/face_detector/deploy.prototxt",
+    DNN_MODEL: "https://raw.githubusercontent.com/opencv/opencv_3rdparty/"
+               "dnn_samples_face_detector_20170830/res10_300x300_ssd_iter_140000.caffemodel",
+}
+DNN_INPUT_SIZE = 300
+DNN_CONFIDENCE = 0.5
+
+DETECT_WIDTH = 640  # Frame rộng hơn được thu nhỏ về chiều rộng này trước khi detect
+DETECT_EVERY_N = 3  # Quét cả frame mỗi N frame
+ROI_MARGIN = 0.5  # ROI = box trước đó nới rộng 50% mỗi phía
+DUPLICATE_IOU = 0.3
+
+
+class HaarBackend:
+    name = "haar"
+
+    def __init__(self, cascade_path=HAAR_CASCADE_PATH):
+        self.cascade = cv2.CascadeClassifier(cascade_path)
+
+    def detect(self, image, min_size):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        min_size = max(1, int(min_size))
+        faces = self.cascade.detectMultiScale(
+            gray,
+            scaleFactor=HAAR_SCALE_FACTOR,
+            minNeighbors=HAAR_MIN_NEIGHBORS,
+            minSize=(min_size, min_size)
+        )
+        return [tuple(int(v) for v in face) for face in faces]
+
+
+class DnnBackend:
+    """SSD ResNet-10 (Caffe) của OpenCV: input cố định 300x300, chịu được mặt nghiêng"""
+    name = "dnn"
+
+    def __init__(self, prototxt=DNN_PROTOTXT, model=DNN_MODEL, confidence=DNN_CONFIDENCE):
+        self.net = cv2.dnn.readNetFromCaffe(prototxt, model)
+        self.confidence = confidence
+
+    def detect(self, image, min_size):
+        h, w = image.shape[:2]
+        blob = cv2.dnn.blobFromImage(image, 1.0, (DNN_INPUT_SIZE, DNN_INPUT_SIZE),
+                                     (104.0, 177.0, 123.0))
+        self.net.setInput(blob)
+        detections = self.net.forward()[0, 0]
+        faces = []
+        for _, _, score, x0, y0, x1, y1 in detections:
+            if score < self.confidence:
+                continue
+            x0, x1 = int(np.clip(x0 * w, 0, w)), int(np.clip(x1 * w, 0, w))
+            y0, y1 = int(np.clip(y0 * h, 0, h)), int(np.clip(y1 * h, 0, h))
+            if min(x1 - x0, y1 - y0) >= min_size:
+                faces.append((x0, y0, x1 - x0, y1 - y0))
+        return faces
+
+
+def dnn_available():
+    return os.path.exists(DNN_PROTOTXT) and os.path.exists(DNN_MODEL)
+
+
+def make_backend(name="haar"):
+    if name == "dnn":
+        if dnn_available():
+            return DnnBackend()
+        print(f"⚠️ Thiếu model DNN ({DNN_PROTOTXT}, {DNN_MODEL}) -> dùng Haar")
+        for path, url in DNN_DOWNLOAD.items():
+            print(f"   Tải {path}: {url}")
+    elif name != "haar":
+        raise ValueError(f"Face detector không hợp lệ: {name}")
+    return HaarBackend()
+
+
+def expand_box(box, margin, frame_w, frame_h):
+    x, y, w, h = box
+    pad_x, pad_y = int(w * margin), int(h * margin)
+    x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+    x1, y1 = min(frame_w, x + w + pad_x), min(frame_h, y + h + pad_y)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def merge_boxes(boxes, threshold=DUPLICATE_IOU):
+    """Bỏ box trùng (ROI của 2 khuôn mặt gần nhau có thể cùng thấy 1 mặt)"""
+    merged = []
+    for box in sorted(boxes, key=lambda b: b[2] * b[3], reverse=True):
+        if all(iou(box, kept) < threshold for kept in merged):
+            merged.append(box)
+    return merged
+
+
+class FaceDetector:
+    """
+    Detect theo nhịp: frame 0, N, 2N... quét cả frame; frame khác quét ROI quanh
+    box trước (roi=True) hoặc giữ nguyên box trước (roi=False).
+    Có trạng thái -> mỗi luồng video dùng 1 instance.
+    """
+
+    def __init__(self, backend="haar", detect_width=DETECT_WIDTH, every_n=DETECT_EVERY_N,
+                 roi=True, min_face_size=MIN_FACE_SIZE, roi_margin=ROI_MARGIN):
+        self.backend = make_backend(backend) if isinstance(backend, str) else backend
+        self.detect_width = detect_width
+        self.every_n = max(1, every_n)
+        self.roi = roi
+        self.min_face_size = min_face_size
+        self.roi_margin = roi_margin
+
+        self.frame_index = 0
+        self.boxes = []
+        self.full_scans = 0
+        self.roi_scans = 0
+
+    def _scale_for(self, width):
+        if self.detect_width and width > self.detect_width:
+            return self.detect_width / float(width)
+        return 1.0
+
+    def _detect_region(self, frame, region):
+        """Detect trong region (x, y, w, h) của frame gốc, trả về box toạ độ gốc"""
+        x, y, w, h = region
+        image = frame[y:y + h, x:x + w]
+        scale = self._scale_for(frame.shape[1])
+        if scale != 1.0:
+            image = cv2.resize(image, (max(1, int(w * scale)), max(1, int(h * scale))),
+                               interpolation=cv2.INTER_AREA)
+        faces = self.backend.detect(image, self.min_face_size * scale)
+        return [(int(fx / scale) + x, int(fy / scale) + y, int(fw / scale), int(fh / scale))
+                for fx, fy, fw, fh in faces]
+
+    def detect(self, frame):
+        """Returns: danh sách box (x, y, w, h) trên frame gốc"""
+        frame_h, frame_w = frame.shape[:2]
+        full_scan = self.frame_index % self.every_n == 0 or not self.boxes
+        self.frame_index += 1
+
+        if full_scan:
+            self.full_scans += 1
+            self.boxes = self._detect_region(frame, (0, 0, frame_w, frame_h))
+        elif self.roi:
+            self.roi_scans += 1
+            found = []
+            for box in self.boxes:
+                region = expand_box(box, self.roi_margin, frame_w, frame_h)
+                found.extend(self._detect_region(frame, region))
+            self.boxes = merge_boxes(found)
+        return list(self.boxes)
+
+    def reset(self):
+        self.frame_index = 0
+        self.boxes = []
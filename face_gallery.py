@@ -0,0 +1,250 @@
+"""
+Face Gallery - Ma trận embeddings dựng sẵn cho recognize_face
+- Một ma trận float32 liên tục (N x D) cho toàn bộ ảnh tham chiếu
+- Mảng nhãn song song (chỉ số người) và norm bình phương tính trước
+- Khớp = 1 phép tính khoảng cách theo batch + segment-min theo người
+- CentroidGallery (chế độ cosine): vector chuẩn hoá L2, mỗi người 1 tâm + vài
+  ảnh đại diện, so tâm trước rồi xếp hạng lại top-k, ngưỡng riêng từng người
+"""
+import numpy as np
+
+
+# Hệ số dung sai khi lọc ứng viên bằng float32 (đủ lớn để bao sai số làm tròn)
+SCREEN_TOLERANCE = 1e-4
+
+# Chế độ cosine: distance = 1 - cosine
+COSINE_THRESHOLD = 0.40  # Ngưỡng mặc định (giá trị DeepFace dùng cho Facenet + cosine)
+COSINE_THRESHOLD_MIN = 0.25
+COSINE_THRESHOLD_MAX = 0.55
+SPREAD_K = 3.0  # Ngưỡng riêng = trung bình + SPREAD_K * độ lệch chuẩn của distance tới tâm
+MIN_CALIBRATION_PHOTOS = 3  # Ít ảnh hơn -> dùng ngưỡng mặc định
+EXEMPLARS_PER_PERSON = 3
+TOP_K = 5  # Số người (theo tâm) được xếp hạng lại bằng ảnh đại diện
+
+
+def l2_normalize(matrix):
+    """Chuẩn hoá từng hàng về độ dài 1 (float32)"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class FaceGallery:
+    """Gallery bất biến, build 1 lần sau load_known_faces"""
+
+    def __init__(self, names, matrix, labels, filenames=None, exact=None):
+        self.names = list(names)
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        self.labels = np.ascontiguousarray(labels, dtype=np.int32)
+        self.filenames = list(filenames) if filenames is not None else []
+
+        # Norm bình phương tính trước (float64 -> float32 để giảm sai số)
+        self.sq_norms = np.einsum(
+            'ij,ij->i', self.matrix.astype(np.float64), self.matrix.astype(np.float64)
+        ).astype(np.float32)
+        self._max_sq_norm = float(self.sq_norms.max()) if len(self.sq_norms) else 0.0
+
+        # Vị trí bắt đầu của từng người (các hàng đã được nhóm liên tiếp theo nhãn)
+        self._offsets = np.flatnonzero(
+            np.r_[True, self.labels[1:] != self.labels[:-1]]
+        ) if len(self.labels) else np.zeros(0, dtype=np.intp)
+
+        # Bản float64 chỉ giữ khi float32 làm mất thông tin (cache cũ không phải float32)
+        self._exact = exact
+
+    @classmethod
+    def from_embeddings(cls, known_embeddings):
+        """
+        Build gallery từ dict của load_known_faces: {filename: (name, embedding, mtime)}
+        Thứ tự hàng giống hệt thứ tự duyệt của vòng lặp cũ
+        (người theo lần xuất hiện đầu tiên, ảnh theo thứ tự trong dict)
+        """
+        groups = {}
+        for filename, (name, embedding, _) in known_embeddings.items():
+            groups.setdefault(name, []).append((filename, embedding))
+
+        names = list(groups.keys())
+        filenames = []
+        rows = []
+        labels = []
+        for label, name in enumerate(names):
+            for filename, embedding in groups[name]:
+                filenames.append(filename)
+                rows.append(embedding)
+                labels.append(label)
+
+        if not rows:
+            return cls([], np.zeros((0, 0), dtype=np.float32), [], [])
+
+        matrix64 = np.asarray(rows, dtype=np.float64)
+        matrix32 = matrix64.astype(np.float32)
+        exact = None if np.array_equal(matrix32, matrix64) else matrix64
+        return cls(names, matrix32, labels, filenames, exact=exact)
+
+    @property
+    def size(self):
+        return len(self.labels)
+
+    def __len__(self):
+        return self.size
+
+    def _reference(self, row):
+        """Embedding tham chiếu dạng float64 (giống np.array(list) trong code cũ)"""
+        if self._exact is not None:
+            return self._exact[row]
+        return self.matrix[row].astype(np.float64)
+
+    def match(self, face_embedding, threshold):
+        """
+        Tìm người gần nhất theo khoảng cách L2.
+        Kết quả (tên, distance) giống bit-for-bit vòng lặp cũ:
+        lọc ứng viên bằng float32, rồi tính lại chính xác bằng float64.
+        Returns: (name hoặc "Unknown", min_distance)
+        """
+        if self.size == 0:
+            return "Unknown", float('inf')
+
+        probe64 = np.asarray(face_embedding, dtype=np.float64)
+        probe = probe64.astype(np.float32)
+        probe_sq = float(np.dot(probe, probe))
+
+        # ||q - m||^2 = ||m||^2 - 2 q.m + ||q||^2 cho mọi hàng cùng lúc
+        dist_sq = self.matrix @ probe
+        dist_sq *= -2.0
+        dist_sq += self.sq_norms
+        dist_sq += probe_sq
+
+        # Segment-min theo người
+        person_min = np.minimum.reduceat(dist_sq, self._offsets)
+        best_sq = float(person_min.min())
+
+        # Các hàng có thể là min thật, tính lại chính xác theo đúng thứ tự cũ
+        tolerance = SCREEN_TOLERANCE * (probe_sq + self._max_sq_norm)
+        candidates = np.flatnonzero(dist_sq <= best_sq + tolerance)
+
+        best_match = None
+        min_distance = float('inf')
+        for row in candidates:
+            distance = np.linalg.norm(probe64 - self._reference(row))
+            if distance < min_distance:
+                min_distance = distance
+                best_match = self.names[self.labels[row]]
+
+        if min_distance < threshold:
+            return best_match, min_distance
+        else:
+            return "Unknown", min_distance
+
+
+def select_exemplars(vectors, centroid, n):
+    """
+    Chọn n ảnh đại diện (vector đã chuẩn hoá): ảnh gần tâm nhất, rồi lần lượt
+    ảnh xa nhất so với các ảnh đã chọn -> bao được các góc mặt/ánh sáng khác nhau
+    """
+    if len(vectors) <= n:
+        return vectors
+    chosen = [int(np.argmax(vectors @ centroid))]
+    nearest = 1.0 - vectors @ vectors[chosen[0]]
+    while len(chosen) < n:
+        index = int(np.argmax(nearest))
+        chosen.append(index)
+        np.minimum(nearest, 1.0 - vectors @ vectors[index], out=nearest)
+    return vectors[chosen]
+
+
+def calibrate_threshold(vectors, default=COSINE_THRESHOLD):
+    """
+    Ngưỡng riêng theo độ phân tán trong lớp: distance của mỗi ảnh tới tâm của
+    các ảnh còn lại (leave-one-out, giống 1 probe mới chưa có trong gallery)
+    """
+    if len(vectors) < MIN_CALIBRATION_PHOTOS:
+        return default
+    others = l2_normalize(vectors.sum(axis=0) - vectors)
+    distances = 1.0 - np.einsum('ij,ij->i', vectors, others)
+    threshold = float(distances.mean() + SPREAD_K * distances.std())
+    return min(max(threshold, COSINE_THRESHOLD_MIN), COSINE_THRESHOLD_MAX)
+
+
+class CentroidGallery:
+    """
+    Gallery cosine: mỗi lần khớp so với P tâm + top_k * EXEMPLARS_PER_PERSON ảnh
+    thay vì toàn bộ N ảnh. Distance trả về là 1 - cosine.
+    """
+    metric = "cosine"
+
+    def __init__(self, names, centroids, exemplars, thresholds, n_photos=0, top_k=TOP_K):
+        """exemplars: (P, E, D), người ít ảnh hơn E được đệm bằng chính tâm của họ"""
+        self.names = list(names)
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.exemplars = np.ascontiguousarray(exemplars, dtype=np.float32)
+        self.thresholds = np.asarray(thresholds, dtype=np.float64)
+        self.n_photos = n_photos
+        self.top_k = top_k
+        self._index = {name: i for i, name in enumerate(self.names)}
+
+    @classmethod
+    def from_embeddings(cls, known_embeddings, n_exemplars=EXEMPLARS_PER_PERSON,
+                        top_k=TOP_K, default_threshold=COSINE_THRESHOLD):
+        """Build từ dict của load_known_faces; chuẩn hoá L2 1 lần ở đây"""
+        groups = {}
+        for _, (name, embedding, _) in known_embeddings.items():
+            groups.setdefault(name, []).append(embedding)
+
+        names, centroids, exemplars, thresholds = [], [], [], []
+        for name, rows in groups.items():
+            vectors = l2_normalize(rows)
+            centroid = l2_normalize(vectors.mean(axis=0))
+            chosen = select_exemplars(vectors, centroid, n_exemplars)
+            padding = np.repeat(centroid[None], n_exemplars - len(chosen), axis=0)
+
+            names.append(name)
+            centroids.append(centroid)
+            exemplars.append(np.concatenate([chosen, padding]))
+            thresholds.append(calibrate_threshold(vectors, default_threshold))
+
+        if not names:
+            return cls([], np.zeros((0, 0)), np.zeros((0, n_exemplars, 0)), [], 0, top_k)
+        return cls(names, np.stack(centroids), np.stack(exemplars), thresholds,
+                   n_photos=len(known_embeddings), top_k=top_k)
+
+    @property
+    def size(self):
+        return self.n_photos
+
+    def __len__(self):
+        return self.size
+
+    def threshold_of(self, name):
+        index = self._index.get(name)
+        return float(self.thresholds[index]) if index is not None else COSINE_THRESHOLD
+
+    def comparisons_per_match(self):
+        """Số phép so sánh vector cho 1 lần khớp (tâm + ảnh đại diện của top-k)"""
+        return len(self.names) + min(self.top_k, len(self.names)) * self.exemplars.shape[1]
+
+    def match(self, face_embedding, threshold=None):
+        """
+        threshold: None -> ngưỡng riêng của người gần nhất; số -> ngưỡng chung
+        Returns: (name hoặc "Unknown", distance = 1 - cosine)
+        """
+        if not self.names:
+            return "Unknown", float('inf')
+
+        probe = l2_normalize(face_embedding)
+        centroid_scores = self.centroids @ probe
+        k = min(self.top_k, len(self.names))
+        if k < len(self.names):
+            top = np.argpartition(-centroid_scores, k - 1)[:k]
+        else:
+            top = np.arange(len(self.names))
+
+        # Xếp hạng lại: điểm của người = max(cosine với tâm, với các ảnh đại diện)
+        scores = np.maximum(centroid_scores[top], (self.exemplars[top] @ probe).max(axis=1))
+        best = int(np.argmax(scores))
+        best_label = int(top[best])
+
+        distance = 1.0 - float(scores[best])
+        limit = self.thresholds[best_label] if threshold is None else threshold
+        if distance < limit:
+            return self.names[best_label], distance
+        return "Unknown", distance
@@ -0,0 +1,399 @@
+"""
+Face Index - Tìm kiếm láng giềng gần đúng (ANN) cho gallery lớn
+- IVF: coarse quantizer bằng k-means (NumPy thuần), chỉ quét n_probe danh sách gần nhất
+- Thêm/xóa tăng dần theo filename khi ảnh trong known_faces/ thay đổi
+- Lưu cạnh face_embeddings.pkl, tự đồng bộ với cache khi khởi động
+  (so cả vector, không chỉ mtime; đổi model key -> build lại từ đầu)
+- Exact fallback bằng FaceGallery (gallery nhỏ hoặc kết quả ANN là Unknown)
+"""
+import os
+
+import numpy as np
+
+from face_gallery import FaceGallery, CentroidGallery
+
+
+# Dưới ngưỡng này quét toàn bộ nhanh hơn IVF -> luôn dùng exact
+IVF_MIN_SIZE = 2000
+# Số danh sách quét mỗi lần tìm (núm chỉnh recall/latency)
+DEFAULT_N_PROBE = 8
+KMEANS_ITERATIONS = 10
+KMEANS_MAX_SAMPLES = 50_000
+# Train lại centroids khi gallery lớn gấp đôi so với lúc train
+RETRAIN_GROWTH = 2.0
+
+
+def default_index_file(embeddings_file):
+    """face_embeddings.pkl -> face_embeddings_ivf.npz (cùng thư mục)"""
+    return os.path.splitext(embeddings_file)[0] + "_ivf.npz"
+
+
+def _nearest_centroid(data, centroids, chunk=16384):
+    """Chỉ số centroid gần nhất cho từng hàng (tính theo từng khối để giới hạn RAM)"""
+    c_sq = np.einsum('ij,ij->i', centroids, centroids)
+    assign = np.empty(len(data), dtype=np.int32)
+    for start in range(0, len(data), chunk):
+        block = data[start:start + chunk]
+        dist = c_sq - 2.0 * (block @ centroids.T)
+        assign[start:start + chunk] = np.argmin(dist, axis=1)
+    return assign
+
+
+def train_kmeans(data, n_lists, n_iter=KMEANS_ITERATIONS, seed=0):
+    """K-means (Lloyd) trên mẫu ngẫu nhiên của gallery"""
+    rng = np.random.default_rng(seed)
+    data = np.asarray(data, dtype=np.float32)
+    if len(data) > KMEANS_MAX_SAMPLES:
+        data = data[rng.choice(len(data), KMEANS_MAX_SAMPLES, replace=False)]
+    n_lists = max(1, min(n_lists, len(data)))
+
+    centroids = data[rng.choice(len(data), n_lists, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = _nearest_centroid(data, centroids)
+        counts = np.bincount(assign, minlength=n_lists)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Danh sách rỗng -> gieo lại từ điểm ngẫu nhiên
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted File Index trên embeddings Facenet.
+    API giống FaceGallery: match(face_embedding, threshold) -> (name, distance)
+    """
+
+    def __init__(self, n_probe=DEFAULT_N_PROBE, n_lists=None, exact_fallback=True,
+                 min_size=IVF_MIN_SIZE, dim=None, model_key=None):
+        self.n_probe = n_probe
+        self.model_key = model_key
+        self.n_lists = n_lists
+        self.exact_fallback = exact_fallback
+        self.min_size = min_size
+
+        self.dim = dim
+        self.centroids = None
+        self.trained_size = 0
+
+        # Hàng lưu trong mảng tăng dần, hàng bị xóa được đánh dấu (tombstone)
+        self._vectors = np.zeros((0, dim or 0), dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._assign = np.zeros(0, dtype=np.int32)
+        self._count = 0
+        self._names = []
+        self._filenames = []
+        self._mtimes = []
+        self._row_of = {}
+
+        self._lists = []
+        self._list_cache = {}
+        self._exact_gallery = None
+        self.dirty = False
+
+    # ---------------------------
+    # Thông tin
+    # ---------------------------
+    def __len__(self):
+        return len(self._row_of)
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def _use_exact(self):
+        return (not self.is_trained or len(self) < self.min_size
+                or self.n_probe >= len(self.centroids))
+
+    # ---------------------------
+    # Thêm / xóa
+    # ---------------------------
+    def _grow(self, needed):
+        capacity = len(self._vectors)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 64)
+        vectors = np.zeros((new_capacity, self.dim), dtype=np.float32)
+        vectors[:self._count] = self._vectors[:self._count]
+        alive = np.zeros(new_capacity, dtype=bool)
+        alive[:self._count] = self._alive[:self._count]
+        assign = np.zeros(new_capacity, dtype=np.int32)
+        assign[:self._count] = self._assign[:self._count]
+        self._vectors, self._alive, self._assign = vectors, alive, assign
+
+    def add(self, filename, name, embedding, mtime=None):
+        """Thêm (hoặc thay thế) embedding của 1 file"""
+        if filename in self._row_of:
+            self.remove(filename)
+
+        vector = np.asarray(embedding, dtype=np.float32)
+        if self.dim is None:
+            self.dim = len(vector)
+            self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self._grow(self._count + 1)
+
+        row = self._count
+        self._count += 1
+        self._vectors[row] = vector
+        self._alive[row] = True
+        self._names.append(name)
+        self._filenames.append(filename)
+        self._mtimes.append(mtime)
+        self._row_of[filename] = row
+
+        if self.is_trained:
+            list_id = int(_nearest_centroid(vector[None, :], self.centroids)[0])
+            self._assign[row] = list_id
+            self._lists[list_id].append(row)
+            self._list_cache.pop(list_id, None)
+
+        self._exact_gallery = None
+        self.dirty = True
+
+    def remove(self, filename):
+        """Xóa embedding của 1 file (tombstone, dọn khi save)"""
+        row = self._row_of.pop(filename, None)
+        if row is None:
+            return False
+        self._alive[row] = False
+        if self.is_trained:
+            list_id = int(self._assign[row])
+            self._lists[list_id].remove(row)
+            self._list_cache.pop(list_id, None)
+        self._exact_gallery = None
+        self.dirty = True
+        return True
+
+    def sync(self, known_embeddings):
+        """
+        Đồng bộ với dict của load_known_faces: thêm file mới/đã sửa, xóa file đã mất.
+        Hàng cũ chỉ được giữ khi tên, mtime VÀ vector đều khớp (force_reload, compact
+        store hay link lại có thể cho vector khác với cùng file/mtime).
+        Returns: (added, removed)
+        """
+        added = removed = 0
+        for filename in list(self._row_of):
+            if filename not in known_embeddings:
+                self.remove(filename)
+                removed += 1
+
+        changed, kept = [], []
+        for filename, (name, _, mtime) in known_embeddings.items():
+            row = self._row_of.get(filename)
+            if row is not None and self._mtimes[row] == mtime and self._names[row] == name:
+                kept.append((filename, row))
+            else:
+                changed.append(filename)
+        if kept:
+            rows = np.fromiter((row for _, row in kept), dtype=np.int64, count=len(kept))
+            incoming = np.asarray([known_embeddings[f][1] for f, _ in kept], dtype=np.float32)
+            same = (self._vectors[rows] == incoming).all(axis=1)
+            changed.extend(f for (f, _), ok in zip(kept, same) if not ok)
+
+        for filename in changed:
+            name, embedding, mtime = known_embeddings[filename]
+            self.add(filename, name, embedding, mtime)
+            added += 1
+
+        # Quá nửa vector đổi -> centroids cũ không còn đại diện, train lại
+        if self.needs_training() or (self.is_trained and added > len(self) // 2):
+            self.train()
+        return added, removed
+
+    # ---------------------------
+    # Train
+    # ---------------------------
+    def needs_training(self):
+        if len(self) < self.min_size:
+            return False
+        if not self.is_trained:
+            return True
+        return len(self) > self.trained_size * RETRAIN_GROWTH
+
+    def train(self, seed=0):
+        """Train coarse quantizer và phân bổ lại toàn bộ hàng vào danh sách"""
+        self.compact()
+        if self._count == 0:
+            return
+        n_lists = self.n_lists or int(4 * np.sqrt(self._count))
+        vectors = self._vectors[:self._count]
+        self.centroids = train_kmeans(vectors, n_lists, seed=seed)
+        self.trained_size = self._count
+        self._reassign()
+        self.dirty = True
+
+    def _reassign(self):
+        vectors = self._vectors[:self._count]
+        self._assign[:self._count] = _nearest_centroid(vectors, self.centroids)
+        self._lists = [[] for _ in range(len(self.centroids))]
+        for row in np.flatnonzero(self._alive[:self._count]):
+            self._lists[self._assign[row]].append(int(row))
+        self._list_cache = {}
+
+    def compact(self):
+        """Dọn các hàng đã xóa (tombstone)"""
+        rows = np.flatnonzero(self._alive[:self._count])
+        if len(rows) == self._count:
+            return
+        self._vectors = self._vectors[rows].copy()
+        self._assign = self._assign[rows].copy()
+        self._alive = np.ones(len(rows), dtype=bool)
+        self._names = [self._names[r] for r in rows]
+        self._filenames = [self._filenames[r] for r in rows]
+        self._mtimes = [self._mtimes[r] for r in rows]
+        self._count = len(rows)
+        self._row_of = {filename: i for i, filename in enumerate(self._filenames)}
+        if self.is_trained:
+            self._reassign()
+        self._exact_gallery = None
+
+    # ---------------------------
+    # Tìm kiếm
+    # ---------------------------
+    def _list_rows(self, list_id):
+        rows = self._list_cache.get(list_id)
+        if rows is None:
+            rows = np.asarray(self._lists[list_id], dtype=np.intp)
+            self._list_cache[list_id] = rows
+        return rows
+
+    def exact_gallery(self):
+        """FaceGallery của các hàng còn sống (exact search)"""
+        if self._exact_gallery is None:
+            known = {
+                self._filenames[row]: (self._names[row], self._vectors[row], self._mtimes[row])
+                for row in np.flatnonzero(self._alive[:self._count])
+            }
+            self._exact_gallery = FaceGallery.from_embeddings(known)
+        return self._exact_gallery
+
+    def search(self, face_embedding, n_probe=None):
+        """
+        Tìm hàng gần nhất bằng IVF.
+        Returns: (row, distance) hoặc (None, inf) nếu không có ứng viên
+        """
+        n_probe = n_probe or self.n_probe
+        probe64 = np.asarray(face_embedding, dtype=np.float64)
+        probe = probe64.astype(np.float32)
+
+        centroid_dist = self.centroids @ probe
+        centroid_dist *= -2.0
+        centroid_dist += np.einsum('ij,ij->i', self.centroids, self.centroids)
+        if n_probe < len(self.centroids):
+            lists = np.argpartition(centroid_dist, n_probe - 1)[:n_probe]
+        else:
+            lists = range(len(self.centroids))
+
+        rows = [self._list_rows(list_id) for list_id in lists]
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.intp)
+        if len(rows) == 0:
+            return None, float('inf')
+
+        candidates = self._vectors[rows]
+        dist_sq = np.einsum('ij,ij->i', candidates, candidates) - 2.0 * (candidates @ probe)
+        row = int(rows[np.argmin(dist_sq)])
+        distance = np.linalg.norm(probe64 - self._vectors[row].astype(np.float64))
+        return row, distance
+
+    def match(self, face_embedding, threshold):
+        """Giống FaceGallery.match; dùng exact khi gallery nhỏ hoặc ANN trả về Unknown"""
+        if len(self) == 0:
+            return "Unknown", float('inf')
+        if self._use_exact():
+            return self.exact_gallery().match(face_embedding, threshold)
+
+        row, distance = self.search(face_embedding)
+        if row is not None and distance < threshold:
+            return self._names[row], distance
+        if self.exact_fallback:
+            return self.exact_gallery().match(face_embedding, threshold)
+        return "Unknown", distance
+
+    # ---------------------------
+    # Lưu / load
+    # ---------------------------
+    def save(self, path):
+        """Ghi index ra file .npz (ghi file tạm rồi os.replace)"""
+        self.compact()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                vectors=self._vectors[:self._count],
+                names=np.array(self._names, dtype=str),
+                filenames=np.array(self._filenames, dtype=str),
+                mtimes=np.array([m if m is not None else np.nan for m in self._mtimes],
+                                dtype=np.float64),
+                centroids=(self.centroids if self.is_trained
+                           else np.zeros((0, self.dim or 0), dtype=np.float32)),
+                trained_size=np.int64(self.trained_size),
+                model_key=np.array(self.model_key or "", dtype=str),
+            )
+        os.replace(tmp_path, path)
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        index = cls(**kwargs)
+        with np.load(path, allow_pickle=False) as data:
+            vectors = data['vectors']
+            index.dim = vectors.shape[1]
+            index._vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+            index._count = len(vectors)
+            index._alive = np.ones(index._count, dtype=bool)
+            index._assign = np.zeros(index._count, dtype=np.int32)
+            index._names = [str(n) for n in data['names']]
+            index._filenames = [str(f) for f in data['filenames']]
+            index._mtimes = [None if np.isnan(m) else float(m) for m in data['mtimes']]
+            index._row_of = {f: i for i, f in enumerate(index._filenames)}
+            # File cũ chưa lưu model key -> None, không khớp key nào -> build lại
+            index.model_key = str(data['model_key']) if 'model_key' in data else None
+            if len(data['centroids']):
+                index.centroids = np.ascontiguousarray(data['centroids'], dtype=np.float32)
+                index.trained_size = int(data['trained_size'])
+                index._reassign()
+        return index
+
+
+def build_face_index(known_embeddings, backend="exact", index_file=None,
+                     n_probe=DEFAULT_N_PROBE, model_key=None):
+    """
+    Tạo backend tìm kiếm cho recognize_face.
+    backend: "exact" (FaceGallery), "ivf" (IVFIndex, lưu ở index_file)
+    hoặc "centroid" (CentroidGallery, so khớp cosine + ngưỡng riêng từng người)
+    model_key: model tính ra known_embeddings; index đã lưu bằng model khác bị bỏ
+    """
+    if backend == "exact":
+        return FaceGallery.from_embeddings(known_embeddings)
+    if backend == "centroid":
+        return CentroidGallery.from_embeddings(known_embeddings)
+    if backend != "ivf":
+        raise ValueError(f"Backend không hợp lệ: {backend}")
+
+    index = None
+    if index_file and os.path.exists(index_file):
+        try:
+            index = IVFIndex.load(index_file, n_probe=n_probe)
+        except Exception as e:
+            print(f"⚠️ Không đọc được index {index_file}: {e} -> build lại")
+    if index is not None:
+        dim = len(next(iter(known_embeddings.values()))[1]) if known_embeddings else index.dim
+        if index.model_key != model_key or index.dim != dim:
+            print(f"🔄 Index IVF tính bằng model khác ({index.model_key} -> {model_key}) "
+                  f"-> build lại")
+            index = None
+    if index is None:
+        index = IVFIndex(n_probe=n_probe, model_key=model_key)
+
+    added, removed = index.sync(known_embeddings)
+    if added or removed:
+        print(f"🔄 Index IVF: +{added} / -{removed} ảnh")
+    if index_file and index.dirty:
+        index.save(index_file)
+        print(f"💾 Đã lưu index IVF ({len(index)} ảnh) vào {index_file}")
+    return index
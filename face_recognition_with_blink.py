@@ -2,176 +2,521 @@
 Hệ thống điểm danh nhận diện khuôn mặt với Blink Detection
 Chống video replay bằng thử thách nhấp nháy mắt ngẫu nhiên
 """
+import time
+_IMPORT_START = time.perf_counter()  # Mốc 0 của báo cáo khởi động
+
 import cv2
 import numpy as np
 import os
-import pickle
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import re
+from collections import namedtuple
 
-# Lazy import để tránh conflict
-def get_deepface():
-    """Lazy import DeepFace"""
-    from deepface import DeepFace
-    return DeepFace
+from face_gallery import FaceGallery, COSINE_THRESHOLD
+from face_index import build_face_index, default_index_file
+from enrollment import (
+    EnrollmentJob, enroll_images, load_embedding_model,
+    ENROLL_WORKERS, ENROLL_BATCH_SIZE, MODEL_KEY
+)
+from face_crops import extract_face_crops
+from frame_pipeline import FramePipeline
+from face_tracker import IoUTracker, EmbedScheduler, iou
+from face_detection import FaceDetector
+from embedding_store import open_store, file_hash
+from attendance_store import open_attendance_store
+from face_watcher import (
+    KnownFacesWatcher, DirectorySnapshot, LiveGallery, scan_directory, directory_mtime
+)
+import instrumentation
+from instrumentation import timed, timer, count, observe
+from startup import Startup, format_report
 
 # Import module advanced liveness detection
 try:
-    from advanced_liveness_module import perform_advanced_liveness_challenge, MEDIAPIPE_AVAILABLE
+    from advanced_liveness_module import (
+        LivenessSession, get_liveness_detector, close_liveness_detector,
+        print_challenge_prompt, print_challenge_result, MEDIAPIPE_AVAILABLE, PREPARING
+    )
     LIVENESS_DETECTION_ENABLED = MEDIAPIPE_AVAILABLE
 except ImportError:
     LIVENESS_DETECTION_ENABLED = False
     print("⚠️ Module advanced_liveness_module không tìm thấy")
 
+_IMPORT_END = time.perf_counter()
+
 
 # ===========================
 # CONSTANTS
 # ===========================
 KNOWN_FACES_DIR = "known_faces"
-EMBEDDINGS_FILE = "face_embeddings.pkl"
+EMBEDDINGS_FILE = "face_embeddings.pkl"  # Cache pickle cũ (chỉ dùng để migrate)
+EMBEDDINGS_STORE = "face_embeddings"  # face_embeddings.manifest.jsonl + .f32 (memmap)
+KNOWN_FACES_SNAPSHOT = "face_embeddings.snapshot.json"  # Trạng thái known_faces/ lần quét trước
+WATCH_KNOWN_FACES = True  # Theo dõi known_faces/ khi đang chạy, cập nhật gallery không cần restart
+WATCH_INOTIFY = True  # False: luôn dùng polling (ổ mạng, Docker volume... không có inotify)
 ATTENDANCE_FILE = "attendance.csv"
+ATTENDANCE_BACKEND = "csv"  # "csv" hoặc "sqlite" (attendance.db)
+ATTENDANCE_WRITER_ID = None  # Tên WAL của kiosk này khi nhiều máy ghi chung 1 CSV (None = tự chọn)
 THRESHOLD = 8.0  # Ngưỡng phát hiện
+INDEX_BACKEND = "exact"  # "exact" (quét toàn bộ), "ivf" (ANN cho gallery lớn), "centroid" (cosine)
+INDEX_FILE = default_index_file(EMBEDDINGS_FILE)
+IVF_N_PROBE = 8  # Tăng để recall cao hơn, giảm để nhanh hơn
 HAAR_CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+FACE_DETECTOR = "haar"  # "haar" hoặc "dnn" (cần model trong models/, xem face_detection.py)
+DETECT_WIDTH = 640  # Detect trên frame thu nhỏ về chiều rộng này (None = giữ nguyên)
+DETECT_EVERY_N = 3  # Quét cả frame mỗi N lần detect, giữa các lần chỉ quét ROI
+DETECT_ROI = True  # False: giữa các lần quét cả frame giữ nguyên box cũ
+AUTO_MODE = False  # Tự động nhận diện theo track (phím 'a' để bật/tắt)
+REEMBED_INTERVAL = 3.0  # Chế độ tự động: embed lại mỗi track sau N giây
+BORDERLINE_MARGIN = 1.0  # Chế độ tự động: embed lại khi |distance - THRESHOLD| < N
+COSINE_BORDERLINE_MARGIN = 0.05  # Như trên cho INDEX_BACKEND = "centroid" (distance cosine)
+AUTO_LOG_ATTENDANCE = False  # True: chế độ tự động ghi điểm danh (không qua liveness)
+LIVENESS_FACE_IOU = 0.3  # Box Haar phải trùng box FaceMesh của thử thách tối thiểu chừng này
 
 
 # ===========================
 # LOAD KNOWN FACES
 # ===========================
-def load_known_faces(force_reload=False):
+def _hash_or_none(filepath):
+    """SHA-1 nội dung ảnh, None nếu ảnh không còn / không đọc được"""
+    try:
+        return file_hash(filepath)
+    except OSError:
+        return None
+
+
+def load_known_faces(force_reload=False, changes=None):
     """
     Load embeddings của các khuôn mặt đã biết.
     Tự động phát hiện ảnh mới và cập nhật cache.
     Hỗ trợ nhiều ảnh cho mỗi người: user_a.jpg, user_a_1.jpg, user_a_2.jpg
+    Cache là store memmap: chỉ nối thêm/đánh dấu xóa các ảnh thay đổi.
+    Khóa cache = nội dung ảnh (SHA-1) + model key: copy/restore/đổi tên ảnh
+    không phải tính lại, đổi model chỉ tính lại các vector của model cũ.
+    Thư mục không đổi từ lần quét trước (snapshot) -> không liệt kê lại.
+    changes: {filename: (mtime, size) hoặc None nếu đã xóa} từ KnownFacesWatcher
+    -> chỉ xử lý các ảnh này
     """
-    embeddings = {}
-    
-    # Kiểm tra cache
-    if os.path.exists(EMBEDDINGS_FILE) and not force_reload:
-        with open(EMBEDDINGS_FILE, 'rb') as f:
-            embeddings = pickle.load(f)
-        print(f"✅ Đã load {len(embeddings)} embeddings từ cache")
+    # Mở store (tự migrate từ face_embeddings.pkl ở lần chạy đầu)
+    store = open_store(EMBEDDINGS_STORE, legacy_pickle=EMBEDDINGS_FILE,
+                       known_faces_dir=KNOWN_FACES_DIR)
+    if len(store) and not force_reload and changes is None:
+        print(f"✅ Đã load {len(store)} embeddings từ cache")
     
-    # Lấy danh sách file hiện tại
-    current_files = {}
-    if os.path.exists(KNOWN_FACES_DIR):
-        for filename in os.listdir(KNOWN_FACES_DIR):
-            if filename.lower().endswith(('.jpg', '.jpeg', '.png')):
-                filepath = os.path.join(KNOWN_FACES_DIR, filename)
-                current_files[filename] = os.path.getmtime(filepath)
+    snapshot = None
+    if changes is not None:
+        # Cập nhật từ watcher: chỉ các ảnh thay đổi
+        current_files = {f: state[0] for f, state in changes.items() if state is not None}
+        for filename, state in changes.items():
+            if state is None and store.remove(filename):
+                print(f"❌ Đã xóa: {filename}")
+    else:
+        previous = None if force_reload else DirectorySnapshot.load(KNOWN_FACES_SNAPSHOT)
+        if (previous is not None and previous.model == MODEL_KEY
+                and previous.matches(KNOWN_FACES_DIR)
+                and previous.files.keys() == {f for f, e in store.entries.items()
+                                              if e.model == MODEL_KEY}):
+            # Không ảnh nào được thêm/xóa/đổi tên; ảnh ghi đè tại chỗ do watcher bắt
+            print("⚡ known_faces không đổi từ lần chạy trước, bỏ qua quét thư mục")
+            known_embeddings = store.known_embeddings(model=MODEL_KEY)
+            store.close()
+            return known_embeddings
+        
+        # mtime thư mục lấy TRƯỚC khi liệt kê: ảnh thêm giữa chừng -> lần sau quét lại
+        snapshot = DirectorySnapshot(directory_mtime(KNOWN_FACES_DIR), model=MODEL_KEY)
+        snapshot.files = scan_directory(KNOWN_FACES_DIR)
+        current_files = {f: state[0] for f, state in snapshot.files.items()}
+        
+        # Kiểm tra file đã xóa
+        for filename in list(store.entries):
+            if filename not in current_files:
+                store.remove(filename)
+                print(f"❌ Đã xóa: {filename}")
     
-    # Kiểm tra file mới hoặc đã sửa
-    need_update = False
+    # Cùng tên file, cùng mtime, cùng model -> tin cache, không cần băm
+    hits = 0
+    to_check = []
     for filename, mtime in current_files.items():
-        if filename not in embeddings or embeddings[filename][2] != mtime:
-            need_update = True
-            break
+        entry = store.get(filename)
+        if (not force_reload and entry is not None
+                and entry.mtime == mtime and entry.model == MODEL_KEY):
+            hits += 1
+        else:
+            to_check.append(filename)
     
-    # Kiểm tra file đã xóa
-    for filename in list(embeddings.keys()):
-        if filename not in current_files:
-            del embeddings[filename]
-            need_update = True
+    # Băm nội dung các file còn lại (song song, rẻ hơn nhiều so với tính embedding)
+    with ThreadPoolExecutor(max_workers=ENROLL_WORKERS) as pool:
+        hashes = dict(zip(to_check, pool.map(
+            _hash_or_none, [os.path.join(KNOWN_FACES_DIR, f) for f in to_check]
+        )))
+    
+    # Ảnh bị xóa giữa lúc liệt kê và lúc băm -> coi như đã xóa
+    for filename in [f for f in to_check if hashes[f] is None]:
+        to_check.remove(filename)
+        del current_files[filename]
+        if store.remove(filename):
             print(f"❌ Đã xóa: {filename}")
     
+    # Kiểm tra file mới hoặc đã sửa
+    jobs = []
+    duplicates = []
+    stale_model = 0
+    first_with_hash = set()
+    for filename in to_check:
+        mtime = current_files[filename]
+        content_hash = hashes[filename]
+        filepath = os.path.join(KNOWN_FACES_DIR, filename)
+        
+        # Lấy tên (xóa _số và extension)
+        name = os.path.splitext(filename)[0]
+        name = re.sub(r'_\d+$', '', name)  # Xóa _1, _2, ...
+        
+        row = None if force_reload else store.find(content_hash, MODEL_KEY)
+        if row is not None:
+            # Ảnh giống hệt đã có vector của model hiện tại (copy/restore/đổi tên)
+            store.link(filename, name, row, mtime, content_hash, MODEL_KEY)
+            hits += 1
+        elif content_hash in first_with_hash:
+            # Trùng nội dung với 1 ảnh mới khác -> dùng lại kết quả của ảnh đó
+            duplicates.append((filename, name, mtime, content_hash))
+        else:
+            entry = store.get(filename)
+            if entry is not None and entry.model != MODEL_KEY:
+                stale_model += 1
+            first_with_hash.add(content_hash)
+            jobs.append(EnrollmentJob(filename, filepath, name, mtime))
+    
     # Cập nhật nếu cần
-    if need_update or force_reload:
+    if jobs:
         print("🔄 Đang cập nhật embeddings...")
-        DeepFace = get_deepface()
         
-        for filename, mtime in current_files.items():
-            if filename not in embeddings or embeddings[filename][2] != mtime:
-                filepath = os.path.join(KNOWN_FACES_DIR, filename)
-                
-                # Lấy tên (xóa _số và extension)
-                name = os.path.splitext(filename)[0]
-                name = re.sub(r'_\d+$', '', name)  # Xóa _1, _2, ...
-                
-                try:
-                    # Tính embedding
-                    result = DeepFace.represent(
-                        img_path=filepath,
-                        model_name="Facenet",
-                        enforce_detection=False
-                    )
-                    embedding = result[0]["embedding"]
-                    embeddings[filename] = (name, embedding, mtime)
-                    print(f"✅ Đã load: {filename} -> {name}")
-                except Exception as e:
-                    print(f"❌ Lỗi khi load {filename}: {e}")
+        def save_result(filename, entry):
+            # Nối thêm ngay vào store -> chạy lại sẽ tiếp tục từ ảnh chưa xong
+            name, embedding, mtime = entry
+            store.add(filename, name, embedding, mtime,
+                      content_hash=hashes[filename], model=MODEL_KEY)
         
-        # Lưu cache
-        with open(EMBEDDINGS_FILE, 'wb') as f:
-            pickle.dump(embeddings, f)
-        print(f"💾 Đã lưu {len(embeddings)} embeddings vào cache")
+        # Tính embedding song song theo batch
+        enroll_images(
+            jobs,
+            workers=ENROLL_WORKERS,
+            batch_size=ENROLL_BATCH_SIZE,
+            on_result=save_result
+        )
+    
+    for filename, name, mtime, content_hash in duplicates:
+        row = store.find(content_hash, MODEL_KEY)
+        if row is not None:
+            store.link(filename, name, row, mtime, content_hash, MODEL_KEY)
+            hits += 1
+    
+    misses = len(jobs)
+    message = f"📊 Cache: {hits} hit, {misses} miss"
+    if stale_model:
+        message += f" ({stale_model} do đổi model -> {MODEL_KEY})"
+    print(message)
+    if jobs:
+        print(f"💾 Đã lưu {len(store)} embeddings vào cache")
+    
+    store.sync()
+    if store.dead_rows > len(store):
+        print(f"💡 Store có {store.dead_rows} hàng đã xóa, chạy: python embedding_store.py compact")
     
-    return embeddings
+    # Chỉ dùng vector của model hiện tại (ảnh lỗi khi tính lại không lẫn model cũ)
+    known_embeddings = store.known_embeddings(model=MODEL_KEY)
+    store.close()
+    
+    if snapshot is not None:
+        # Ảnh lỗi không vào snapshot -> watcher / lần chạy sau thử lại
+        failed = snapshot.files.keys() - known_embeddings.keys()
+        if failed:
+            snapshot.dir_mtime = None
+            for filename in failed:
+                del snapshot.files[filename]
+        snapshot.save(KNOWN_FACES_SNAPSHOT)
+    return known_embeddings
+
+
+# ===========================
+# FACE DETECTION
+# ===========================
+def detect_faces(face_cascade, frame):
+    """Haar cascade trên frame, trả về danh sách box (x, y, w, h)"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return face_cascade.detectMultiScale(
+        gray,
+        scaleFactor=1.1,
+        minNeighbors=5,
+        minSize=(100, 100)
+    )
 
 
 # ===========================
 # FACE RECOGNITION
 # ===========================
+@timed("match")
 def recognize_face(face_embedding, known_embeddings):
     """
     So sánh embedding với database.
     Hỗ trợ nhiều ảnh cho mỗi người.
+    known_embeddings: backend tìm kiếm (FaceGallery/IVFIndex, build 1 lần
+    sau load_known_faces) hoặc dict cache cũ (sẽ build gallery tạm thời)
     """
-    best_match = None
-    min_distance = float('inf')
+    gallery = known_embeddings
+    if not hasattr(gallery, 'match'):
+        gallery = FaceGallery.from_embeddings(known_embeddings)
     
-    # Group embeddings theo tên
-    name_embeddings = {}
-    for filename, (name, embedding, _) in known_embeddings.items():
-        if name not in name_embeddings:
-            name_embeddings[name] = []
-        name_embeddings[name].append(embedding)
+    # Chế độ cosine: mỗi người có ngưỡng riêng (hiệu chỉnh lúc build gallery)
+    if getattr(gallery, 'metric', None) == "cosine":
+        return gallery.match(face_embedding)
+    return gallery.match(face_embedding, THRESHOLD)
+
+
+def match_threshold(gallery, name):
+    """Ngưỡng đã dùng để quyết định cho người này (để in kết quả)"""
+    if hasattr(gallery, 'threshold_of'):
+        return gallery.threshold_of(name)
+    return THRESHOLD
+
+
+def select_live_face(faces, live_box=None):
+    """
+    Khuôn mặt được ghi điểm danh: trùng box FaceMesh của thử thách liveness
+    (IoU cao nhất, tối thiểu LIVENESS_FACE_IOU); không có box -> mặt lớn nhất
+    Returns: chỉ số trong faces hoặc None (không mặt nào là người vừa thử thách)
+    """
+    if len(faces) == 0:
+        return None
+    if live_box is None:
+        return max(range(len(faces)), key=lambda i: faces[i][2] * faces[i][3])
+    scores = [iou(face, live_box) for face in faces]
+    best = int(np.argmax(scores))
+    return best if scores[best] >= LIVENESS_FACE_IOU else None
+
+
+def recognize_faces_in_frame(model, gallery, frame, faces, log_index=None):
+    """
+    Embed mọi khuôn mặt trong frame (1 batch) và so khớp; chỉ ghi điểm danh
+    khuôn mặt log_index (người vừa qua liveness), các mặt khác chỉ hiển thị
+    """
+    print("\n🔍 Đang nhận diện khuôn mặt...")
     
-    # So sánh với từng người (lấy khoảng cách nhỏ nhất trong tất cả ảnh)
-    for name, embeddings_list in name_embeddings.items():
-        for ref_embedding in embeddings_list:
-            distance = np.linalg.norm(
-                np.array(face_embedding) - np.array(ref_embedding)
-            )
-            
-            if distance < min_distance:
-                min_distance = distance
-                best_match = name
+    # Lấy embedding của mọi khuôn mặt trong 1 batch
+    crops = extract_face_crops(frame, faces)
+    with timer("embed"):
+        face_embeddings = model.embed(crops)
+    count("faces.embedded", len(crops))
+    
+    for index, face_embedding in enumerate(face_embeddings, 1):
+        # So sánh
+        name, distance = recognize_face(face_embedding, gallery)
+        
+        print(f"\n📊 Kết quả ({index}/{len(face_embeddings)}):")
+        print(f"   Người: {name}")
+        threshold = match_threshold(gallery, name)
+        print(f"   Distance: {distance:.2f}")
+        print(f"   Threshold: {threshold:.2f}")
+        
+        if name != "Unknown":
+            print(f"\n✅ XIN CHÀO, {name.upper()}!")
+            if index - 1 == log_index:
+                log_attendance(name)
+            else:
+                print("ℹ️  Không ghi điểm danh: khuôn mặt này không phải người vừa thử thách")
+        else:
+            print(f"\n❌ KHÔNG NHẬN DIỆN ĐƯỢC")
+            print(f"   (Distance {distance:.2f} > Threshold {threshold:.2f})")
     
-    # Kiểm tra threshold
-    if min_distance < THRESHOLD:
-        return best_match, min_distance
+    print("="*60)
+
+
+# Việc nhận diện của chế độ tự động: [(track, box, reason)] từ EmbedScheduler
+TrackJob = namedtuple('TrackJob', ['selected'])
+# Việc nhận diện khi nhấn SPACE: các box + box FaceMesh của thử thách (None nếu không có)
+FaceJob = namedtuple('FaceJob', ['faces', 'live_box'])
+
+
+def recognize_tracks(model, gallery, frame, selected, log=AUTO_LOG_ATTENDANCE):
+    """Embed các track được chọn (1 batch), cache danh tính vào từng track"""
+    try:
+        crops = extract_face_crops(frame, [box for _, box, _ in selected])
+        with timer("embed"):
+            face_embeddings = model.embed(crops)
+        count("faces.embedded", len(crops))
+        now = time.monotonic()
+        
+        for (track, _, reason), face_embedding in zip(selected, face_embeddings):
+            previous = track.name
+            name, distance = recognize_face(face_embedding, gallery)
+            track.set_identity(name, distance, now)
+            if name != previous:
+                print(f"🔍 Track #{track.track_id}: {name} (distance {distance:.2f}, {reason})")
+                if log and name != "Unknown":
+                    log_attendance(name)
+    finally:
+        # Lỗi embed/so khớp -> không để track kẹt ở trạng thái chờ mãi
+        for track, _, _ in selected:
+            track.embedding_pending = False
+
+
+def run_recognition_job(model, gallery, frame, job):
+    """recognize_fn của pipeline: SPACE gửi FaceJob, chế độ tự động gửi TrackJob"""
+    if isinstance(job, TrackJob):
+        recognize_tracks(model, gallery, frame, job.selected)
     else:
-        return "Unknown", min_distance
+        log_index = select_live_face(job.faces, job.live_box)
+        if log_index is None:
+            print("⚠️ Không thấy khuôn mặt vừa thử thách liveness, không ghi điểm danh")
+        recognize_faces_in_frame(model, gallery, frame, job.faces, log_index)
 
 
 # ===========================
 # ATTENDANCE LOGGING
 # ===========================
+_attendance_store = None
+
+
+def get_attendance_store():
+    """Store điểm danh dùng chung: set (name, date) của hôm nay nằm sẵn trong RAM"""
+    global _attendance_store
+    if _attendance_store is None:
+        path = ATTENDANCE_FILE if ATTENDANCE_BACKEND == "csv" else None
+        _attendance_store = open_attendance_store(ATTENDANCE_BACKEND, path,
+                                                  writer_id=ATTENDANCE_WRITER_ID)
+    return _attendance_store
+
+
+def close_attendance_store():
+    global _attendance_store
+    if _attendance_store is not None:
+        _attendance_store.close()
+        _attendance_store = None
+
+
+@timed("attendance.log")
 def log_attendance(name):
-    """Ghi nhận điểm danh vào CSV"""
+    """Ghi nhận điểm danh (kiểm tra trùng O(1), không đọc lại cả file)"""
     now = datetime.now()
     date_str = now.strftime("%Y-%m-%d")
     time_str = now.strftime("%H:%M:%S")
     
-    # Kiểm tra đã điểm danh hôm nay chưa
-    if os.path.exists(ATTENDANCE_FILE):
-        with open(ATTENDANCE_FILE, 'r', encoding='utf-8') as f:
-            for line in f:
-                if name in line and date_str in line:
-                    print(f"ℹ️  {name} đã điểm danh hôm nay")
-                    return False
-    
-    # Ghi attendance
-    with open(ATTENDANCE_FILE, 'a', encoding='utf-8') as f:
-        f.write(f"{name},{date_str},{time_str}\n")
+    # Kiểm tra đã điểm danh hôm nay chưa + ghi attendance
+    if not get_attendance_store().check_in(name, now):
+        print(f"ℹ️  {name} đã điểm danh hôm nay")
+        count("attendance.duplicate")
+        return False
     
+    count("attendance.logged")
     print(f"✅ Đã ghi nhận điểm danh: {name} - {date_str} {time_str}")
     return True
 
 
+def submit_recognition(pipeline, detection, live_box=None):
+    """
+    Gửi kết quả detect sang worker nhận diện (hiển thị không bị đứng)
+    live_box: box FaceMesh của thử thách liveness -> chỉ ghi điểm danh mặt trùng box đó
+    """
+    if detection is None or len(detection[2]) == 0:
+        print("❌ Không detect được khuôn mặt")
+        return
+    _, detected_frame, detected_faces = detection
+    if not pipeline.recognition.submit(detected_frame, FaceJob(detected_faces, live_box)):
+        print("⏳ Đang bận nhận diện, thử lại sau")
+
+
+def finish_liveness(session, pipeline, last_seq):
+    """Thử thách có kết quả: đạt -> nhận diện trên frame detect sau thử thách"""
+    print_challenge_result(session)
+    passed, message = session.result
+    elapsed = session.last_ts - session.started_at
+    observe("liveness.challenge", elapsed * 1000)
+    count("liveness.passed" if passed else "liveness.failed")
+    print(f"📈 Thử thách: {session.frames} frame trong {elapsed:.1f}s")
+    
+    if not passed:
+        print(f"\n❌ THẤT BẠI: {message}")
+        if session.challenge_started_at is not None and message != "Người dùng hủy":
+            print("⚠️  Có thể là video replay hoặc ảnh in!")
+        return
+    
+    print(f"\n✅ Liveness Check: PASSED")
+    # Chờ kết quả detect trên frame sau challenge; chỉ người vừa thử thách được ghi
+    submit_recognition(pipeline, pipeline.detection.wait_for(last_seq), session.face_box)
+
+
+# ===========================
+# STARTUP
+# ===========================
+def build_gallery(known_embeddings):
+    """Build backend tìm kiếm (exact: ma trận float32, ivf: index ANN, centroid: cosine)"""
+    return build_face_index(
+        known_embeddings,
+        backend=INDEX_BACKEND,
+        index_file=INDEX_FILE,
+        n_probe=IVF_N_PROBE,
+        model_key=MODEL_KEY
+    )
+
+
+def load_gallery():
+    """
+    Load known faces + build backend tìm kiếm (chạy nền lúc khởi động)
+    Returns: LiveGallery (watcher thay gallery khi known_faces/ thay đổi)
+    """
+    print(f"\n📂 Đang load khuôn mặt từ: {KNOWN_FACES_DIR}")
+    known_embeddings = load_known_faces()
+    if not known_embeddings:
+        raise RuntimeError(f"Không có khuôn mặt nào trong {KNOWN_FACES_DIR}")
+    
+    names = {name for name, _, _ in known_embeddings.values()}
+    print(f"\n👥 Có {len(names)} người: {', '.join(sorted(names))}")
+    print(f"📷 Tổng {len(known_embeddings)} ảnh tham chiếu")
+    return LiveGallery(build_gallery(known_embeddings))
+
+
+def start_gallery_watcher(live_gallery):
+    """
+    Theo dõi known_faces/: chỉ tính embedding các ảnh thêm/sửa, bỏ ảnh đã xóa,
+    build gallery mới ở thread của watcher rồi thay vào live_gallery
+    (nhận diện vẫn chạy với gallery cũ trong lúc build)
+    """
+    def on_change(changes):
+        removed = sum(state is None for state in changes.values())
+        print(f"\n🔄 known_faces thay đổi: {len(changes) - removed} ảnh mới/sửa, {removed} ảnh xóa")
+        known_embeddings = load_known_faces(changes=changes)
+        live_gallery.swap(build_gallery(known_embeddings))
+        names = {name for name, _, _ in known_embeddings.values()}
+        print(f"✅ Đã cập nhật gallery: {len(names)} người, {len(known_embeddings)} ảnh")
+        # Ảnh tính embedding lỗi (hoặc bị xóa giữa chừng) không vào snapshot -> thử lại sau
+        return [f for f, state in changes.items()
+                if state is not None and f not in known_embeddings]
+    
+    watcher = KnownFacesWatcher(
+        KNOWN_FACES_DIR, on_change,
+        snapshot=DirectorySnapshot.load(KNOWN_FACES_SNAPSHOT),
+        snapshot_path=KNOWN_FACES_SNAPSHOT,
+        use_inotify=WATCH_INOTIFY
+    )
+    watcher.start()
+    return watcher
+
+
+def open_attendance():
+    """Điểm danh: chỉ đọc phần của hôm nay từ cuối file"""
+    attendance = get_attendance_store()
+    if ATTENDANCE_BACKEND == "csv":
+        print(f"📋 Hôm nay đã có {len(attendance.checked_in)} người điểm danh")
+    return attendance
+
+
 # ===========================
 # MAIN
 # ===========================
 def main():
+    startup = Startup(t0=_IMPORT_START)
+    startup.record("import", _IMPORT_START, _IMPORT_END)
+    
     print("="*60)
     print("   HỆ THỐNG ĐIỂM DANH NHẬN DIỆN KHUÔN MẶT")
     print("   Advanced Liveness Detection - Chống Video Replay")
@@ -192,65 +537,152 @@ def main():
         print("   - Random Head Movement Challenge")
         print("   - Texture Analysis")
     
-    # Load known faces
-    print(f"\n📂 Đang load khuôn mặt từ: {KNOWN_FACES_DIR}")
-    known_embeddings = load_known_faces()
-    
-    if not known_embeddings:
-        print(f"❌ Không có khuôn mặt nào trong {KNOWN_FACES_DIR}")
-        return
-    
-    # Hiển thị danh sách
-    names = set()
-    for filename, (name, _, _) in known_embeddings.items():
-        names.add(name)
-    print(f"\n👥 Có {len(names)} người: {', '.join(sorted(names))}")
-    print(f"📷 Tổng {len(known_embeddings)} ảnh tham chiếu")
-    
-    # Khởi tạo camera và face detector
+    # Camera + preview có ngay; model, FaceMesh, gallery nạp song song ở nền
     print("\n📹 Đang khởi động camera...")
-    video_capture = cv2.VideoCapture(0)
-    face_cascade = cv2.CascadeClassifier(HAAR_CASCADE_PATH)
+    with startup.phase("camera"):
+        video_capture = cv2.VideoCapture(0)
+        face_detector = FaceDetector(FACE_DETECTOR, detect_width=DETECT_WIDTH,
+                                     every_n=DETECT_EVERY_N, roi=DETECT_ROI)
+    
+    print("\n🧠 Đang nạp model nhận diện, gallery và liveness ở nền...")
+    startup.start("model", load_embedding_model)
+    startup.start("gallery", load_gallery)
+    startup.start("attendance", open_attendance)
+    if LIVENESS_DETECTION_ENABLED:
+        # FaceMesh tạo 1 lần, dùng lại cho mọi lần nhấn SPACE
+        startup.start("liveness", get_liveness_detector)
     
     print("\n" + "="*60)
     print("HƯỚNG DẪN SỬ DỤNG:")
     print("- Đưa khuôn mặt vào trước camera")
     print("- Nhấn SPACE để bắt đầu nhận diện")
+    print("- Nhấn 'a' để bật/tắt tự động nhận diện theo track")
+    if instrumentation.ENABLED:
+        print("- Nhấn 'p' để bắt đầu/dừng profile (ghi vào profiles/)")
     if LIVENESS_DETECTION_ENABLED:
         print("- Làm theo hướng dẫn: Nhấp nháy mắt HOẶC Xoay đầu")
         print("  (Hệ thống sẽ chọn ngẫu nhiên)")
+        print("- Nhấn ESC để hủy thử thách đang chạy")
     print("- Nhấn 'q' để thoát")
     print("="*60 + "\n")
     
-    DeepFace = get_deepface()
+    # FACE_METRICS=1: đo thời gian từng bước, ghi snapshot định kỳ
+    instrumentation.setup()
+    
+    # Capture / detection / recognition chạy ở thread riêng, thread này chỉ hiển thị
+    # (recognition chỉ được gửi việc khi model + gallery đã sẵn sàng)
+    pipeline = FramePipeline(
+        video_capture,
+        detect_fn=face_detector.detect,
+        recognize_fn=lambda frame, job: run_recognition_job(
+            startup.result("model"), startup.result("gallery").current, frame, job)
+    ).start()
+    display_reader = pipeline.reader("display")
+    startup_reported = False
+    watcher = None
+    liveness_session = None  # Thử thách đang chạy (nhận frame từ vòng lặp hiển thị)
+    
+    # Chế độ tự động: mỗi track chỉ embed khi mới xuất hiện / sát ngưỡng / quá hạn
+    auto_mode = AUTO_MODE
+    tracker = IoUTracker()
+    if INDEX_BACKEND == "centroid":
+        scheduler = EmbedScheduler(COSINE_THRESHOLD, REEMBED_INTERVAL, COSINE_BORDERLINE_MARGIN)
+    else:
+        scheduler = EmbedScheduler(THRESHOLD, REEMBED_INTERVAL, BORDERLINE_MARGIN)
+    last_tracked_seq = 0
     
     try:
         while True:
-            ret, frame = video_capture.read()
+            ret, frame = display_reader.read()
             if not ret:
                 print("❌ Không đọc được frame từ camera")
                 break
+            startup.mark("first_frame")
+            
+            # Thử thách liveness: mỗi vòng 1 frame (trước khi vẽ lên frame),
+            # detect / tracking / hiển thị vẫn chạy trong lúc chờ người dùng
+            if liveness_session is not None:
+                state = liveness_session.state
+                with timer("liveness.feed"):
+                    result = liveness_session.feed(frame, time.monotonic())
+                if state == PREPARING and liveness_session.state != PREPARING:
+                    print_challenge_prompt(liveness_session)
+                if result is not None:
+                    finish_liveness(liveness_session, pipeline, display_reader.last_seq)
+                    liveness_session = None
+            
+            # Khởi động xong (mọi task nền kết thúc): in + ghi báo cáo 1 lần
+            if not startup_reported and startup.all_done:
+                startup_reported = True
+                startup.mark("ready")
+                print(f"\n⏱️ Khởi động:\n{format_report(startup.write_report())}")
+                if not startup.ready("model", "gallery"):
+                    print("❌ Không thể nhận diện (model hoặc gallery lỗi), thoát")
+                    break
+                if not startup.ready("attendance"):
+                    print(f"❌ Không mở được {ATTENDANCE_FILE}: "
+                          f"{startup.tasks['attendance'].error}")
+                    print("   Kiểm tra quyền ghi file hoặc đặt ATTENDANCE_WRITER_ID riêng cho kiosk này")
+                    break
+            recognition_ready = startup.ready("model", "gallery", "attendance")
             
-            # Detect faces
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = face_cascade.detectMultiScale(
-                gray,
-                scaleFactor=1.1,
-                minNeighbors=5,
-                minSize=(100, 100)
-            )
+            # Gallery đã nạp -> theo dõi known_faces/ (ảnh mới có hiệu lực không cần restart)
+            if watcher is None and WATCH_KNOWN_FACES and startup.ready("gallery"):
+                watcher = start_gallery_watcher(startup.result("gallery"))
+            
+            # Kết quả detect mới nhất (có thể trễ hơn frame hiển thị 1-2 frame)
+            seq, detected_frame, faces = pipeline.detection.latest()
+            
+            if auto_mode and recognition_ready and seq != last_tracked_seq:
+                # Mỗi kết quả detect mới cập nhật tracker 1 lần
+                last_tracked_seq = seq
+                matched, _ = tracker.update(faces, seq)
+                selected = scheduler.select(matched, time.monotonic())
+                if selected:
+                    scheduler.mark_pending(selected)
+                    if pipeline.recognition.submit(detected_frame, TrackJob(selected)):
+                        scheduler.commit(selected)
+                    else:
+                        scheduler.release(selected)
             
             # Vẽ khung
-            for (x, y, w, h) in faces:
-                cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-                cv2.putText(frame, "Nhan SPACE de nhan dien", 
-                           (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 
-                           0.5, (0, 255, 0), 2)
+            if auto_mode:
+                for track in tracker.tracks:
+                    if track.last_frame != last_tracked_seq:
+                        continue
+                    x, y, w, h = track.box
+                    color = (0, 255, 0) if track.identified else (0, 165, 255)
+                    label = f"#{track.track_id} {track.name}"
+                    if track.last_embed_time is not None:
+                        label += f" ({track.distance:.1f})"
+                    cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
+                    cv2.putText(frame, label, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX,
+                               0.5, color, 2)
+            else:
+                for (x, y, w, h) in faces:
+                    cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+                    cv2.putText(frame, "Nhan SPACE de nhan dien", 
+                               (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 
+                               0.5, (0, 255, 0), 2)
             
             # Hiển thị
             cv2.putText(frame, "Nhan SPACE: Nhan dien | Q: Thoat",
                        (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 
                        0.7, (255, 255, 255), 2)
+            age_ms = display_reader.ages_ms[-1]
+            status = "Dang nhan dien..." if pipeline.recognition.busy else ""
+            if auto_mode:
+                status += f" Auto: embed {scheduler.embedded}/{scheduler.detections}"
+            cv2.putText(frame, f"Age: {age_ms:.0f}ms | Drop: {display_reader.skipped} {status}",
+                       (10, frame.shape[0] - 15), cv2.FONT_HERSHEY_SIMPLEX,
+                       0.5, (255, 255, 255), 1)
+            if not startup.all_done:
+                cv2.putText(frame, f"Dang khoi dong: {startup.status_text()}",
+                           (10, 60), cv2.FONT_HERSHEY_SIMPLEX,
+                           0.5, (0, 255, 255), 1)
+            
+            if liveness_session is not None:
+                liveness_session.draw(frame)
             
             cv2.imshow('Face Recognition', frame)
             
@@ -261,64 +693,61 @@ def main():
                 print("\n👋 Đã thoát")
                 break
             
+            elif key == 27 and liveness_session is not None:  # ESC: hủy thử thách
+                liveness_session.cancel()
+                finish_liveness(liveness_session, pipeline, display_reader.last_seq)
+                liveness_session = None
+            
+            elif key == ord('p') and instrumentation.ENABLED:
+                instrumentation.profiler.toggle()
+            
+            elif key == ord('a'):
+                auto_mode = not auto_mode
+                print(f"\n🤖 Tự động nhận diện: {'BẬT' if auto_mode else 'TẮT'}")
+            
             elif key == ord(' '):  # SPACE
                 if len(faces) == 0:
                     print("❌ Không phát hiện khuôn mặt!")
                     continue
                 
+                if not recognition_ready or (LIVENESS_DETECTION_ENABLED
+                                             and not startup.tasks["liveness"].done):
+                    print(f"⏳ Đang khởi động ({startup.status_text()}), thử lại sau")
+                    continue
+                
+                if liveness_session is not None:
+                    print("⏳ Đang thử thách liveness, làm theo yêu cầu trên màn hình")
+                    continue
+                
                 print("\n" + "="*60)
                 print("🔍 BẮT ĐẦU NHẬN DIỆN...")
                 print("="*60)
                 
-                # Liveness Detection (nếu có)
+                # Liveness Detection (nếu có): thử thách chạy theo từng frame của vòng lặp
                 if LIVENESS_DETECTION_ENABLED:
                     print("\n🔐 Thực hiện Advanced Liveness Detection...")
-                    success, message = perform_advanced_liveness_challenge(video_capture)
-                    
-                    if not success:
-                        print(f"\n❌ THẤT BẠI: {message}")
-                        print("⚠️  Có thể là video replay hoặc ảnh in!")
-                        continue
-                    
-                    print(f"\n✅ Liveness Check: PASSED")
-                
-                # Nhận diện
-                print("\n🔍 Đang nhận diện khuôn mặt...")
-                try:
-                    # Lấy embedding
-                    result = DeepFace.represent(
-                        img_path=frame,
-                        model_name="Facenet",
-                        enforce_detection=False
-                    )
-                    
-                    if not result:
-                        print("❌ Không detect được khuôn mặt")
+                    try:
+                        liveness_session = LivenessSession(startup.result("liveness"))
+                    except Exception as e:
+                        print(f"❌ Không thể khởi tạo detector: {e}")
                         continue
-                    
-                    face_embedding = result[0]["embedding"]
-                    
-                    # So sánh
-                    name, distance = recognize_face(face_embedding, known_embeddings)
-                    
-                    print(f"\n📊 Kết quả:")
-                    print(f"   Người: {name}")
-                    print(f"   Distance: {distance:.2f}")
-                    print(f"   Threshold: {THRESHOLD}")
-                    
-                    if name != "Unknown":
-                        print(f"\n✅ XIN CHÀO, {name.upper()}!")
-                        log_attendance(name)
-                    else:
-                        print(f"\n❌ KHÔNG NHẬN DIỆN ĐƯỢC")
-                        print(f"   (Distance {distance:.2f} > Threshold {THRESHOLD})")
-                
-                except Exception as e:
-                    print(f"❌ Lỗi khi nhận diện: {e}")
-                
-                print("="*60)
+                    print("🔐 THÔNG BÁO: Đang chuẩn bị thử thách liveness nâng cao...")
+                else:
+                    submit_recognition(pipeline, pipeline.detection.latest())
     
     finally:
+        if watcher is not None:
+            watcher.stop()
+        pipeline.stop()
+        instrumentation.shutdown()
+        if not startup_reported:
+            startup.write_report()
+        print(f"\n📈 Hiển thị: {display_reader.format_stats()}")
+        if scheduler.detections:
+            print(f"🤖 Tự động: {scheduler.format_stats()}")
+        if LIVENESS_DETECTION_ENABLED:
+            close_liveness_detector()
+        close_attendance_store()
         video_capture.release()
         cv2.destroyAllWindows()
         print("\n✅ Đã đóng camera")
@@ -0,0 +1,196 @@
+"""
+Face Tracker - Gán track ID cho các box khuôn mặt qua nhiều frame
+- Ghép box mới với track cũ theo IoU (tham lam, IoU cao nhất trước)
+- Track không xuất hiện quá max_missed frame xử lý thì kết thúc
+- Mỗi track giữ kết quả nhận diện tốt nhất -> dedup theo track
+- EmbedScheduler: chỉ embed track mới, track có distance sát ngưỡng
+  hoặc đã quá REEMBED_INTERVAL giây; đếm số lần embed tiết kiệm được
+"""
+import numpy as np
+
+
+IOU_THRESHOLD = 0.3
+MAX_MISSED = 5  # Số frame xử lý liên tiếp không thấy trước khi đóng track
+REEMBED_INTERVAL = 3.0  # Giây giữa 2 lần embed lại cùng 1 track
+BORDERLINE_MARGIN = 1.0  # |distance - threshold| nhỏ hơn -> embed lại ở frame sau
+BORDERLINE_RETRY = 0.25  # Giây tối thiểu giữa 2 lần embed lại do sát ngưỡng
+MAX_BORDERLINE_RETRIES = 3  # Sau N lần vẫn sát ngưỡng -> chờ tới REEMBED_INTERVAL
+
+
+def iou(box_a, box_b):
+    """IoU của 2 box (x, y, w, h)"""
+    ax, ay, aw, ah = box_a
+    bx, by, bw, bh = box_b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Track:
+    """1 khuôn mặt được theo dõi liên tục"""
+
+    def __init__(self, track_id, box, frame_index):
+        self.track_id = track_id
+        self.box = tuple(int(v) for v in box)
+        self.first_frame = frame_index
+        self.last_frame = frame_index
+        self.hits = 1
+        self.missed = 0
+
+        # Kết quả nhận diện tốt nhất (distance nhỏ nhất)
+        self.name = "Unknown"
+        self.distance = float('inf')
+        self.embeds = 0
+        self.last_embed_time = None
+        self.embedding_pending = False
+        self.borderline_retries = 0
+
+    @property
+    def identified(self):
+        return self.name != "Unknown"
+
+    def update_identity(self, name, distance):
+        """Giữ kết quả tốt nhất qua các lần embed (dedup theo track)"""
+        self.embeds += 1
+        if distance < self.distance:
+            self.name = name
+            self.distance = float(distance)
+
+    def set_identity(self, name, distance, now):
+        """Lấy kết quả của lần embed mới nhất (người trong box có thể đã đổi)"""
+        self.embeds += 1
+        self.name = name
+        self.distance = float(distance)
+        self.last_embed_time = now
+        self.embedding_pending = False
+
+
+class IoUTracker:
+    """Tracker IoU đơn giản, đủ cho camera cố định và video bài giảng"""
+
+    def __init__(self, iou_threshold=IOU_THRESHOLD, max_missed=MAX_MISSED):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.tracks = []
+        self._next_id = 1
+
+    def update(self, boxes, frame_index):
+        """
+        Ghép boxes của frame hiện tại với các track đang mở.
+        Returns: (matched, finished)
+          matched: [(track, box)] theo thứ tự của boxes
+          finished: các track vừa kết thúc
+        """
+        boxes = [tuple(int(v) for v in box) for box in boxes]
+        assigned = [None] * len(boxes)
+
+        if self.tracks and boxes:
+            scores = np.array([[iou(track.box, box) for box in boxes]
+                               for track in self.tracks])
+            used_tracks = set()
+            for flat in np.argsort(-scores, axis=None):
+                t, b = divmod(int(flat), len(boxes))
+                if scores[t, b] < self.iou_threshold:
+                    break
+                if t in used_tracks or assigned[b] is not None:
+                    continue
+                used_tracks.add(t)
+                assigned[b] = self.tracks[t]
+
+        matched = []
+        for box, track in zip(boxes, assigned):
+            if track is None:
+                track = Track(self._next_id, box, frame_index)
+                self._next_id += 1
+                self.tracks.append(track)
+            else:
+                track.box = box
+                track.last_frame = frame_index
+                track.hits += 1
+                track.missed = 0
+            matched.append((track, box))
+
+        finished = []
+        for track in self.tracks:
+            if track.last_frame != frame_index:
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    finished.append(track)
+        if finished:
+            self.tracks = [t for t in self.tracks if t not in finished]
+        return matched, finished
+
+    def finish_all(self):
+        """Kết thúc mọi track (hết video). Returns: danh sách track"""
+        finished, self.tracks = self.tracks, []
+        return finished
+
+
+class EmbedScheduler:
+    """Quyết định track nào cần embed ở frame hiện tại"""
+
+    def __init__(self, threshold, interval=REEMBED_INTERVAL, margin=BORDERLINE_MARGIN):
+        self.threshold = threshold
+        self.interval = interval
+        self.margin = margin
+
+        self.detections = 0  # Số lần embed nếu chạy Facenet trên mọi khuôn mặt mọi frame
+        self.embedded = 0
+        self.reasons = {'new': 0, 'borderline': 0, 'interval': 0}
+
+    def reason(self, track, now):
+        """'new' / 'borderline' / 'interval' hoặc None nếu dùng lại kết quả đã cache"""
+        if track.embedding_pending:
+            return None
+        if track.last_embed_time is None:
+            return 'new'
+        elapsed = now - track.last_embed_time
+        if elapsed >= self.interval:
+            return 'interval'
+        # Sát ngưỡng: thử lại ở frame khác (có giới hạn tần suất)
+        if (abs(track.distance - self.threshold) < self.margin
+                and track.borderline_retries < MAX_BORDERLINE_RETRIES
+                and elapsed >= BORDERLINE_RETRY):
+            return 'borderline'
+        return None
+
+    def select(self, matched, now):
+        """matched: [(track, box)] từ IoUTracker.update. Returns: [(track, box, reason)]"""
+        self.detections += len(matched)
+        selected = []
+        for track, box in matched:
+            reason = self.reason(track, now)
+            if reason is not None:
+                selected.append((track, box, reason))
+        return selected
+
+    def mark_pending(self, selected):
+        """
+        Gọi TRƯỚC khi gửi việc: thread nhận diện có thể xong (set_identity xóa cờ)
+        trước cả khi submit trả về, đánh dấu sau đó sẽ kẹt cờ mãi
+        """
+        for track, _, _ in selected:
+            track.embedding_pending = True
+
+    def release(self, selected):
+        """Việc bị từ chối (hàng đợi đầy) / lỗi -> các track được chọn lại ở frame sau"""
+        for track, _, _ in selected:
+            track.embedding_pending = False
+
+    def commit(self, selected):
+        """Ghi nhận các track đã được gửi đi embed (đếm thống kê + lần thử sát ngưỡng)"""
+        for track, _, reason in selected:
+            track.borderline_retries = track.borderline_retries + 1 if reason == 'borderline' else 0
+            self.embedded += 1
+            self.reasons[reason] += 1
+
+    @property
+    def saved(self):
+        return self.detections - self.embedded
+
+    def format_stats(self):
+        reasons = ", ".join(f"{k} {v}" for k, v in self.reasons.items())
+        return (f"{self.embedded} lần embed cho {self.detections} khuôn mặt-frame "
+                f"(tiết kiệm {self.saved}; {reasons})")
@@ -0,0 +1,367 @@
+"""
+Face Watcher - Theo dõi known_faces/ khi hệ thống đang chạy
+- DirectorySnapshot: {filename: (mtime, size)} + mtime_ns của thư mục, lưu JSON.
+  Lúc khởi động, nếu mtime thư mục không đổi (không thêm/xóa/đổi tên ảnh)
+  thì khỏi liệt kê + stat từng ảnh
+- KnownFacesWatcher: inotify (Linux, qua ctypes) hoặc polling; chỉ báo các ảnh
+  thay đổi -> chỉ tính embedding các ảnh đó
+- Ảnh vừa ghi (mtime mới hơn SETTLE_SECONDS) để lần sau, tránh đọc file copy dở
+- Quét lại toàn bộ (rẻ: chỉ stat) mỗi RESCAN_INTERVAL giây và 1 lần khi bắt đầu,
+  bắt được ảnh bị ghi đè tại chỗ lúc app tắt (không làm đổi mtime thư mục)
+- LiveGallery: gallery dùng chung, thay nguyên khối bằng 1 phép gán
+  (người đọc lấy .current 1 lần cho mỗi job, không bị khoá)
+
+Dùng từ dòng lệnh:
+    python face_watcher.py known_faces    # in các thay đổi phát hiện được
+"""
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+POLL_INTERVAL = 2.0  # Giây giữa 2 lần kiểm tra mtime thư mục (chế độ polling)
+RESCAN_INTERVAL = 60.0  # Giây giữa 2 lần quét lại toàn bộ (stat mọi ảnh)
+SETTLE_SECONDS = 1.0  # Ảnh có mtime mới hơn N giây coi là đang ghi dở
+SNAPSHOT_VERSION = 1
+
+# inotify (linux/inotify.h)
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def is_image(filename):
+    return filename.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def directory_mtime(directory):
+    """mtime_ns của thư mục (đổi khi thêm/xóa/đổi tên file), None nếu không có"""
+    try:
+        return os.stat(directory).st_mtime_ns
+    except OSError:
+        return None
+
+
+def scan_directory(directory):
+    """
+    Returns: {filename: (mtime, size)} của mọi ảnh trong thư mục
+    (mtime giống os.path.getmtime -> so được với mtime trong cache embeddings)
+    """
+    files = {}
+    try:
+        entries = os.scandir(directory)
+    except OSError:
+        return files
+    with entries:
+        for entry in entries:
+            if not is_image(entry.name):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue  # Bị xóa giữa lúc liệt kê
+            if entry.is_file():
+                files[entry.name] = (stat.st_mtime, stat.st_size)
+    return files
+
+
+def stat_files(directory, filenames):
+    """Như scan_directory nhưng chỉ cho 1 số file (file không còn -> None)"""
+    files = {}
+    for filename in filenames:
+        try:
+            stat = os.stat(os.path.join(directory, filename))
+            files[filename] = (stat.st_mtime, stat.st_size)
+        except OSError:
+            files[filename] = None
+    return files
+
+
+def diff_files(old, new, settle=SETTLE_SECONDS, now=None):
+    """
+    So sánh 2 trạng thái {filename: (mtime, size) hoặc None}.
+    Returns: (changes {filename: (mtime, size) hoặc None nếu đã xóa},
+              pending: tên các ảnh đang ghi dở, để lần sau)
+    """
+    now = time.time() if now is None else now
+    changes, pending = {}, set()
+    for filename, state in new.items():
+        if state is None:
+            if filename in old:
+                changes[filename] = None
+        elif old.get(filename) != state:
+            if now - state[0] < settle:
+                pending.add(filename)
+            else:
+                changes[filename] = state
+    return changes, pending
+
+
+class DirectorySnapshot:
+    """Trạng thái known_faces/ đã được đưa vào cache embeddings lần gần nhất"""
+
+    def __init__(self, dir_mtime=None, files=None, model=None):
+        self.dir_mtime = dir_mtime
+        self.files = dict(files or {})
+        self.model = model
+
+    @classmethod
+    def load(cls, path):
+        """Returns: snapshot hoặc None (chưa có / hỏng / khác phiên bản)"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('version') != SNAPSHOT_VERSION:
+            return None
+        files = {filename: tuple(state) for filename, state in data['files'].items()}
+        return cls(data['dir_mtime'], files, data.get('model'))
+
+    def save(self, path):
+        """Ghi file tạm rồi os.replace (không bao giờ để lại snapshot dở)"""
+        data = {'version': SNAPSHOT_VERSION, 'dir_mtime': self.dir_mtime,
+                'model': self.model, 'files': self.files}
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ Không ghi được snapshot {path}: {e}")
+
+    def matches(self, directory):
+        """True nếu từ lúc chụp không có ảnh nào được thêm/xóa/đổi tên"""
+        return self.dir_mtime is not None and directory_mtime(directory) == self.dir_mtime
+
+    def apply(self, changes):
+        for filename, state in changes.items():
+            if state is None:
+                self.files.pop(filename, None)
+            else:
+                self.files[filename] = state
+
+
+def remove_snapshot(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class Inotify:
+    """inotify tối thiểu qua ctypes (không cần thư viện ngoài); chỉ Linux"""
+
+    def __init__(self, directory, mask=WATCH_MASK):
+        if not sys.platform.startswith('linux'):
+            raise OSError("inotify chỉ có trên Linux")
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 thất bại")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch {directory} thất bại")
+
+    def read(self, timeout):
+        """Returns: [(mask, filename)] (rỗng nếu hết timeout)"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            events.append((mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class KnownFacesWatcher(threading.Thread):
+    """
+    on_change(changes) được gọi ở thread của watcher với
+    {filename: (mtime, size) hoặc None nếu đã xóa}; trả về False nếu áp dụng
+    thất bại (sẽ thử lại ở lần quét sau) hoặc danh sách ảnh lỗi (không vào
+    snapshot, lần quét lại toàn bộ sau thử lại). Snapshot được cập nhật + lưu
+    sau mỗi lần áp dụng thành công.
+    """
+
+    def __init__(self, directory, on_change, snapshot=None, snapshot_path=None,
+                 use_inotify=True, poll_interval=POLL_INTERVAL,
+                 rescan_interval=RESCAN_INTERVAL, settle=SETTLE_SECONDS):
+        super().__init__(name="known-faces-watcher", daemon=True)
+        self.directory = directory
+        self.on_change = on_change
+        self.snapshot = snapshot or DirectorySnapshot()
+        self.snapshot_path = snapshot_path
+        self.use_inotify = use_inotify
+        self.poll_interval = poll_interval
+        self.rescan_interval = rescan_interval
+        self.settle = settle
+        self.mode = None
+        self.updates = 0
+        self.failed = set()  # Ảnh áp dụng lỗi, chưa có trong snapshot
+        self._stop_event = threading.Event()
+        self._inotify = None
+
+    def run(self):
+        if self.use_inotify:
+            try:
+                self._inotify = Inotify(self.directory)
+                self.mode = "inotify"
+            except (OSError, AttributeError) as e:
+                print(f"⚠️ Không dùng được inotify ({e}) -> polling mỗi {self.poll_interval:.0f}s")
+        self.mode = self.mode or "polling"
+
+        try:
+            self._loop()
+        finally:
+            if self._inotify is not None:
+                self._inotify.close()
+
+    def _loop(self):
+        dirty = set()  # Ảnh có sự kiện / đang ghi dở, chưa áp dụng
+        full_scan = True  # Lần đầu: đối chiếu toàn bộ với snapshot
+        last_rescan = time.monotonic()
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            if now - last_rescan >= self.rescan_interval:
+                full_scan = True
+
+            if full_scan:
+                dir_mtime = directory_mtime(self.directory)
+                current = scan_directory(self.directory)
+                current.update({f: None for f in self.snapshot.files if f not in current})
+                full_scan = False
+                last_rescan = now
+            elif dirty:
+                # Polling chỉ giữ các ảnh ghi dở, ảnh khác có thể đổi cùng lúc
+                # -> chưa tin mtime thư mục, lần poll sau sẽ quét lại toàn bộ
+                dir_mtime = directory_mtime(self.directory) if self._inotify else None
+                current = stat_files(self.directory, dirty)
+            else:
+                current = None
+
+            if current is not None:
+                changes, pending = diff_files(self.snapshot.files, current, self.settle)
+                if changes:
+                    # Thất bại -> snapshot giữ nguyên, lần quét lại toàn bộ sau thử lại
+                    self._apply(changes, None if pending else dir_mtime)
+                elif not pending and dir_mtime != self.snapshot.dir_mtime:
+                    self._save(dir_mtime)
+                dirty = pending
+
+            # Chờ sự kiện tiếp theo
+            timeout = self.settle if dirty else min(self.poll_interval, self.rescan_interval)
+            if self._inotify is not None:
+                for mask, filename in self._inotify.read(timeout):
+                    if mask & (IN_Q_OVERFLOW | IN_DELETE_SELF | IN_MOVE_SELF):
+                        full_scan = True
+                    elif is_image(filename):
+                        dirty.add(filename)
+            else:
+                if self._stop_event.wait(timeout):
+                    break
+                if directory_mtime(self.directory) != self.snapshot.dir_mtime:
+                    full_scan = True
+
+    def _apply(self, changes, dir_mtime):
+        """dir_mtime=None: còn ảnh đang ghi dở -> chưa tin mtime thư mục"""
+        try:
+            result = self.on_change(changes)
+        except Exception as e:
+            print(f"❌ Cập nhật known_faces thất bại: {e}")
+            result = False
+        ok = result is not False
+        if ok:
+            failed = set() if result is None or result is True else set(result)
+            self.failed = (self.failed - changes.keys()) | failed
+            self.updates += 1
+            self.snapshot.apply({f: state for f, state in changes.items() if f not in failed})
+            self._save(dir_mtime)
+        return ok
+
+    def _save(self, dir_mtime):
+        self.snapshot.dir_mtime = dir_mtime
+        if self.snapshot_path:
+            if self.failed:
+                # Còn ảnh lỗi -> lần khởi động sau không được bỏ qua quét thư mục
+                DirectorySnapshot(None, self.snapshot.files,
+                                  self.snapshot.model).save(self.snapshot_path)
+            else:
+                self.snapshot.save(self.snapshot_path)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=2.0)
+
+
+class LiveGallery:
+    """Gallery thay được khi đang chạy; mỗi job đọc .current 1 lần rồi dùng suốt job"""
+
+    def __init__(self, gallery):
+        self._gallery = gallery
+        self.version = 0
+        self._lock = threading.Lock()  # Chỉ để các lần swap không đè nhau
+
+    @property
+    def current(self):
+        return self._gallery
+
+    def swap(self, gallery):
+        with self._lock:
+            self._gallery = gallery
+            self.version += 1
+
+    def __len__(self):
+        return len(self._gallery)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(1)
+
+    def show(changes):
+        for filename, state in sorted(changes.items()):
+            print(f"{'❌ xóa' if state is None else '🔄 đổi'}: {filename}")
+
+    watcher = KnownFacesWatcher(sys.argv[1], show,
+                                DirectorySnapshot(files=scan_directory(sys.argv[1])))
+    watcher.start()
+    time.sleep(0.2)
+    print(f"👀 Theo dõi {sys.argv[1]} ({watcher.mode}), Ctrl+C để dừng")
+    try:
+        while watcher.is_alive():
+            watcher.join(1.0)
+    except KeyboardInterrupt:
+        watcher.stop()
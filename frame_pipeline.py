@@ -0,0 +1,269 @@
+"""
+Frame Pipeline - Tách đọc camera khỏi xử lý bằng nhiều thread
+- CaptureThread: đọc camera liên tục, chỉ giữ frame mới nhất trong ring buffer
+- DetectionWorker: Haar detection trên frame mới nhất
+- RecognitionWorker: embedding + so khớp, không chặn thread hiển thị
+- FreshFrameReader: read() giống cv2.VideoCapture nhưng luôn trả frame mới,
+  đo tuổi frame (ms) và số frame bị bỏ qua -> liveness không chấm frame cũ
+Thread hiển thị (imshow/waitKey) là thread chính: HighGUI trên macOS/Windows
+chỉ ổn định khi mọi lệnh GUI ở cùng 1 thread.
+"""
+import queue
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from instrumentation import timer, count
+
+
+RING_SIZE = 4
+READ_TIMEOUT = 2.0  # Giây chờ frame mới trước khi coi như mất camera
+AGE_WINDOW = 300  # Số lần đo tuổi frame giữ lại cho thống kê
+
+
+class LatestFrameBuffer:
+    """Ring buffer nhỏ, mỗi frame kèm số thứ tự và thời điểm capture"""
+
+    def __init__(self, size=RING_SIZE):
+        self._frames = deque(maxlen=size)
+        self._cond = threading.Condition()
+        self.seq = 0
+        self.closed = False
+
+    def put(self, frame, timestamp=None):
+        with self._cond:
+            self.seq += 1
+            if timestamp is None:
+                timestamp = time.monotonic()
+            self._frames.append((self.seq, timestamp, frame))
+            self._cond.notify_all()
+            return self.seq
+
+    def get(self, after_seq=0, timeout=READ_TIMEOUT):
+        """Frame mới nhất có seq > after_seq. Returns: (seq, ts, frame) hoặc None"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not self._frames or self._frames[-1][0] <= after_seq:
+                remaining = deadline - time.monotonic()
+                if self.closed or remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            return self._frames[-1]
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class CaptureThread(threading.Thread):
+    """Đọc camera liên tục để driver không dồn frame cũ"""
+
+    def __init__(self, video_capture, buffer):
+        super().__init__(name="capture", daemon=True)
+        self.video_capture = video_capture
+        self.buffer = buffer
+        self.captured = 0
+        self.failed = False
+        self._stop_event = threading.Event()
+
+        # Giảm buffer của driver nếu backend hỗ trợ
+        self.video_capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            with timer("capture.read"):
+                ret, frame = self.video_capture.read()
+            if not ret:
+                self.failed = True
+                break
+            self.buffer.put(frame)
+            self.captured += 1
+            count("frames.captured")
+        self.buffer.close()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class FreshFrameReader:
+    """
+    Thay thế cv2.VideoCapture cho các vòng lặp xử lý:
+    read() chờ frame mới hơn frame đã trả lần trước
+    """
+
+    def __init__(self, buffer, name="reader"):
+        self.buffer = buffer
+        self.name = name
+        self.last_seq = buffer.seq
+        self.frames_read = 0
+        self.skipped = 0
+        self.ages_ms = deque(maxlen=AGE_WINDOW)
+
+    def read(self):
+        item = self.buffer.get(self.last_seq)
+        if item is None:
+            return False, None
+        seq, timestamp, frame = item
+        if self.frames_read:
+            self.skipped += seq - self.last_seq - 1
+        self.last_seq = seq
+        self.frames_read += 1
+        self.ages_ms.append((time.monotonic() - timestamp) * 1000)
+        # Bản sao: người đọc có thể vẽ lên frame
+        return True, frame.copy()
+
+    def reset_stats(self):
+        self.frames_read = 0
+        self.skipped = 0
+        self.ages_ms.clear()
+
+    def stats(self):
+        ages = np.asarray(self.ages_ms) if self.ages_ms else np.zeros(1)
+        return {
+            'frames': self.frames_read,
+            'skipped': self.skipped,
+            'age_p50_ms': float(np.percentile(ages, 50)),
+            'age_max_ms': float(ages.max()),
+        }
+
+    def format_stats(self):
+        stats = self.stats()
+        return (f"{stats['frames']} frame, bỏ qua {stats['skipped']}, "
+                f"tuổi p50 {stats['age_p50_ms']:.0f}ms / max {stats['age_max_ms']:.0f}ms")
+
+    # Tương thích cv2.VideoCapture
+    def isOpened(self):
+        return not self.buffer.closed
+
+    def release(self):
+        pass
+
+
+class DetectionWorker(threading.Thread):
+    """Chạy detect_fn trên frame mới nhất, công bố (seq, frame, faces)"""
+
+    def __init__(self, buffer, detect_fn):
+        super().__init__(name="detection", daemon=True)
+        self.buffer = buffer
+        self.detect_fn = detect_fn
+        self.detections = 0
+        self._latest = (0, None, ())
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        last_seq = 0
+        while not self._stop_event.is_set():
+            item = self.buffer.get(last_seq, timeout=0.5)
+            if item is None:
+                if self.buffer.closed:
+                    break
+                continue
+            seq, _, frame = item
+            with timer("detect"):
+                faces = self.detect_fn(frame)
+            count("faces.detected", len(faces))
+            last_seq = seq
+            self.detections += 1
+            with self._cond:
+                self._latest = (seq, frame, faces)
+                self._cond.notify_all()
+
+    def latest(self):
+        with self._cond:
+            return self._latest
+
+    def wait_for(self, after_seq, timeout=READ_TIMEOUT):
+        """Kết quả detect trên frame có seq > after_seq (hoặc None khi hết giờ)"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._latest[0] <= after_seq:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            return self._latest
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class RecognitionWorker(threading.Thread):
+    """Nhận (frame, faces) qua hàng đợi, gọi recognize_fn ngoài thread hiển thị"""
+
+    def __init__(self, recognize_fn, max_pending=2):
+        super().__init__(name="recognition", daemon=True)
+        self.recognize_fn = recognize_fn
+        self.jobs = queue.Queue(maxsize=max_pending)
+        self.rejected = 0
+
+    def submit(self, frame, faces):
+        """False nếu hàng đợi đầy (đang bận nhận diện)"""
+        try:
+            self.jobs.put_nowait((frame, faces))
+            return True
+        except queue.Full:
+            self.rejected += 1
+            return False
+
+    @property
+    def busy(self):
+        return self.jobs.unfinished_tasks > 0
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                self.jobs.task_done()
+                break
+            try:
+                with timer("recognize.job"):
+                    self.recognize_fn(*job)
+            except Exception as e:
+                print(f"❌ Lỗi khi nhận diện: {e}")
+            finally:
+                self.jobs.task_done()
+
+    def stop(self):
+        try:
+            self.jobs.put(None, timeout=READ_TIMEOUT)
+        except queue.Full:
+            pass  # Thread daemon, sẽ dừng cùng process
+
+
+class FramePipeline:
+    """Ghép capture + detection + recognition; thread chính dùng reader để hiển thị"""
+
+    def __init__(self, video_capture, detect_fn, recognize_fn, ring_size=RING_SIZE):
+        self.buffer = LatestFrameBuffer(ring_size)
+        self.capture = CaptureThread(video_capture, self.buffer)
+        self.detection = DetectionWorker(self.buffer, detect_fn)
+        self.recognition = RecognitionWorker(recognize_fn)
+
+    def start(self):
+        self.capture.start()
+        self.detection.start()
+        self.recognition.start()
+        return self
+
+    def reader(self, name="reader"):
+        return FreshFrameReader(self.buffer, name)
+
+    def stop(self):
+        self.capture.stop()
+        self.detection.stop()
+        self.recognition.stop()
+        self.capture.join(timeout=READ_TIMEOUT)
+        self.detection.join(timeout=READ_TIMEOUT)
+        self.recognition.join(timeout=READ_TIMEOUT)
+
+    def stats(self):
+        return {
+            'captured': self.capture.captured,
+            'detections': self.detection.detections,
+            'recognition_rejected': self.recognition.rejected,
+        }
@@ -0,0 +1,495 @@
+"""
+Inference Pool - Chạy embedding và FaceMesh ở nhiều process, mỗi process 1 model riêng
+- Mỗi worker tự nạp model (TF / MediaPipe) -> không tranh nhau GIL và 1 process
+- Frame/crop đi qua multiprocessing.shared_memory (slot cấp sẵn lúc start):
+  client chép mảng vào slot, hàng đợi chỉ chở metadata (slot, offset, shape, box)
+- Kết quả (N x 128 float32 hoặc FrameAnalysis) về qua 1 pipe riêng mỗi worker
+  (không khóa chung giữa các process: worker bị kill giữa lúc gửi không chặn
+  worker khác), submit trả về Future (concurrent.futures), gọi được từ nhiều thread
+- Mỗi worker 1 hàng đợi: embed -> worker đang ít việc nhất;
+  analyze theo key (camera) -> luôn cùng 1 worker (FaceMesh giữ trạng thái tracking)
+- Số thread TF/BLAS/OpenCV của mỗi worker = số core / số worker (tránh tranh core)
+- Hết slot trống -> submit chờ (backpressure), không cấp phát thêm bộ nhớ
+- Lô crop lớn hơn 1 slot được chia sang nhiều slot rồi ghép kết quả
+- Worker chết (segfault, OOM) hoặc treo quá TASK_TIMEOUT: các việc đang chờ của nó
+  báo lỗi, slot được thu hồi, worker được khởi động lại (tối đa MAX_RESTARTS lần).
+  Đồng hồ treo chỉ tính từ lúc worker nạp xong model ("ready"); nạp quá
+  WORKER_START_TIMEOUT cũng coi là treo
+
+Dùng:
+    with InferencePool(workers=4) as pool:
+        embeddings = pool.embed(frame, boxes).result()
+        analysis = pool.analyze(frame, key="cam0").result()
+"""
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait as wait_connections
+
+import numpy as np
+
+
+POOL_WORKERS = min(4, os.cpu_count() or 1)
+SLOTS_PER_WORKER = 2  # Số yêu cầu đang bay tối đa mỗi worker
+SLOT_BYTES = 1920 * 1080 * 3  # Đủ cho 1 frame 1080p BGR
+SLOT_ALIGN = 64  # Byte, căn đầu mỗi mảng trong slot
+START_METHOD = "spawn"  # fork không an toàn với TensorFlow / MediaPipe đã nạp
+WORKER_START_TIMEOUT = 120.0  # Giây chờ worker nạp xong model
+HEALTH_INTERVAL = 0.5  # Giây giữa 2 lần kiểm tra worker còn sống
+TASK_TIMEOUT = 60.0  # Giây, 1 việc chạy lâu hơn -> coi worker bị treo, dừng nó
+MAX_RESTARTS = 3  # Số lần khởi động lại mỗi worker, quá -> bỏ worker đó
+SUBMIT_TIMEOUT = 30.0  # Giây chờ slot trống
+RESULT_TIMEOUT = 30.0  # Giây chờ kết quả ở PoolEmbeddingModel / PoolLivenessDetector
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+                   "TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS")
+
+
+def default_model_factory():
+    """Model embedding của app (Facenet qua DeepFace), nạp trong process worker"""
+    from model_service import EmbeddingModelService
+    return EmbeddingModelService().load(verbose=False)
+
+
+def default_liveness_factory():
+    from advanced_liveness_module import AdvancedLivenessDetector
+    return AdvancedLivenessDetector()
+
+
+def _limit_threads(threads):
+    """Gọi trước khi import TF/BLAS trong worker"""
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    import cv2
+    cv2.setNumThreads(threads)
+
+
+def _read_arrays(buffer, layout):
+    """layout: [(offset, shape, dtype)] -> các view numpy trên buffer (không copy)"""
+    return [np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+            for offset, shape, dtype in layout]
+
+
+def _gather(parts):
+    """Gộp Future của các phần (giữ thứ tự) thành 1 Future -> np.concatenate"""
+    combined = Future()
+    remaining = [len(parts)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        errors = [part.exception() for part in parts if part.exception() is not None]
+        if errors:
+            combined.set_exception(errors[0])
+        else:
+            combined.set_result(np.concatenate([part.result() for part in parts]))
+
+    for part in parts:
+        part.add_done_callback(done)
+    return combined
+
+
+def _worker_main(worker_id, slot_names, tasks, results, model_factory,
+                 liveness_factory, threads):
+    _limit_threads(threads)
+    # Worker spawn dùng chung resource_tracker với process chính -> chỉ process chính unlink
+    slots = [shared_memory.SharedMemory(name=name) for name in slot_names]
+    model = None
+    detectors = {}  # key -> detector FaceMesh riêng của camera đó
+    try:
+        start = time.perf_counter()
+        if model_factory is not None:
+            model = model_factory()
+        results.send(("ready", worker_id, time.perf_counter() - start))
+
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            task_id, kind, slot, layout, args = task
+            try:
+                arrays = _read_arrays(slots[slot].buf, layout)
+                if kind == "embed":
+                    boxes = args
+                    if boxes is None:
+                        crops = arrays  # Các crop được gửi thẳng
+                    else:
+                        from face_crops import extract_face_crops
+                        crops = extract_face_crops(arrays[0], boxes)
+                    result = model.embed(crops) if crops else np.zeros((0, 0), np.float32)
+                    result = np.array(result, dtype=np.float32)  # Không giữ view vào slot
+                elif kind == "analyze":
+                    detector = detectors.get(args)
+                    if detector is None:
+                        detector = detectors[args] = liveness_factory()
+                    result = detector.analyze_frame(arrays[0])
+                else:
+                    raise ValueError(f"Loại việc không hợp lệ: {kind}")
+                del arrays
+                results.send((task_id, worker_id, slot, True, result))
+            except Exception as e:
+                results.send((task_id, worker_id, slot, False, f"{type(e).__name__}: {e}"))
+    finally:
+        for detector in detectors.values():
+            detector.close()
+        for shm in slots:
+            shm.close()
+
+
+class InferencePool:
+    """
+    workers: số process; model_factory / liveness_factory: hàm (picklable, cấp module)
+    tạo model trong worker, None = worker không làm loại việc đó
+    """
+
+    def __init__(self, workers=POOL_WORKERS, model_factory=default_model_factory,
+                 liveness_factory=default_liveness_factory, slot_bytes=SLOT_BYTES,
+                 slots_per_worker=SLOTS_PER_WORKER, threads_per_worker=None,
+                 submit_timeout=SUBMIT_TIMEOUT, task_timeout=TASK_TIMEOUT):
+        self.workers = workers
+        self.model_factory = model_factory
+        self.liveness_factory = liveness_factory
+        self.slot_bytes = slot_bytes
+        self.n_slots = workers * slots_per_worker
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        self.submit_timeout = submit_timeout
+        self.task_timeout = task_timeout
+
+        self._context = mp.get_context(START_METHOD)
+        self._slots = []
+        self._free = queue.Queue()
+        self._tasks = [None] * workers
+        self._results = [None] * workers  # Đầu đọc pipe kết quả của từng worker
+        self._wake = None  # (đọc, ghi): stop() đánh thức thread nhận kết quả
+        self._processes = [None] * workers
+        self._collector = None
+        self._futures = {}  # task_id -> (future, worker, slot, lúc gửi)
+        self._dead = set()  # Worker đã bỏ (chết quá MAX_RESTARTS lần)
+        self._stopping = False
+        self._pending = [0] * workers
+        self._spawned_at = [None] * workers  # Lúc khởi động process
+        self._ready_at = [None] * workers  # Lúc worker báo nạp xong model, None = đang nạp
+        self._affinity = {}  # key -> worker
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self.completed = [0] * workers
+        self.restarts = [0] * workers
+        self.startup_seconds = []
+
+    # ---------------------------
+    # Vòng đời
+    # ---------------------------
+    def start(self):
+        for _ in range(self.n_slots):
+            self._slots.append(shared_memory.SharedMemory(create=True, size=self.slot_bytes))
+        for slot in range(self.n_slots):
+            self._free.put(slot)
+
+        self._wake = mp.Pipe(duplex=False)
+        for worker_id in range(self.workers):
+            self._tasks[worker_id] = self._context.Queue()
+            self._spawn(worker_id)
+
+        # Chờ mọi worker nạp xong model
+        deadline = time.monotonic() + WORKER_START_TIMEOUT
+        waiting = set(self._results)
+        while waiting:
+            ready = wait_connections(list(waiting), timeout=max(0.1, deadline - time.monotonic()))
+            if not ready:
+                self.stop()
+                raise TimeoutError("Worker inference không khởi động kịp")
+            for connection in ready:
+                waiting.discard(connection)
+                try:
+                    _, worker_id, seconds = connection.recv()
+                except (EOFError, OSError):
+                    self.stop()
+                    raise RuntimeError("Worker inference dừng trong lúc nạp model")
+                self._ready_at[worker_id] = time.monotonic()
+                self.startup_seconds.append(seconds)
+
+        self._collector = threading.Thread(target=self._collect, name="inference-results",
+                                           daemon=True)
+        self._collector.start()
+        return self
+
+    def _spawn(self, worker_id):
+        """Pipe kết quả mới mỗi lần: pipe của process cũ có thể còn dữ liệu gửi dở"""
+        reader, writer = self._context.Pipe(duplex=False)
+        process = self._context.Process(
+            target=_worker_main, name=f"inference-{worker_id}", daemon=True,
+            args=(worker_id, [shm.name for shm in self._slots], self._tasks[worker_id],
+                  writer, self.model_factory, self.liveness_factory,
+                  self.threads_per_worker)
+        )
+        process.start()
+        writer.close()  # Chỉ worker giữ đầu ghi -> worker chết thì reader nhận EOF
+        if self._results[worker_id] is not None:
+            self._results[worker_id].close()
+        self._results[worker_id] = reader
+        self._processes[worker_id] = process
+        self._spawned_at[worker_id] = time.monotonic()
+        self._ready_at[worker_id] = None
+
+    def stop(self):
+        with self._lock:
+            self._stopping = True  # Từ đây _check_workers không khởi động lại worker
+        for tasks in self._tasks:
+            if tasks is not None:
+                tasks.put(None)
+        for process in self._processes:
+            if process is None:
+                continue
+            process.join(timeout=5.0)
+            if process.is_alive():
+                process.terminate()
+        if self._collector is not None:
+            self._wake[1].send(None)
+            self._collector.join(timeout=2.0)
+            self._collector = None
+        for connection in self._results + list(self._wake or ()):
+            if connection is not None:
+                connection.close()
+        self._results = [None] * self.workers
+        self._wake = None
+        with self._lock:
+            entries, self._futures = self._futures, {}
+        for future, _, _, _ in entries.values():
+            future.set_exception(RuntimeError("InferencePool đã dừng"))
+        for shm in self._slots:
+            shm.close()
+            shm.unlink()
+        self._slots = []
+        self._tasks = [None] * self.workers
+        self._processes = [None] * self.workers
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    # ---------------------------
+    # Gửi việc
+    # ---------------------------
+    def _write(self, slot, arrays):
+        """Chép các mảng vào slot, trả về layout [(offset, shape, dtype)]"""
+        buffer = self._slots[slot].buf
+        layout = []
+        offset = 0
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            offset = -(-offset // SLOT_ALIGN) * SLOT_ALIGN
+            if offset + array.nbytes > self.slot_bytes:
+                raise ValueError(f"Dữ liệu lớn hơn slot ({self.slot_bytes} byte), "
+                                 f"tăng slot_bytes")
+            np.ndarray(array.shape, array.dtype, buffer=buffer, offset=offset)[...] = array
+            layout.append((offset, array.shape, array.dtype.str))
+            offset += array.nbytes
+        return layout
+
+    def _choose_worker(self, key):
+        """Gọi khi giữ _lock"""
+        alive = [w for w in range(self.workers) if w not in self._dead]
+        if not alive:
+            raise RuntimeError("Mọi worker inference đã chết")
+        if key is None:
+            return min(alive, key=lambda w: self._pending[w])
+        if key not in self._affinity:
+            # Key mới -> worker đang giữ ít key nhất (chia đều các camera)
+            owned = [0] * self.workers
+            for worker in self._affinity.values():
+                owned[worker] += 1
+            self._affinity[key] = min(alive, key=lambda w: (owned[w], self._pending[w]))
+        return self._affinity[key]
+
+    def _submit(self, kind, arrays, args, key=None):
+        future = Future()
+        try:
+            slot = self._free.get(timeout=self.submit_timeout)  # Chờ nếu mọi slot đang bận
+        except queue.Empty:
+            raise TimeoutError(f"Không có slot trống sau {self.submit_timeout:g}s")
+        try:
+            layout = self._write(slot, arrays)
+            with self._lock:
+                worker = self._choose_worker(key)
+                task_id = self._next_id
+                self._next_id += 1
+                self._pending[worker] += 1
+                self._futures[task_id] = (future, worker, slot, time.monotonic())
+                # Trong khóa: _check_workers đổi hàng đợi của worker chết cũng trong khóa
+                self._tasks[worker].put((task_id, kind, slot, layout, args))
+        except Exception:
+            self._free.put(slot)
+            raise
+        return future
+
+    def _chunks(self, crops):
+        """Chia crop thành các nhóm vừa 1 slot (giữ thứ tự)"""
+        chunk, used = [], 0
+        for crop in crops:
+            size = -(-crop.nbytes // SLOT_ALIGN) * SLOT_ALIGN
+            if chunk and used + size > self.slot_bytes:
+                yield chunk
+                chunk, used = [], 0
+            chunk.append(crop)
+            used += size
+        if chunk:
+            yield chunk
+
+    def embed(self, frame, boxes=None):
+        """Embed các box (x, y, w, h) của frame (crop ở worker). Future -> (N, D)"""
+        if boxes is None:
+            return self._submit("embed", [frame], None)
+        return self._submit("embed", [frame], [tuple(int(v) for v in box) for box in boxes])
+
+    def embed_crops(self, crops):
+        """
+        Embed danh sách crop BGR uint8 (giống model.embed). Future -> (N, D)
+        Lô lớn hơn 1 slot được gửi thành nhiều việc, kết quả ghép lại theo thứ tự
+        """
+        crops = [np.asarray(crop) for crop in crops]
+        parts = [self._submit("embed", chunk, None) for chunk in self._chunks(crops)]
+        if not parts:
+            future = Future()
+            future.set_result(np.zeros((0, 0), dtype=np.float32))
+            return future
+        return parts[0] if len(parts) == 1 else _gather(parts)
+
+    def analyze(self, frame, key):
+        """FaceMesh của camera key (luôn cùng 1 worker). Future -> FrameAnalysis"""
+        return self._submit("analyze", [frame], key, key=("analyze", key))
+
+    # ---------------------------
+    # Nhận kết quả
+    # ---------------------------
+    def _collect(self):
+        next_check = time.monotonic() + HEALTH_INTERVAL
+        closed = set()  # Pipe đã EOF (worker chết), chờ _check_workers thay pipe mới
+        while True:
+            connections = [c for c in self._results if c is not None and c not in closed]
+            for connection in wait_connections(connections + [self._wake[0]],
+                                               timeout=HEALTH_INTERVAL):
+                if connection is self._wake[0]:
+                    return
+                try:
+                    message = connection.recv()
+                except (EOFError, OSError):
+                    closed.add(connection)
+                    continue
+                if message[0] == "ready":  # Worker khởi động lại đã nạp xong model
+                    with self._lock:
+                        self._ready_at[message[1]] = time.monotonic()
+                else:
+                    self._deliver(*message)
+            if time.monotonic() >= next_check:
+                next_check = time.monotonic() + HEALTH_INTERVAL
+                self._check_workers()
+                closed &= set(self._results)
+
+    def _deliver(self, task_id, worker, slot, ok, result):
+        with self._lock:
+            entry = self._futures.pop(task_id, None)
+            if entry is None:
+                return  # Việc đã bị hủy khi worker chết, slot đã được thu hồi
+            self._pending[worker] -= 1
+            self.completed[worker] += 1
+        self._free.put(slot)  # Worker đã đọc xong slot
+        if ok:
+            entry[0].set_result(result)
+        else:
+            entry[0].set_exception(RuntimeError(result))
+
+    def _check_workers(self):
+        """Worker chết/treo -> hủy việc đang chờ, thu hồi slot, khởi động lại"""
+        now = time.monotonic()
+        for worker, process in enumerate(self._processes):
+            if self._stopping or worker in self._dead or process is None:
+                continue
+            if process.is_alive():
+                with self._lock:
+                    ready_at = self._ready_at[worker]
+                    oldest = min((submitted for _, w, _, submitted in self._futures.values()
+                                  if w == worker), default=now)
+                if ready_at is None:
+                    # Đang nạp model: việc đã gửi chỉ nằm chờ trong hàng đợi, chưa phải treo
+                    if now - self._spawned_at[worker] <= WORKER_START_TIMEOUT:
+                        continue
+                    print(f"⚠️ Worker inference {worker} nạp model quá "
+                          f"{WORKER_START_TIMEOUT:g}s, dừng")
+                elif now - max(oldest, ready_at) <= self.task_timeout:
+                    continue
+                else:
+                    print(f"⚠️ Worker inference {worker} treo quá {self.task_timeout:g}s, dừng")
+                process.terminate()
+                process.join(timeout=5.0)
+
+            with self._lock:
+                if self._stopping:
+                    return
+                lost = [task_id for task_id, entry in self._futures.items()
+                        if entry[1] == worker]
+                entries = [self._futures.pop(task_id) for task_id in lost]
+                self._pending[worker] = 0
+                restart = self.restarts[worker] < MAX_RESTARTS
+                if restart:
+                    self.restarts[worker] += 1
+                    # Hàng đợi mới: việc còn trong hàng đợi cũ đã bị hủy ở trên.
+                    # Khởi động trong khóa để stop() luôn thấy process mới
+                    self._tasks[worker] = self._context.Queue()
+                    self._spawn(worker)
+                else:
+                    self._dead.add(worker)
+                    self._affinity = {k: w for k, w in self._affinity.items() if w != worker}
+            error = RuntimeError(f"Worker inference {worker} đã dừng "
+                                 f"(exit code {process.exitcode})")
+            for future, _, slot, _ in entries:
+                self._free.put(slot)
+                future.set_exception(error)
+            if restart:
+                print(f"⚠️ {error}, đã khởi động lại ({self.restarts[worker]}/{MAX_RESTARTS})")
+            else:
+                print(f"❌ {error}, bỏ worker này")
+
+    @property
+    def pending(self):
+        with self._lock:
+            return sum(self._pending)
+
+
+class PoolEmbeddingModel:
+    """Giao diện giống EmbeddingModelService.embed cho code gọi đồng bộ"""
+
+    def __init__(self, pool, timeout=RESULT_TIMEOUT):
+        self.pool = pool
+        self.timeout = timeout
+
+    def embed(self, batch_of_crops):
+        if len(batch_of_crops) == 0:
+            return np.zeros((0, 0), dtype=np.float32)
+        return self.pool.embed_crops(batch_of_crops).result(timeout=self.timeout)
+
+    def embed_async(self, batch_of_crops):
+        return self.pool.embed_crops(batch_of_crops)
+
+
+class PoolLivenessDetector:
+    """Thay AdvancedLivenessDetector: analyze_frame chạy ở worker của pool"""
+
+    def __init__(self, pool, key, timeout=RESULT_TIMEOUT):
+        self.pool = pool
+        self.key = key
+        self.timeout = timeout
+
+    def analyze_frame(self, frame):
+        return self.pool.analyze(frame, self.key).result(timeout=self.timeout)
+
+    def close(self):
+        pass  # Detector thật đóng khi pool dừng
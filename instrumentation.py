@@ -0,0 +1,353 @@
+"""
+Instrumentation - Đo thời gian từng bước của pipeline, gần như miễn phí khi tắt
+- Bật bằng biến môi trường FACE_METRICS=1 (đọc 1 lần lúc import)
+- timer("detect") / @timed("embed"): histogram p50/p95/p99 theo bước (ms)
+- count("faces.detected", n): bộ đếm sự kiện
+- Reporter: ghi snapshot định kỳ ra FACE_METRICS_OUT
+  (.json hoặc .prom = định dạng text của Prometheus, cho node_exporter textfile)
+- Profiler: bật/tắt theo yêu cầu (SIGUSR1 hoặc phím 'p'), ghi ra FACE_PROFILE_DIR
+  file .prof (cProfile của thread gọi, xem bằng snakeviz) và .folded
+  (stack lấy mẫu của mọi thread, dùng cho flamegraph.pl / speedscope)
+
+Dùng từ dòng lệnh:
+    FACE_METRICS=1 FACE_METRICS_OUT=metrics.prom python face_recognition_with_blink.py
+    kill -USR1 <pid>    # bắt đầu / dừng profile
+    python instrumentation.py metrics.json    # in bảng tóm tắt của 1 snapshot
+"""
+import cProfile
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+import numpy as np
+
+
+ENABLED = os.environ.get("FACE_METRICS", "0").lower() not in ("", "0", "false", "no")
+METRICS_OUT = os.environ.get("FACE_METRICS_OUT", "metrics.json")
+METRICS_INTERVAL = float(os.environ.get("FACE_METRICS_INTERVAL", "10"))  # Giây
+PROFILE_DIR = os.environ.get("FACE_PROFILE_DIR", "profiles")
+HISTOGRAM_WINDOW = 4096  # Số mẫu gần nhất giữ lại cho mỗi bước
+SAMPLE_INTERVAL = 0.005  # Giây giữa 2 lần lấy mẫu stack
+PROMETHEUS_PREFIX = "face_attendance"
+
+
+class Histogram:
+    """Cửa sổ các mẫu gần nhất (percentile) + tổng tích luỹ (count/sum)"""
+
+    def __init__(self, window=HISTOGRAM_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def summary(self):
+        arr = np.asarray(self.samples, dtype=np.float64)
+        p50, p95, p99 = np.percentile(arr, [50, 95, 99]) if len(arr) else (0.0, 0.0, 0.0)
+        return {
+            'count': self.count,
+            'sum_ms': round(self.total, 3),
+            'mean_ms': round(self.total / self.count, 3) if self.count else 0.0,
+            'p50_ms': round(float(p50), 3),
+            'p95_ms': round(float(p95), 3),
+            'p99_ms': round(float(p99), 3),
+            'max_ms': round(float(arr.max()), 3) if len(arr) else 0.0,
+        }
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = Counter()
+        self.started = time.time()
+
+    def observe(self, stage, ms):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(ms)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'timestamp': time.time(),
+                'uptime_s': round(time.time() - self.started, 1),
+                'stages': {stage: h.summary() for stage, h in sorted(self.histograms.items())},
+                'counters': dict(sorted(self.counters.items())),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.started = time.time()
+
+
+registry = Registry()
+
+
+class _NullTimer:
+    """Trả về khi tắt: không đọc đồng hồ, không cấp phát"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Timer:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        registry.observe(self.stage, (time.perf_counter() - self.start) * 1000)
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def enable(enabled=True):
+    """Bật/tắt bằng code (benchmark). @timed chỉ có hiệu lực với hàm định nghĩa sau đó"""
+    global ENABLED
+    ENABLED = enabled
+
+
+def timer(stage):
+    """with timer("detect"): ... -> ghi thời gian vào histogram của bước"""
+    return _Timer(stage) if ENABLED else _NULL_TIMER
+
+
+def observe(stage, ms):
+    if ENABLED:
+        registry.observe(stage, ms)
+
+
+def count(name, n=1):
+    if ENABLED:
+        registry.count(name, n)
+
+
+def timed(stage):
+    """Decorator; khi tắt trả về nguyên hàm gốc (không thêm lớp gọi nào)"""
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        def wrapper(*args, **kwargs):
+            with _Timer(stage):
+                return fn(*args, **kwargs)
+        wrapper.__name__ = fn.__name__
+        wrapper.__doc__ = fn.__doc__
+        wrapper.__wrapped__ = fn
+        return wrapper
+    return decorate
+
+
+def snapshot():
+    return registry.snapshot()
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def format_prometheus(snap):
+    """Định dạng text exposition của Prometheus (summary + counter)"""
+    name = f"{PROMETHEUS_PREFIX}_stage_duration_ms"
+    lines = [f"# HELP {name} Thời gian mỗi bước của pipeline (ms)",
+             f"# TYPE {name} summary"]
+    for stage, s in snap['stages'].items():
+        for quantile, key in (("0.5", 'p50_ms'), ("0.95", 'p95_ms'), ("0.99", 'p99_ms')):
+            lines.append(f'{name}{{stage="{_label(stage)}",quantile="{quantile}"}} {s[key]}')
+        lines.append(f'{name}_sum{{stage="{_label(stage)}"}} {s["sum_ms"]}')
+        lines.append(f'{name}_count{{stage="{_label(stage)}"}} {s["count"]}')
+
+    name = f"{PROMETHEUS_PREFIX}_events_total"
+    lines += [f"# HELP {name} Số sự kiện theo loại", f"# TYPE {name} counter"]
+    for event, value in snap['counters'].items():
+        lines.append(f'{name}{{event="{_label(event)}"}} {value}')
+
+    name = f"{PROMETHEUS_PREFIX}_uptime_seconds"
+    lines += [f"# TYPE {name} gauge", f"{name} {snap['uptime_s']}"]
+    return "\n".join(lines) + "\n"
+
+
+def write_snapshot(path=METRICS_OUT):
+    """Ghi snapshot (ghi file tạm rồi os.replace -> người đọc không thấy file dở)"""
+    snap = snapshot()
+    if path.endswith(('.prom', '.txt')):
+        text = format_prometheus(snap)
+    else:
+        text = json.dumps(snap, ensure_ascii=False, indent=2)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+    return snap
+
+
+def format_summary(snap=None):
+    snap = snap or snapshot()
+    lines = [f"   {'bước':<24} {'count':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"]
+    for stage, s in snap['stages'].items():
+        lines.append(f"   {stage:<24} {s['count']:>8} {s['p50_ms']:>9.2f} "
+                     f"{s['p95_ms']:>9.2f} {s['p99_ms']:>9.2f}")
+    for event, value in snap['counters'].items():
+        lines.append(f"   {event:<24} {value:>8}")
+    return "\n".join(lines)
+
+
+class Reporter(threading.Thread):
+    """Ghi snapshot mỗi interval giây, ghi lần cuối khi stop()"""
+
+    def __init__(self, path=METRICS_OUT, interval=METRICS_INTERVAL):
+        super().__init__(name="metrics-reporter", daemon=True)
+        self.path = path
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self._write()
+
+    def _write(self):
+        try:
+            write_snapshot(self.path)
+        except OSError as e:
+            print(f"⚠️ Không ghi được metrics ({self.path}): {e}")
+
+    def stop(self):
+        self._stop_event.set()
+        self._write()
+
+
+class StackSampler(threading.Thread):
+    """Lấy mẫu stack mọi thread -> định dạng folded ('a;b;c số_mẫu') cho flamegraph"""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=1.0)
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, samples in self.stacks.most_common():
+                f.write(f"{stack} {samples}\n")
+
+
+class Profiler:
+    """start() ... stop(): cProfile thread gọi start + lấy mẫu stack mọi thread"""
+
+    def __init__(self, out_dir=PROFILE_DIR):
+        self.out_dir = out_dir
+        self._profile = None
+        self._sampler = None
+
+    @property
+    def running(self):
+        return self._profile is not None
+
+    def start(self):
+        if self.running:
+            return
+        self._profile = cProfile.Profile()
+        self._sampler = StackSampler()
+        self._sampler.start()
+        self._profile.enable()
+        print("🔬 Bắt đầu profile (gọi lại để dừng và ghi file)")
+
+    def stop(self):
+        """Returns: (đường dẫn .prof, đường dẫn .folded) hoặc None nếu chưa chạy"""
+        if not self.running:
+            return None
+        self._profile.disable()
+        self._sampler.stop()
+        os.makedirs(self.out_dir, exist_ok=True)
+        base = os.path.join(self.out_dir, time.strftime("profile_%Y%m%d_%H%M%S"))
+        self._profile.dump_stats(f"{base}.prof")
+        self._sampler.write(f"{base}.folded")
+        self._profile = self._sampler = None
+        print(f"💾 Profile: {base}.prof (snakeviz) và {base}.folded (flamegraph)")
+        return f"{base}.prof", f"{base}.folded"
+
+    def toggle(self):
+        return self.stop() if self.running else self.start()
+
+
+profiler = Profiler()
+_reporter = None
+
+
+def setup():
+    """Gọi 1 lần khi khởi động app: chạy reporter + gắn SIGUSR1 (chỉ khi ENABLED)"""
+    global _reporter
+    if not ENABLED or _reporter is not None:
+        return
+    _reporter = Reporter()
+    _reporter.start()
+    if hasattr(signal, 'SIGUSR1') and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1, lambda signum, frame: profiler.toggle())
+    print(f"📊 Metrics: ghi {METRICS_OUT} mỗi {METRICS_INTERVAL:.0f}s")
+
+
+def shutdown(print_summary=True):
+    """Dừng profile đang chạy, ghi snapshot cuối và in bảng tóm tắt"""
+    global _reporter
+    if not ENABLED:
+        return
+    profiler.stop()
+    if _reporter is not None:
+        _reporter.stop()
+        _reporter = None
+    if print_summary:
+        print(f"\n📊 Thời gian theo bước:\n{format_summary()}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(1)
+    with open(sys.argv[1], encoding='utf-8') as f:
+        print(format_summary(json.load(f)))
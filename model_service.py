@@ -0,0 +1,123 @@
+"""
+Model Service - Giữ model embedding luôn nạp sẵn và "ấm" trong suốt phiên chạy
+- Load Facenet 1 lần lúc khởi động, chạy warm-up trên tensor giả
+- embed(batch_of_crops): gọi thẳng model Keras, bỏ qua đường đi của DeepFace.represent
+- Đo cold start và latency p50/p99 khi đã ấm, in ra lúc boot
+"""
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from enrollment import MODEL_NAME, get_deepface, resize_with_padding
+
+
+WARMUP_RUNS = 20  # Số lần đo latency khi ấm lúc boot
+LATENCY_WINDOW = 1000  # Giữ N lần đo gần nhất
+
+
+class EmbeddingModelService:
+    """Model nhận diện dùng chung, an toàn khi gọi từ nhiều thread"""
+
+    def __init__(self, model_name=MODEL_NAME):
+        self.model_name = model_name
+        self.client = None
+        self.input_shape = None
+        self._keras_model = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+        self.load_seconds = None
+        self.first_inference_seconds = None
+        self.latencies_ms = deque(maxlen=LATENCY_WINDOW)
+
+    @property
+    def loaded(self):
+        return self.client is not None
+
+    def load(self, warmup_runs=WARMUP_RUNS, verbose=True):
+        """Build model, chạy inference đầu tiên (build graph TF) rồi đo latency khi ấm"""
+        with self._load_lock:
+            if not self.loaded:
+                self._load(warmup_runs)
+                if verbose:
+                    self.print_report()
+        return self
+
+    def _load(self, warmup_runs):
+        start = time.perf_counter()
+        self.client = get_deepface().build_model(self.model_name)
+        self.input_shape = tuple(self.client.input_shape)
+        # Model Keras bên trong -> gọi trực tiếp, không qua forward() của DeepFace
+        self._keras_model = getattr(self.client, 'model', None)
+        if not callable(self._keras_model):
+            self._keras_model = None
+        self.load_seconds = time.perf_counter() - start
+
+        dummy = np.zeros((1, *self.input_shape, 3), dtype=np.float32)
+        start = time.perf_counter()
+        self.forward(dummy)
+        self.first_inference_seconds = time.perf_counter() - start
+
+        # Chỉ giữ số đo khi đã ấm
+        self.latencies_ms.clear()
+        for _ in range(warmup_runs):
+            self.forward(dummy)
+
+    def forward(self, batch):
+        """Inference trên batch đã tiền xử lý (N, H, W, 3) float32. Returns: (N, D)"""
+        batch = np.asarray(batch, dtype=np.float32)
+        start = time.perf_counter()
+        with self._lock:
+            if self._keras_model is not None:
+                embeddings = self._keras_model(batch, training=False).numpy()
+            else:
+                embeddings = self.client.forward(batch)
+        self.latencies_ms.append((time.perf_counter() - start) * 1000)
+        return np.asarray(embeddings, dtype=np.float32).reshape(len(batch), -1)
+
+    def preprocess(self, crop):
+        """Crop BGR uint8 -> float32 [0, 1] đúng kích thước model"""
+        return resize_with_padding(crop.astype(np.float32) / 255.0, self.input_shape)
+
+    def embed(self, batch_of_crops):
+        """Embed danh sách crop BGR (uint8) trong 1 lần forward. Returns: (N, D) float32"""
+        if not self.loaded:
+            self.load(verbose=False)
+        if len(batch_of_crops) == 0:
+            return np.zeros((0, 0), dtype=np.float32)
+        return self.forward(np.stack([self.preprocess(crop) for crop in batch_of_crops]))
+
+    def latency_percentiles(self):
+        """(p50, p99) ms của các lần inference gần nhất"""
+        if not self.latencies_ms:
+            return None, None
+        values = np.asarray(self.latencies_ms)
+        return float(np.percentile(values, 50)), float(np.percentile(values, 99))
+
+    def print_report(self):
+        cold = self.load_seconds + self.first_inference_seconds
+        print(f"⏱️  Model {self.model_name}: load {self.load_seconds:.2f}s, "
+              f"inference đầu tiên {self.first_inference_seconds:.2f}s "
+              f"(cold start {cold:.2f}s)")
+        p50, p99 = self.latency_percentiles()
+        if p50 is not None:
+            print(f"⏱️  Latency khi ấm (batch=1, {len(self.latencies_ms)} lần): "
+                  f"p50 {p50:.1f}ms | p99 {p99:.1f}ms")
+
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def get_model_service(model_name=MODEL_NAME, load=True):
+    """Service dùng chung cho cả process (mỗi model chỉ nạp 1 lần)"""
+    with _services_lock:
+        service = _services.get(model_name)
+        if service is None:
+            service = EmbeddingModelService(model_name)
+            _services[model_name] = service
+    if load:
+        service.load()
+    return service
@@ -0,0 +1,486 @@
+"""
+Multi-Camera Server - 1 process phục vụ nhiều kiosk/camera
+- 1 model embedding + 1 gallery dùng chung cho N nguồn (thay vì mỗi kiosk 1 bản)
+- Mỗi camera: thread capture (chỉ giữ frame mới nhất) + thread detect Haar
+- Mọi yêu cầu nhận diện đi vào 1 hàng đợi chung, gom micro-batch rồi
+  embed trong 1 lần forward
+- --workers N: embed và FaceMesh chạy ở N process (inference_pool), nhiều batch
+  song song trên nhiều core thay vì 1 model trong 1 process
+- Liveness riêng từng camera và từng khuôn mặt: FaceMesh của camera đó, trạng
+  thái nháy mắt theo track (IoUTracker); chỉ mặt đã nháy mắt mới được nhận diện + ghi
+- Báo cáo định kỳ FPS và độ sâu hàng đợi của từng camera
+- Camera giả đọc từ file (fake:<video|ảnh>) để test không cần webcam
+
+Dùng từ dòng lệnh:
+    python multi_camera_server.py 0 1
+    python multi_camera_server.py fake:lecture1.mp4 fake:lecture2.mp4 --duration 60
+    python multi_camera_server.py 0 1 2 3 --workers 4
+"""
+import argparse
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from face_crops import extract_face_crops
+from face_tracker import IoUTracker, iou
+from frame_pipeline import LatestFrameBuffer, CaptureThread, FreshFrameReader
+
+
+MAX_BATCH = 16  # Số crop tối đa trong 1 lần forward
+BATCH_WAIT_MS = 10  # Chờ thêm yêu cầu tối đa N ms sau yêu cầu đầu tiên
+RECOGNIZE_INTERVAL = 1.0  # Giây tối thiểu giữa 2 lần gửi nhận diện của 1 camera
+LIVENESS_WINDOW = 3.0  # Nháy mắt hợp lệ trong N giây gần nhất
+LIVENESS_IOU = 0.3  # Box FaceMesh phải trùng box Haar của track tối thiểu chừng này
+STATS_INTERVAL = 5.0
+FAKE_CAMERA_FPS = 30
+
+
+class FileCamera:
+    """Camera giả: phát video/ảnh theo FPS cố định, lặp lại khi hết (giống cv2.VideoCapture)"""
+
+    def __init__(self, path, fps=None, loop=True):
+        self.path = path
+        self.loop = loop
+        self._image = None
+        self._capture = None
+        if path.lower().endswith(('.jpg', '.jpeg', '.png')):
+            self._image = cv2.imread(path)
+            source_fps = 0
+        else:
+            self._capture = cv2.VideoCapture(path)
+            source_fps = self._capture.get(cv2.CAP_PROP_FPS)
+        self.fps = fps or source_fps or FAKE_CAMERA_FPS
+        self._next_time = time.monotonic()
+
+    def isOpened(self):
+        if self._image is not None:
+            return True
+        return self._capture is not None and self._capture.isOpened()
+
+    def set(self, prop, value):
+        return False
+
+    def read(self):
+        # Giữ nhịp như camera thật
+        delay = self._next_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._next_time = max(self._next_time, time.monotonic() - 1.0) + 1.0 / self.fps
+
+        if self._image is not None:
+            return True, self._image.copy()
+        ret, frame = self._capture.read()
+        if not ret and self.loop:
+            self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self._capture.read()
+        return ret, frame
+
+    def release(self):
+        if self._capture is not None:
+            self._capture.release()
+
+
+def open_source(source, fake_fps=None):
+    """'0' -> webcam 0, 'fake:<file>' -> FileCamera, còn lại -> file/URL cho OpenCV"""
+    if source.startswith("fake:"):
+        return FileCamera(source[len("fake:"):], fps=fake_fps)
+    if source.isdigit():
+        return cv2.VideoCapture(int(source))
+    return cv2.VideoCapture(source)
+
+
+class BlinkLivenessState:
+    """
+    Liveness thụ động cho 1 camera, riêng từng khuôn mặt (track của IoUTracker):
+    FaceMesh chỉ theo 1 mặt mỗi frame -> EAR được ghi vào track có box trùng box
+    FaceMesh. Track là người thật nếu thấy 1 lần nháy mắt thật (mở -> nhắm vài
+    frame -> mở, xem BlinkDetector) trong LIVENESS_WINDOW giây gần nhất; ảnh in
+    cạnh người thật không "mượn" được lần nháy mắt đó
+    """
+
+    def __init__(self, detector, window=LIVENESS_WINDOW, min_iou=LIVENESS_IOU):
+        self.detector = detector
+        self.window = window
+        self.min_iou = min_iou
+        self.tracker = IoUTracker()
+        self.frame_index = 0
+        self.blinks = 0
+        self._blink = {}  # track_id -> BlinkDetector (chuỗi EAR của mặt đó)
+        self._live_until = {}  # track_id -> hết hạn người thật
+
+    def _face_track(self, matched, analysis):
+        """Track mà FaceMesh đang theo (IoU cao nhất với box FaceMesh) hoặc None"""
+        if not matched or not analysis.face_found or analysis.face_box is None:
+            return None
+        scores = [iou(box, analysis.face_box) for _, box in matched]
+        best = int(np.argmax(scores))
+        return matched[best][0] if scores[best] >= self.min_iou else None
+
+    def update(self, frame, faces, now):
+        """faces: box Haar của frame. Returns: các box đang được coi là người thật"""
+        from advanced_liveness_module import BlinkDetector
+
+        self.frame_index += 1
+        matched, finished = self.tracker.update(faces, self.frame_index)
+        for track in finished:
+            self._blink.pop(track.track_id, None)
+            self._live_until.pop(track.track_id, None)
+        try:
+            analysis = self.detector.analyze_frame(frame)
+            face_track = self._face_track(matched, analysis)
+        except Exception as e:
+            # Worker của pool chết/treo: không làm chết thread camera
+            print(f"❌ Lỗi liveness: {e}")
+            face_track = None
+
+        live = []
+        for track, box in matched:
+            blink = self._blink.get(track.track_id)
+            if blink is None:
+                blink = self._blink[track.track_id] = BlinkDetector()
+            if track is face_track:
+                if blink.update(analysis.avg_ear):
+                    self.blinks += 1
+                    self._live_until[track.track_id] = now + self.window
+            else:
+                blink.reset()  # Frame này không có EAR của mặt đó -> chuỗi bị đứt
+            if now < self._live_until.get(track.track_id, 0.0):
+                live.append(box)
+        return live
+
+    def close(self):
+        self.detector.close()
+
+
+class InferenceBatcher(threading.Thread):
+    """Hàng đợi nhận diện chung: gom crop của nhiều camera vào 1 batch"""
+
+    def __init__(self, model, match_fn, max_batch=MAX_BATCH, max_wait_ms=BATCH_WAIT_MS):
+        super().__init__(name="inference", daemon=True)
+        self.model = model
+        self.match_fn = match_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.requests = queue.Queue()
+        self.depth = {}  # camera_id -> số yêu cầu đang chờ
+        self._depth_lock = threading.Lock()
+
+        self.batches = 0
+        self.crops = 0
+        self.latencies_ms = deque(maxlen=1000)
+
+    def submit(self, camera_id, crops, callback):
+        with self._depth_lock:
+            self.depth[camera_id] = self.depth.get(camera_id, 0) + 1
+        self.requests.put((camera_id, crops, callback, time.monotonic()))
+
+    def queue_depth(self, camera_id):
+        with self._depth_lock:
+            return self.depth.get(camera_id, 0)
+
+    def run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            batch = [request]
+            n_crops = len(request[1])
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while n_crops < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                batch.append(request)
+                n_crops += len(request[1])
+            self._process(batch)
+            if stop:
+                break
+
+    def _process(self, batch):
+        crops = [crop for _, request_crops, _, _ in batch for crop in request_crops]
+        self.batches += 1
+        self.crops += len(crops)
+        embed_async = getattr(self.model, 'embed_async', None)
+        try:
+            if embed_async is not None:
+                # Pool nhiều process: không chờ, batch sau được gửi ngay
+                future = embed_async(crops)
+                future.add_done_callback(lambda f: self._finish(batch, f))
+                return
+            embeddings = self.model.embed(crops)
+        except Exception as e:
+            print(f"❌ Lỗi khi embed batch: {e}")
+            embeddings = None
+        self._deliver(batch, embeddings)
+
+    def _finish(self, batch, future):
+        try:
+            embeddings = future.result()
+        except Exception as e:
+            print(f"❌ Lỗi khi embed batch: {e}")
+            embeddings = None
+        self._deliver(batch, embeddings)
+
+    def _deliver(self, batch, embeddings):
+        offset = 0
+        now = time.monotonic()
+        for camera_id, request_crops, callback, submitted in batch:
+            count = len(request_crops)
+            results = []
+            if embeddings is not None:
+                results = [self.match_fn(e) for e in embeddings[offset:offset + count]]
+            offset += count
+            with self._depth_lock:
+                self.depth[camera_id] -= 1
+            self.latencies_ms.append((now - submitted) * 1000)
+            try:
+                callback(results)
+            except Exception as e:
+                print(f"❌ [{camera_id}] Lỗi khi xử lý kết quả: {e}")
+
+    def stop(self):
+        self.requests.put(None)
+
+
+class CameraWorker(threading.Thread):
+    """Detect + liveness + gửi nhận diện cho 1 camera"""
+
+    def __init__(self, camera_id, video_capture, batcher, on_identified,
+                 liveness=None, recognize_interval=RECOGNIZE_INTERVAL):
+        super().__init__(name=f"camera-{camera_id}", daemon=True)
+        from face_recognition_with_blink import HAAR_CASCADE_PATH
+
+        self.camera_id = camera_id
+        self.video_capture = video_capture
+        self.batcher = batcher
+        self.on_identified = on_identified
+        self.liveness = liveness
+        self.recognize_interval = recognize_interval
+        # CascadeClassifier riêng mỗi thread
+        self.face_cascade = cv2.CascadeClassifier(HAAR_CASCADE_PATH)
+
+        self.buffer = LatestFrameBuffer()
+        self.capture = CaptureThread(video_capture, self.buffer)
+        self.reader = FreshFrameReader(self.buffer, camera_id)
+
+        self.frames = 0
+        self.faces = 0
+        self.submitted = 0
+        self.identified = 0
+        self.rejected_liveness = 0
+        self._pending = False
+        self._last_submit = 0.0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        from face_recognition_with_blink import detect_faces
+
+        self.capture.start()
+        while not self._stop_event.is_set():
+            ret, frame = self.reader.read()
+            if not ret:
+                if self.buffer.closed:
+                    print(f"⚠️ [{self.camera_id}] Mất kết nối camera")
+                    break
+                continue
+            self.frames += 1
+
+            faces = detect_faces(self.face_cascade, frame)
+            if len(faces) == 0:
+                continue
+            self.faces += len(faces)
+
+            now = time.monotonic()
+            # Liveness chỉ chạy khi có mặt trong khung hình; chỉ gửi các mặt đã qua
+            if self.liveness is not None:
+                live_faces = self.liveness.update(frame, faces, now)
+                self.rejected_liveness += len(faces) - len(live_faces)
+                if not live_faces:
+                    continue
+                faces = live_faces
+            if self._pending or now - self._last_submit < self.recognize_interval:
+                continue
+
+            self._pending = True
+            self._last_submit = now
+            self.submitted += 1
+            self.batcher.submit(self.camera_id, extract_face_crops(frame, faces),
+                                self._on_results)
+
+    def _on_results(self, results):
+        self._pending = False
+        for name, distance in results:
+            if name != "Unknown":
+                self.identified += 1
+                self.on_identified(self.camera_id, name, distance)
+
+    def stop(self):
+        self._stop_event.set()
+        self.capture.stop()
+
+    def join_all(self, timeout=2.0):
+        self.join(timeout)
+        self.capture.join(timeout)
+        self.video_capture.release()
+        if self.liveness is not None:
+            self.liveness.close()
+
+
+def print_stats(workers, batcher, elapsed, previous, pool=None):
+    print(f"\n📈 Sau {elapsed:.0f}s:")
+    print(f"   {'camera':<16} | {'FPS':>6} | {'bỏ qua':>7} | {'hàng đợi':>8} | "
+          f"{'gửi':>5} | {'nhận ra':>7} | {'chặn liveness':>13}")
+    for worker in workers:
+        frames_before, time_before = previous.get(worker.camera_id, (0, 0.0))
+        fps = (worker.frames - frames_before) / max(1e-6, elapsed - time_before)
+        previous[worker.camera_id] = (worker.frames, elapsed)
+        print(f"   {worker.camera_id:<16} | {fps:>6.1f} | {worker.reader.skipped:>7} | "
+              f"{batcher.queue_depth(worker.camera_id):>8} | {worker.submitted:>5} | "
+              f"{worker.identified:>7} | {worker.rejected_liveness:>13}")
+    if batcher.batches:
+        latency = np.percentile(np.asarray(batcher.latencies_ms), [50, 99])
+        print(f"   🧠 {batcher.batches} batch, trung bình {batcher.crops / batcher.batches:.1f} "
+              f"crop/batch, latency hàng đợi p50 {latency[0]:.0f}ms / p99 {latency[1]:.0f}ms")
+    if pool is not None:
+        print(f"   ⚙️ {pool.workers} process, việc đã xong mỗi process: {pool.completed}, "
+              f"đang chờ {pool.pending}")
+
+
+def run(sources, duration=None, liveness=True, max_batch=MAX_BATCH,
+        batch_wait_ms=BATCH_WAIT_MS, fake_fps=None, stats_interval=STATS_INTERVAL,
+        workers=0):
+    from enrollment import load_embedding_model
+    from face_recognition_with_blink import (
+        load_known_faces, build_gallery, start_gallery_watcher, recognize_face,
+        log_attendance, close_attendance_store, WATCH_KNOWN_FACES
+    )
+    from face_watcher import LiveGallery
+
+    known_embeddings = load_known_faces()
+    if not known_embeddings:
+        print("❌ Không có khuôn mặt nào đã biết")
+        return 1
+    gallery = LiveGallery(build_gallery(known_embeddings))
+    watcher = start_gallery_watcher(gallery) if WATCH_KNOWN_FACES else None
+
+    if liveness:
+        from advanced_liveness_module import AdvancedLivenessDetector, MEDIAPIPE_AVAILABLE
+        if not MEDIAPIPE_AVAILABLE:
+            print("⚠️ Không có MediaPipe -> chạy KHÔNG CÓ liveness")
+            liveness = False
+
+    pool = None
+    if workers:
+        from inference_pool import (
+            InferencePool, PoolEmbeddingModel, PoolLivenessDetector, default_liveness_factory
+        )
+        print(f"\n🧠 Đang khởi động {workers} process inference (mỗi process 1 model)...")
+        pool = InferencePool(workers=workers,
+                             liveness_factory=default_liveness_factory if liveness else None)
+        pool.start()
+        model = PoolEmbeddingModel(pool)
+    else:
+        print("\n🧠 Đang nạp model nhận diện (dùng chung cho mọi camera)...")
+        model = load_embedding_model()
+    batcher = InferenceBatcher(model, lambda e: recognize_face(e, gallery.current),
+                               max_batch=max_batch, max_wait_ms=batch_wait_ms)
+    batcher.start()
+
+    print_lock = threading.Lock()
+
+    def on_identified(camera_id, name, distance):
+        with print_lock:
+            print(f"✅ [{camera_id}] {name} (distance {distance:.2f})")
+            log_attendance(name)
+
+    cameras = []
+    for index, source in enumerate(sources):
+        video_capture = open_source(source, fake_fps)
+        if not video_capture.isOpened():
+            print(f"❌ Không mở được nguồn: {source}")
+            continue
+        label = os.path.basename(source[len("fake:"):] if source.startswith("fake:") else source)
+        camera_id = f"cam{index}:{label}"[:16]
+        state = None
+        if liveness:
+            detector = (PoolLivenessDetector(pool, camera_id) if pool is not None
+                        else AdvancedLivenessDetector())
+            state = BlinkLivenessState(detector)
+        cameras.append(CameraWorker(camera_id, video_capture, batcher, on_identified,
+                                    liveness=state))
+    if not cameras:
+        batcher.stop()
+        if pool is not None:
+            pool.stop()
+        return 1
+
+    print(f"\n🎥 Đang phục vụ {len(cameras)} camera (Ctrl+C để dừng)")
+    for worker in cameras:
+        worker.start()
+
+    start = time.monotonic()
+    previous = {}
+    next_stats = stats_interval
+    try:
+        while any(worker.is_alive() for worker in cameras):
+            time.sleep(min(stats_interval, 0.5))
+            elapsed = time.monotonic() - start
+            if elapsed >= next_stats:
+                next_stats += stats_interval
+                with print_lock:
+                    print_stats(cameras, batcher, elapsed, previous, pool)
+            if duration and elapsed >= duration:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for worker in cameras:
+            worker.stop()
+        for worker in cameras:
+            worker.join_all()
+        batcher.stop()
+        batcher.join(timeout=2.0)
+        if watcher is not None:
+            watcher.stop()
+        print_stats(cameras, batcher, time.monotonic() - start, {}, pool)
+        if pool is not None:
+            pool.stop()
+        close_attendance_store()
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Phục vụ nhiều camera bằng 1 model dùng chung")
+    parser.add_argument('sources', nargs='+',
+                        help="Chỉ số webcam (0, 1...), file/URL video, hoặc fake:<file>")
+    parser.add_argument('--duration', type=float, default=None, help="Dừng sau N giây")
+    parser.add_argument('--no-liveness', action='store_true', help="Tắt liveness (test)")
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH)
+    parser.add_argument('--batch-wait-ms', type=float, default=BATCH_WAIT_MS)
+    parser.add_argument('--fake-fps', type=float, default=None,
+                        help="FPS của camera giả (mặc định theo file)")
+    parser.add_argument('--stats-interval', type=float, default=STATS_INTERVAL)
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Số process inference (0 = 1 model trong process này)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    raise SystemExit(run(args.sources, duration=args.duration,
+                         liveness=not args.no_liveness, max_batch=args.max_batch,
+                         batch_wait_ms=args.batch_wait_ms, fake_fps=args.fake_fps,
+                         stats_interval=args.stats_interval, workers=args.workers))
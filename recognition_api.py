@@ -0,0 +1,348 @@
+"""
+Recognition API - Dịch vụ nhận diện qua HTTP cục bộ (asyncio, chỉ dùng thư viện chuẩn)
+- POST /recognize        body = ảnh JPEG/PNG cả frame -> Haar detect + nhận diện
+- POST /recognize/crop   body = ảnh crop khuôn mặt (bỏ qua detect)
+  ?log=1 -> ghi điểm danh cho người nhận ra được, chỉ khi server bật API_ALLOW_LOG
+  (--allow-log): texture 1 ảnh không chặn được ảnh in, client phải tự làm
+  thử thách liveness (kiosk tin cậy) -> mặc định tắt, ?log=1 bị từ chối 403
+- GET  /health           trạng thái, kích thước gallery, model key
+- GET  /metrics          latency p50/p95/p99 theo endpoint, kích thước batch
+- Yêu cầu đồng thời được gom batch (InferenceBatcher): 1 lần forward cho
+  nhiều client trong ngân sách BATCH_WAIT_MS
+- Liveness trên 1 ảnh: phân tích texture vùng mặt (TextureAnalyzer), chỉ là tín
+  hiệu phụ trả về cho client, không đủ để tự ghi điểm danh
+
+Dùng từ dòng lệnh:
+    python recognition_api.py [--host 0.0.0.0] [--port 8765]
+    curl --data-binary @frame.jpg -H "Content-Type: image/jpeg" \\
+         http://127.0.0.1:8765/recognize
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+import cv2
+import numpy as np
+
+from enrollment import MODEL_KEY
+from face_crops import extract_face_crops
+from multi_camera_server import InferenceBatcher
+
+
+API_HOST = "127.0.0.1"
+API_PORT = 8765
+MAX_BODY_BYTES = 10 * 1024 * 1024
+MAX_BATCH = 32
+BATCH_WAIT_MS = 5  # Ngân sách chờ gom batch
+DECODE_WORKERS = 4  # Thread giải mã JPEG + Haar detect
+LATENCY_WINDOW = 2000
+ENDPOINTS = ('/recognize', '/recognize/crop', '/health', '/metrics')
+API_ALLOW_LOG = False  # True / --allow-log: cho phép ?log=1 (chỉ với client đã tự kiểm tra liveness)
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+                405: "Method Not Allowed", 411: "Length Required",
+                413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _set_result(future, result):
+    """Chạy trên event loop: client đã ngắt (task bị hủy) -> future đã xong, bỏ qua"""
+    if not future.done():
+        future.set_result(result)
+
+
+class RecognitionService:
+    """
+    Model + gallery dùng chung; mọi lời gọi embed đi qua 1 batcher
+    log_fn: hàm ghi điểm danh, None = không cho ?log=1 (xem API_ALLOW_LOG)
+    """
+
+    def __init__(self, model, gallery, match_fn, log_fn=None,
+                 max_batch=MAX_BATCH, batch_wait_ms=BATCH_WAIT_MS):
+        from advanced_liveness_module import TextureAnalyzer
+        from face_recognition_with_blink import HAAR_CASCADE_PATH
+
+        self.model = model
+        self.gallery = gallery
+        self.log_fn = log_fn
+        self.batcher = InferenceBatcher(model, match_fn, max_batch=max_batch,
+                                        max_wait_ms=batch_wait_ms)
+        self.executor = ThreadPoolExecutor(max_workers=DECODE_WORKERS,
+                                           thread_name_prefix="decode")
+        # CascadeClassifier / TextureAnalyzer (buffer riêng) không dùng chung giữa thread
+        self._local = threading.local()
+        self._haar_path = HAAR_CASCADE_PATH
+        self._texture_cls = TextureAnalyzer
+
+        self.started = time.time()
+        self.latencies_ms = {}
+        self.requests = 0
+        self.errors = 0
+
+    def start(self):
+        self.batcher.start()
+
+    def stop(self):
+        self.batcher.stop()
+        self.batcher.join(timeout=2.0)
+        self.executor.shutdown(wait=False)
+
+    def _thread_state(self):
+        state = self._local
+        if not hasattr(state, 'cascade'):
+            state.cascade = cv2.CascadeClassifier(self._haar_path)
+            state.texture = self._texture_cls()
+        return state
+
+    def _prepare(self, body, is_crop):
+        """Giải mã ảnh, detect (nếu cần), cắt crop và chấm texture (chạy trong thread)"""
+        from face_recognition_with_blink import detect_faces
+
+        image = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise HttpError(400, "Không giải mã được ảnh")
+        state = self._thread_state()
+        if is_crop:
+            boxes = [(0, 0, image.shape[1], image.shape[0])]
+            crops = [image]
+        else:
+            boxes = [tuple(int(v) for v in box) for box in detect_faces(state.cascade, image)]
+            crops = extract_face_crops(image, boxes)
+        textures = [state.texture.check(image, box) for box in boxes]
+        return boxes, crops, textures
+
+    async def recognize(self, body, is_crop=False, log=False):
+        loop = asyncio.get_running_loop()
+        boxes, crops, textures = await loop.run_in_executor(
+            self.executor, self._prepare, body, is_crop
+        )
+        if not crops:
+            return {'faces': []}
+
+        future = loop.create_future()
+
+        def deliver(results):
+            loop.call_soon_threadsafe(_set_result, future, results)
+
+        self.batcher.submit("api", crops, deliver)
+        results = await future
+        if len(results) != len(crops):
+            raise HttpError(500, "Lỗi khi embed")
+
+        faces = []
+        for box, (name, distance), (texture_ok, variance, high_freq) in zip(
+                boxes, results, textures):
+            recognized = name != "Unknown"
+            face = {
+                'box': list(box),
+                'name': name,
+                'distance': round(float(distance), 4) if np.isfinite(distance) else None,
+                'recognized': recognized,
+                'liveness': {
+                    'method': 'texture',
+                    'live': bool(texture_ok),
+                    'variance': round(float(variance), 2),
+                    'high_freq': round(float(high_freq), 2),
+                },
+            }
+            if log and recognized and texture_ok and self.log_fn is not None:
+                face['attendance_logged'] = bool(
+                    await loop.run_in_executor(self.executor, self.log_fn, name)
+                )
+            faces.append(face)
+        return {'faces': faces}
+
+    def record_latency(self, path, ms):
+        """Gom theo ENDPOINTS (path lạ -> 'other'): số key cố định dù bị quét path"""
+        endpoint = path if path in ENDPOINTS else "other"
+        self.latencies_ms.setdefault(endpoint, deque(maxlen=LATENCY_WINDOW)).append(ms)
+
+    def health(self):
+        return {
+            'status': 'ok',
+            'uptime_s': round(time.time() - self.started, 1),
+            'gallery_size': len(self.gallery),
+            'model': MODEL_KEY,
+            'queue_depth': self.batcher.queue_depth("api"),
+        }
+
+    def metrics(self):
+        endpoints = {}
+        for endpoint, values in self.latencies_ms.items():
+            arr = np.asarray(values)
+            p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+            endpoints[endpoint] = {'count': len(arr), 'p50_ms': round(p50, 2),
+                                   'p95_ms': round(p95, 2), 'p99_ms': round(p99, 2)}
+        batcher = self.batcher
+        model_p50, model_p99 = (self.model.latency_percentiles()
+                                if hasattr(self.model, 'latency_percentiles') else (None, None))
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'endpoints': endpoints,
+            'batches': batcher.batches,
+            'mean_batch_size': round(batcher.crops / batcher.batches, 2) if batcher.batches else 0,
+            'model_p50_ms': model_p50,
+            'model_p99_ms': model_p99,
+        }
+
+
+async def read_request(reader):
+    """Đọc 1 request HTTP/1.1. Returns: (method, path, query, headers, body) hoặc None"""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    except asyncio.LimitOverrunError:
+        raise HttpError(400, "Header quá dài")
+
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, _ = lines[0].split(' ', 2)
+    except ValueError:
+        raise HttpError(400, "Request line không hợp lệ")
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            key, value = line.split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+
+    if 'transfer-encoding' in headers:
+        raise HttpError(411, "Không hỗ trợ Transfer-Encoding, gửi kèm Content-Length")
+    raw_length = headers.get('content-length', '')
+    if raw_length and not (raw_length.isascii() and raw_length.isdigit()):
+        raise HttpError(400, "Content-Length không hợp lệ")
+    length = int(raw_length) if raw_length else 0
+    if length > MAX_BODY_BYTES:
+        raise HttpError(413, "Ảnh quá lớn")
+    body = await reader.readexactly(length) if length else b''
+    url = urlsplit(target)
+    return method.upper(), url.path, parse_qs(url.query), headers, body
+
+
+def write_response(writer, status, payload, keep_alive=True):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    head = (f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    writer.write(head.encode('latin-1') + body)
+
+
+async def dispatch(service, method, path, query, body):
+    if path in ('/recognize', '/recognize/crop'):
+        if method != 'POST':
+            raise HttpError(405, "Dùng POST")
+        if not body:
+            raise HttpError(400, "Thiếu ảnh trong body")
+        log = query.get('log', ['0'])[0] in ('1', 'true')
+        if log and service.log_fn is None:
+            raise HttpError(403, "Ghi điểm danh qua API đang tắt (bật bằng --allow-log)")
+        return await service.recognize(body, is_crop=path.endswith('/crop'), log=log)
+    if path == '/health':
+        return service.health()
+    if path == '/metrics':
+        return service.metrics()
+    raise HttpError(404, f"Không có endpoint {path}")
+
+
+def make_handler(service):
+    async def handle(reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HttpError as e:
+                    write_response(writer, e.status, {'error': str(e)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, query, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+
+                start = time.perf_counter()
+                service.requests += 1
+                try:
+                    status, payload = 200, await dispatch(service, method, path, query, body)
+                except HttpError as e:
+                    status, payload = e.status, {'error': str(e)}
+                except Exception as e:
+                    status, payload = 500, {'error': str(e)}
+                if status != 200:
+                    service.errors += 1
+                service.record_latency(path, (time.perf_counter() - start) * 1000)
+
+                write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    return handle
+
+
+async def serve(service, host=API_HOST, port=API_PORT):
+    service.start()
+    server = await asyncio.start_server(make_handler(service), host, port)
+    print(f"🌐 Recognition API: http://{host}:{port} (/recognize, /health, /metrics)")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.stop()
+
+
+def build_service(max_batch=MAX_BATCH, batch_wait_ms=BATCH_WAIT_MS, allow_log=API_ALLOW_LOG):
+    from enrollment import load_embedding_model
+    from face_recognition_with_blink import (
+        load_known_faces, build_gallery, start_gallery_watcher, recognize_face,
+        log_attendance, WATCH_KNOWN_FACES
+    )
+    from face_watcher import LiveGallery
+
+    known_embeddings = load_known_faces()
+    if not known_embeddings:
+        raise SystemExit("❌ Không có khuôn mặt nào đã biết")
+    gallery = LiveGallery(build_gallery(known_embeddings))
+    if WATCH_KNOWN_FACES:
+        start_gallery_watcher(gallery)  # Thread daemon, dừng cùng process
+    model = load_embedding_model()
+    return RecognitionService(model, gallery, lambda e: recognize_face(e, gallery.current),
+                              log_fn=log_attendance if allow_log else None,
+                              max_batch=max_batch,
+                              batch_wait_ms=batch_wait_ms)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dịch vụ nhận diện qua HTTP")
+    parser.add_argument('--host', default=API_HOST)
+    parser.add_argument('--port', type=int, default=API_PORT)
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH)
+    parser.add_argument('--batch-wait-ms', type=float, default=BATCH_WAIT_MS)
+    parser.add_argument('--allow-log', action='store_true', default=API_ALLOW_LOG,
+                        help="Cho phép ?log=1 (client đã tự kiểm tra liveness)")
+    args = parser.parse_args()
+
+    if args.allow_log:
+        print("⚠️ ?log=1 đang bật: liveness của API chỉ là texture 1 ảnh, "
+              "chỉ dùng với client đã tự kiểm tra liveness")
+    service = build_service(args.max_batch, args.batch_wait_ms, args.allow_log)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        print("\n✅ Đã dừng API")
+    finally:
+        from face_recognition_with_blink import close_attendance_store
+        close_attendance_store()
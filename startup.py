@@ -0,0 +1,163 @@
+"""
+Startup - Khởi động theo giai đoạn: camera/preview có ngay, phần nặng nạp song song ở nền
+- Startup.start(name, fn): chạy fn trong thread riêng (model TF, FaceMesh, gallery...)
+- Startup.phase(name): đo 1 giai đoạn chạy tuần tự ở thread chính
+- Startup.mark(name): mốc thời gian (frame đầu tiên, sẵn sàng...)
+- status_text(): chuỗi trạng thái ngắn để vẽ lên preview
+- Báo cáo thời gian từng giai đoạn (tính từ lúc process bắt đầu import),
+  in ra và ghi JSON để theo dõi regression thời gian khởi động
+
+Dùng từ dòng lệnh:
+    python startup.py startup_report.json    # in lại báo cáo đã ghi
+"""
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+STARTUP_REPORT_FILE = "startup_report.json"
+
+
+class StartupTask(threading.Thread):
+    """1 bước khởi tạo chạy nền; giữ kết quả hoặc lỗi"""
+
+    def __init__(self, name, fn):
+        super().__init__(name=f"startup-{name}", daemon=True)
+        self.task_name = name
+        self.fn = fn
+        self.result = None
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._done = threading.Event()
+
+    def run(self):
+        self.started_at = time.perf_counter()
+        try:
+            self.result = self.fn()
+        except Exception as e:
+            self.error = e
+            print(f"❌ Khởi tạo {self.task_name} thất bại: {e}")
+        finally:
+            self.finished_at = time.perf_counter()
+            self._done.set()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def ready(self):
+        return self.done and self.error is None
+
+    def wait(self, timeout=None):
+        """Chờ xong. Returns: kết quả (raise lại lỗi của task nếu có)"""
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"{self.task_name} chưa khởi tạo xong")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class Startup:
+    """t0: thời điểm perf_counter() coi là lúc bắt đầu (mặc định: lúc tạo Startup)"""
+
+    def __init__(self, t0=None):
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self.tasks = {}
+        self.phases = []  # (tên, bắt đầu, kết thúc, thread)
+        self.marks = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, start, end, thread=None):
+        thread = thread or threading.current_thread().name
+        with self._lock:
+            self.phases.append((name, start, end, thread))
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter())
+
+    def mark(self, name):
+        """Ghi mốc lần đầu tiên (gọi lại không ghi đè)"""
+        with self._lock:
+            self.marks.setdefault(name, time.perf_counter())
+
+    def start(self, name, fn):
+        task = StartupTask(name, fn)
+        self.tasks[name] = task
+        task.start()
+        return task
+
+    def ready(self, *names):
+        return all(self.tasks[name].ready for name in names if name in self.tasks)
+
+    @property
+    def all_done(self):
+        return all(task.done for task in self.tasks.values())
+
+    def result(self, name, timeout=None):
+        return self.tasks[name].wait(timeout)
+
+    def status_text(self):
+        """Ví dụ: 'model ... | gallery OK | liveness LOI' (ASCII cho cv2.putText)"""
+        parts = []
+        for name, task in self.tasks.items():
+            state = "..." if not task.done else ("OK" if task.error is None else "LOI")
+            parts.append(f"{name} {state}")
+        return " | ".join(parts)
+
+    def report(self):
+        rows = [{'phase': name, 'thread': thread,
+                 'start_s': round(start - self.t0, 3),
+                 'seconds': round(end - start, 3)}
+                for name, start, end, thread in self.phases]
+        for name, task in self.tasks.items():
+            if task.started_at is None:
+                continue
+            end = task.finished_at if task.finished_at is not None else time.perf_counter()
+            rows.append({'phase': name, 'thread': task.name,
+                         'start_s': round(task.started_at - self.t0, 3),
+                         'seconds': round(end - task.started_at, 3),
+                         'ok': task.done and task.error is None})
+        rows.sort(key=lambda row: row['start_s'])
+        return {
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'phases': rows,
+            'marks': {name: round(t - self.t0, 3)
+                      for name, t in sorted(self.marks.items(), key=lambda item: item[1])},
+        }
+
+    def write_report(self, path=STARTUP_REPORT_FILE):
+        report = self.report()
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            print(f"⚠️ Không ghi được báo cáo khởi động: {e}")
+        return report
+
+
+def format_report(report):
+    lines = [f"   {'giai đoạn':<22} {'thread':<18} {'bắt đầu':>9} {'thời gian':>10}"]
+    for row in report['phases']:
+        flag = "" if row.get('ok', True) else "  ❌"
+        lines.append(f"   {row['phase']:<22} {row['thread']:<18} "
+                     f"{row['start_s']:>8.2f}s {row['seconds']:>9.2f}s{flag}")
+    for name, at in report['marks'].items():
+        lines.append(f"   ⏱️ {name}: {at:.2f}s")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(1)
+    with open(sys.argv[1], encoding='utf-8') as f:
+        print(format_report(json.load(f)))
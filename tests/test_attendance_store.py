@@ -0,0 +1,142 @@
+"""
+Ghi điểm danh: khôi phục WAL sau crash, writer_id tự chọn khi nhiều process,
+kiểm tra trùng đúng cả tên và giữa nhiều process ghi chung 1 CSV
+Chạy: python -m pytest tests
+"""
+import multiprocessing
+import time
+from datetime import datetime
+
+import pytest
+
+from attendance_store import AttendanceWriter, CsvAttendanceStore, WAL_COMMIT_MARKER
+
+
+ROWS = ["alice,2024-05-01,08:00:00\n", "bob,2024-05-01,08:00:05\n",
+        "carol,2024-05-01,08:00:09\n"]
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def failing_append(data):
+    raise OSError("đĩa đầy")
+
+
+def test_recover_after_crash_writes_each_event_once(tmp_path):
+    csv_path = str(tmp_path / "attendance.csv")
+    writer = AttendanceWriter(csv_path, "kiosk", fsync=False)
+    writer._append_csv = failing_append  # Crash sau khi ghi WAL, trước khi nối CSV
+    for line in ROWS:
+        assert not writer.submit(line, wait=True, timeout=5)
+    writer.close()
+    wal_path = writer.wal_path
+
+    # alice đã kịp vào CSV (dòng cuối cắt dở), WAL còn 1 batch chưa có marker
+    with open(csv_path, 'w') as f:
+        f.write(ROWS[0] + "bob,2024-05")
+    with open(wal_path, 'a') as f:
+        f.write("dave,2024-05-01,08:01:00\n")
+
+    writer = AttendanceWriter(csv_path, "kiosk", fsync=False)
+    try:
+        assert writer.recovered == len(ROWS)
+        assert read(csv_path).decode() == ''.join(ROWS)
+        assert read(wal_path) == b''
+
+        # Ghi WAL lỗi ngay sau khôi phục -> cắt về vị trí cũ, không được chèn byte NUL
+        def failing_sync(f):
+            raise OSError("đĩa đầy")
+        writer._sync = failing_sync
+        assert not writer.submit("erin,2024-05-01,08:02:00\n", wait=True, timeout=5)
+        assert read(wal_path) == b''
+        del writer._sync
+
+        writer._append_csv = failing_append
+        assert not writer.submit("erin,2024-05-01,08:02:00\n", wait=True, timeout=5)
+        assert read(wal_path) == f"erin,2024-05-01,08:02:00\n{WAL_COMMIT_MARKER} 1\n".encode()
+    finally:
+        del writer._append_csv
+        writer.close()
+    assert read(csv_path).decode() == ''.join(ROWS) + "erin,2024-05-01,08:02:00\n"
+    assert read(wal_path) == b''
+
+
+def test_default_writer_id_picks_next_free_wal(tmp_path):
+    csv_path = str(tmp_path / "attendance.csv")
+    first = AttendanceWriter(csv_path, fsync=False)
+    second = AttendanceWriter(csv_path, fsync=False)
+    try:
+        assert second.wal_path != first.wal_path
+        assert second.writer_id == f"{first.writer_id}.1"
+        with pytest.raises(RuntimeError):
+            AttendanceWriter(csv_path, first.writer_id, fsync=False)
+        assert first.submit(ROWS[0], wait=True, timeout=5)
+        assert second.submit(ROWS[1], wait=True, timeout=5)
+    finally:
+        first.close()
+        second.close()
+    assert read(csv_path).decode() == ROWS[0] + ROWS[1]
+
+
+def check_in_all(csv_path, names, start):
+    """Chạy trong process con: 1 store riêng (WAL riêng) ghi chung 1 CSV"""
+    store = CsvAttendanceStore(csv_path, fsync=False)
+    time.sleep(max(0.0, start - time.time()))  # Các process bắt đầu cùng lúc
+    logged = [name for name in names if store.check_in(name, datetime.now())]
+    store.close()
+    return logged
+
+
+def test_exact_name_match(tmp_path):
+    csv_path = tmp_path / "attendance.csv"
+    now = datetime.now()
+    csv_path.write_text(f"Anh,{now:%Y-%m-%d},07:59:00\n")
+    store = CsvAttendanceStore(str(csv_path), "kiosk", fsync=False)
+    try:
+        assert store.has_checked_in("Anh")
+        assert not store.has_checked_in("An")
+        assert store.check_in("An", now)
+        assert not store.check_in("Anh", now)
+        assert not store.check_in("An", now)
+        assert store.flush()
+    finally:
+        store.close()
+    names = [line.split(',')[0] for line in csv_path.read_text().splitlines()]
+    assert names == ["Anh", "An"]
+
+
+def test_other_process_check_in_is_seen(tmp_path):
+    csv_path = str(tmp_path / "attendance.csv")
+    first = CsvAttendanceStore(csv_path, "kiosk1", fsync=False)
+    second = CsvAttendanceStore(csv_path, "kiosk2", fsync=False)
+    try:
+        assert first.check_in("alice", datetime.now())
+        assert first.flush()
+        assert second.has_checked_in("alice")
+        assert not second.check_in("alice", datetime.now())
+
+        # Cả 2 cùng chưa thấy bob -> cùng nhận, writer bỏ dòng trùng dưới khóa file
+        assert first.check_in("bob", datetime.now())
+        assert second.check_in("bob", datetime.now())
+        assert first.flush() and second.flush()
+    finally:
+        first.close()
+        second.close()
+    names = [line.split(',')[0] for line in open(csv_path).read().splitlines()]
+    assert sorted(names) == ["alice", "bob"]
+
+
+def test_concurrent_processes_write_one_row_per_person(tmp_path):
+    csv_path = str(tmp_path / "attendance.csv")
+    names = [f"student{i:02d}" for i in range(20)]
+    start = time.time() + 1.0
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(3) as pool:
+        results = pool.starmap(check_in_all, [(csv_path, names, start)] * 3)
+
+    rows = [line.split(',')[0] for line in open(csv_path).read().splitlines()]
+    assert sorted(rows) == names
+    assert sum(len(logged) for logged in results) >= len(names)
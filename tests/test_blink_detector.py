@@ -0,0 +1,54 @@
+"""
+BlinkDetector trên chuỗi EAR tổng hợp (không cần MediaPipe / webcam)
+Chạy: python -m pytest tests
+"""
+from advanced_liveness_module import BlinkDetector, BLINK_MAX_CLOSED, BLINK_WINDOW
+
+
+OPEN = 0.30
+CLOSED = 0.10
+HALF = 0.23  # Giữa 2 ngưỡng: đang chuyển, bị bỏ qua
+
+
+def feed(values, detector=None):
+    """Returns: chỉ số các frame mà update() báo 1 lần nháy"""
+    detector = detector or BlinkDetector()
+    return [i for i, ear in enumerate(values) if detector.update(ear)]
+
+
+def test_real_blink_is_reported_once_when_eye_reopens():
+    values = [OPEN] * 5 + [CLOSED] * 3 + [OPEN] * 5
+    assert feed(values) == [8]
+
+
+def test_two_blinks_are_counted_separately():
+    detector = BlinkDetector()
+    values = [OPEN] * 4 + [CLOSED] * 2 + [OPEN] * 4 + [CLOSED] * 3 + [OPEN] * 2
+    assert feed(values, detector) == [6, 13]
+    assert detector.blinks == 2
+
+
+def test_single_closed_frame_is_noise():
+    assert feed([OPEN] * 5 + [CLOSED] + [OPEN] * 5) == []
+
+
+def test_eye_held_closed_is_not_a_blink():
+    closed = BLINK_MAX_CLOSED + 2
+    assert closed < BLINK_WINDOW
+    assert feed([OPEN] * 3 + [CLOSED] * closed + [OPEN] * 3) == []
+
+
+def test_eye_closed_from_start_is_not_a_blink():
+    """Ảnh in / người nhắm mắt từ đầu: chưa thấy mắt mở trước khi nhắm"""
+    assert feed([CLOSED] * 4 + [OPEN] * 3) == []
+
+
+def test_transition_frames_are_ignored():
+    assert feed([OPEN] * 3 + [HALF, CLOSED, HALF, CLOSED, HALF] + [OPEN]) == [8]
+
+
+def test_reset_breaks_the_sequence():
+    detector = BlinkDetector()
+    assert feed([OPEN] * 3 + [CLOSED] * 3, detector) == []
+    detector.reset()  # Mất khuôn mặt giữa chừng
+    assert feed([OPEN] * 3, detector) == []
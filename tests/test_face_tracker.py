@@ -0,0 +1,79 @@
+"""
+Cờ embedding_pending của track khi việc nhận diện chạy ở thread riêng
+Chạy: python -m pytest tests
+"""
+import numpy as np
+
+from face_tracker import IoUTracker, EmbedScheduler
+from frame_pipeline import RecognitionWorker
+
+
+THRESHOLD = 8.0
+INTERVAL = 2.0
+BOX = (100, 100, 80, 80)
+
+
+def select_one(tracker, scheduler, now, frame_index=0):
+    matched, _ = tracker.update([BOX], frame_index)
+    return scheduler.select(matched, now)
+
+
+def test_identity_set_before_commit_does_not_freeze_track():
+    """Worker xong (set_identity) trước khi thread hiển thị gọi commit"""
+    tracker = IoUTracker()
+    scheduler = EmbedScheduler(THRESHOLD, interval=INTERVAL)
+    worker = RecognitionWorker(
+        lambda frame, selected: [track.set_identity("alice", 1.0, 0.0)
+                                 for track, _, _ in selected]
+    )
+    worker.start()
+    try:
+        selected = select_one(tracker, scheduler, now=0.0)
+        assert [reason for _, _, reason in selected] == ['new']
+
+        scheduler.mark_pending(selected)
+        assert worker.submit(None, selected)
+        worker.jobs.join()  # Việc đã xong trước khi commit chạy
+        scheduler.commit(selected)
+
+        track = selected[0][0]
+        assert not track.embedding_pending
+        assert track.name == "alice"
+        assert scheduler.reason(track, now=INTERVAL) == 'interval'
+    finally:
+        worker.stop()
+        worker.join(timeout=2.0)
+
+
+def test_pending_track_is_skipped_and_released_when_rejected():
+    tracker = IoUTracker()
+    scheduler = EmbedScheduler(THRESHOLD, interval=INTERVAL)
+    selected = select_one(tracker, scheduler, now=0.0)
+
+    scheduler.mark_pending(selected)
+    assert select_one(tracker, scheduler, now=0.1, frame_index=1) == []
+
+    scheduler.release(selected)  # submit bị từ chối (hàng đợi đầy)
+    assert [reason for _, _, reason in select_one(tracker, scheduler, now=0.2,
+                                                  frame_index=2)] == ['new']
+
+
+def test_recognize_tracks_clears_pending_when_embed_fails():
+    import face_recognition_with_blink as app
+
+    class FailingModel:
+        def embed(self, crops):
+            raise RuntimeError("embed lỗi")
+
+    tracker = IoUTracker()
+    scheduler = EmbedScheduler(THRESHOLD, interval=INTERVAL)
+    selected = select_one(tracker, scheduler, now=0.0)
+    scheduler.mark_pending(selected)
+
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    try:
+        app.recognize_tracks(FailingModel(), None, frame, selected, log=False)
+    except RuntimeError:
+        pass
+    assert not selected[0][0].embedding_pending
+    assert scheduler.reason(selected[0][0], now=0.1) == 'new'
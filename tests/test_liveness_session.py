@@ -0,0 +1,114 @@
+"""
+LivenessSession phát lại từ chuỗi FrameAnalysis tổng hợp (không cần MediaPipe / webcam):
+đạt, hết giờ, người dùng hủy, texture giả
+Chạy: python -m pytest tests
+"""
+import random
+
+from advanced_liveness_module import (AdvancedLivenessDetector, FrameAnalysis, LivenessSession,
+                                      NO_FACE, replay_liveness)
+
+
+OPEN = 0.30
+CLOSED = 0.10
+FPS = 10
+BOX = (100, 80, 120, 150)
+
+
+def position(nose_x=0.5, nose_y=0.5):
+    return {'nose': (nose_x, nose_y), 'face_width': 0.2, 'face_height': 0.3}
+
+
+def face(ear=OPEN, pos=None, box=BOX):
+    return FrameAnalysis(True, ear, ear, ear, False, pos or position(), box)
+
+
+class FakeDetector:
+    """Frame chính là FrameAnalysis; texture cố định (ảnh thật / ảnh in)"""
+    TEXTURE_EVERY_N = 3
+    MOVEMENT_THRESHOLD = 0.15
+    check_head_movement = AdvancedLivenessDetector.check_head_movement
+
+    def __init__(self, texture_ok=True):
+        self.texture_ok = texture_ok
+
+    def analyze_frame(self, frame):
+        return frame
+
+    def detect_texture_quality(self, frame, face_box):
+        return self.texture_ok, 500.0 if self.texture_ok else 10.0, 0
+
+
+def clip(analyses, start=0.0):
+    """[(frame, ts)] cách nhau 1/FPS giây"""
+    return [(a, start + i / FPS) for i, a in enumerate(analyses)]
+
+
+def blink_session(detector=None, **kwargs):
+    return LivenessSession(detector or FakeDetector(), 'blink', prepare_time=0.5,
+                           rng=random.Random(0), **kwargs)
+
+
+BLINK = [face()] * 10 + [face(CLOSED)] * 3 + [face()] * 2
+
+
+def test_blink_passes():
+    session = blink_session()
+    result = replay_liveness(session, clip(BLINK))
+    assert result.passed
+    assert result.message == "blink challenge passed"
+    assert session.face_box == BOX
+
+
+def test_blink_with_bad_texture_fails():
+    result = replay_liveness(blink_session(FakeDetector(texture_ok=False)), clip(BLINK))
+    assert not result.passed
+    assert result.message == "Texture không tự nhiên"
+
+
+def test_no_blink_times_out():
+    session = blink_session(timeout=2.0)
+    frames = clip([face()] * 40)
+    result = replay_liveness(session, frames)
+    assert not result.passed
+    assert result.message == "Timeout - blink challenge failed"
+    # Hết giờ tính từ lúc bắt đầu thử thách, không tính thời gian chuẩn bị
+    assert session.last_ts - session.challenge_started_at >= 2.0
+    assert session.last_ts < frames[-1][1]
+
+
+def test_lost_face_resets_blink():
+    """Mất mặt giữa lúc nhắm -> chuỗi nháy bị bỏ, không tính"""
+    frames = [face()] * 10 + [face(CLOSED)] * 2 + [NO_FACE] + [face(CLOSED)] + [face()] * 3
+    result = replay_liveness(blink_session(), clip(frames))
+    assert not result.passed
+    assert result.message == "Hết frame trước khi có kết quả"
+
+
+def test_cancel_stops_session():
+    session = blink_session()
+    for frame, ts in clip([face()] * 8):
+        assert session.feed(frame, ts) is None
+    result = session.cancel()
+    assert not result.passed
+    assert result.message == "Người dùng hủy"
+    # Đã xong: frame sau không đổi kết quả
+    assert session.feed(face(CLOSED), 10.0) is result
+
+
+def test_head_movement_passes_after_required_frames():
+    session = LivenessSession(FakeDetector(), 'head_movement', 'left', prepare_time=0.5,
+                              required_frames=3)
+    turned = face(pos=position(nose_x=0.45))  # 0.05 / 0.2 = 0.25 > ngưỡng
+    frames = clip([face()] * 6 + [turned] * 2 + [face()] + [turned] * 3)
+    results = [session.feed(frame, ts) for frame, ts in frames]
+    assert results[:-1] == [None] * (len(frames) - 1)
+    assert results[-1].passed
+    assert session.initial_position == position()
+
+
+def test_head_movement_wrong_direction_fails():
+    session = LivenessSession(FakeDetector(), 'head_movement', 'right', prepare_time=0.5)
+    turned = face(pos=position(nose_x=0.45))
+    result = replay_liveness(session, clip([face()] * 6 + [turned] * 10))
+    assert not result.passed